@@ -1,33 +1,28 @@
 import requests
-import tweepy
+import sys
 import random
 import json
 import logging
-from io import BytesIO
 import os
 import http.client 
 import html 
 import pytz
 from datetime import datetime
-from apscheduler.schedulers.blocking import BlockingScheduler
-from apscheduler.jobstores.memory import MemoryJobStore
-from flask import Flask
-from threading import Thread
 from pytz import timezone
 # Optional imports
 # from apscheduler.schedulers.background import BackgroundScheduler
-from random_word import RandomWords
 from apscheduler.triggers.interval import IntervalTrigger
 from apscheduler.triggers.cron import CronTrigger
+import http_session
+import movie_catalog
+import quota
+import country_catalog
+import staging
+import media
+import word_pool
+import composer
 
 
-# Twitter credentials
-bearer_token = os.getenv('TWITTER_BEARER_TOKEN')
-api_key = os.getenv('TWITTER_API_KEY')
-api_key_secret = os.getenv('TWITTER_API_KEY_SECRET')
-access_token = os.getenv('TWITTER_ACCESS_TOKEN')
-access_token_secret = os.getenv('TWITTER_ACCESS_TOKEN_SECRET')
-
 # Weather API credentials
 weather_api_key = os.getenv('WEATHER_API_KEY')
 # OpenExchangeRates API credentials
@@ -45,73 +40,104 @@ edamam_app_key = os.getenv('EDAMAM_APP_KEY')
 tmdb_api_key = os.getenv('TMDB_API_KEY')
 omdb_api_key = os.getenv('OMDB_API_KEY')  # Import OMDb API key from environment
 
-# Authenticate to Twitter using client 
-client = tweepy.Client(
-    bearer_token=bearer_token,
-    consumer_key=api_key,
-    consumer_secret=api_key_secret,
-    access_token=access_token,
-    access_token_secret=access_token_secret
-)
-
-#authenticate to tweeter using API
-auth = tweepy.OAuth1UserHandler(
-    api_key, api_key_secret, access_token, access_token_secret
-)
-api = tweepy.API(auth)
-
- # Fetch weather data from Meteosource API
+# Overall time budget for the three morning-tweet fetches, in seconds
+MORNING_TWEET_DEADLINE = 20
+
+
+WEATHERAPI_URL = f'http://api.weatherapi.com/v1/current.json?key={weather_api_key}&q=Nairobi'
+EXCHANGE_URL = f'https://openexchangerates.org/api/latest.json?app_id={openexchangerates_api_key}'
+
+
+# Current temperature from the Meteosource API
+def temperature_from(data):
+    return data['current']['temperature']
+
+
+# Current weather conditions from WeatherAPI
+def condition_from(data):
+    return data['current']['condition']['text']
+
+
+# USD to KES rate from the OpenExchangeRates API
+def usd_to_kes_from(data):
+    return data['rates']['KES']
+
+
+# Morning tweet field -> (provider, URL, parser, optional). Only what the
+# providers' quotas still cover is fetched; the optional exchange rate is
+# dropped first when its budget runs low
+MORNING_FETCHES = {
+    "temperature": ("meteosource", meteosource_api_url, temperature_from, False),
+    "condition": ("weatherapi", WEATHERAPI_URL, condition_from, False),
+    "usd_to_kes": ("openexchangerates", EXCHANGE_URL, usd_to_kes_from, True),
+}
+
+
+def fetch_morning_field(name):
+    _, url, parse, _ = MORNING_FETCHES[name]
+    response = http_session.get(url)
+    response.raise_for_status()
+    return parse(response.json())
+
+
 def fetch_and_post_tweet():
     try:
-        meteosource_url = f'https://www.meteosource.com/api/v1/free/point?place_id=nairobi&sections=all&timezone=Africa/Nairobi&language=en&units=metric&key={meteosource_api_key}'
-        meteosource_response = requests.get(meteosource_url)
-        weather_data = meteosource_response.json()
-
-        # Fetch current weather conditions from WeatherAPI
-        weatherapi_url = f'http://api.weatherapi.com/v1/current.json?key={weather_api_key}&q=Nairobi'
-        weatherapi_response = requests.get(weatherapi_url)
-        condition_data = weatherapi_response.json()
+        reservations = {name: quota.reserve(provider, optional=optional)
+                        for name, (provider, _, _, optional) in MORNING_FETCHES.items()}
+        try:
+            # Fetch the providers in parallel; missing fields are left out of the tweet
+            results, timings = http_session.fan_out(
+                {name: (lambda name=name: fetch_morning_field(name))
+                 for name in MORNING_FETCHES if reservations[name]},
+                deadline=MORNING_TWEET_DEADLINE)
+        finally:
+            for reservation in reservations.values():
+                if reservation:
+                    reservation.release()
+        logging.info("Morning tweet fetch timings: %s", timings)
+
+        # Post the tweet through the rate-limit governor
+        if staging.submit(staging.PreparedPost(text=morning_tweet(results))):
+            logging.info("Tweet posted successfully.")
+    except Exception as e:
+        logging.error(f"An error occurred: {e}")
 
-        # Fetch exchange rate data from OpenExchangeRates API
-        exchange_url = f'https://openexchangerates.org/api/latest.json?app_id={openexchangerates_api_key}'
-        exchange_response = requests.get(exchange_url)
-        exchange_data = exchange_response.json()
 
-        # Process the fetched data
-        current_temp = weather_data['current']['temperature']
-        condition = condition_data['current']['condition']['text']
-        usd_to_kes = exchange_data['rates']['KES']
+def morning_tweet(results):
+    """Compose the morning tweet from the fetched fields; missing ones are left out."""
+    current_temp = results.get("temperature")
+    condition = results.get("condition")
+    usd_to_kes = results.get("usd_to_kes")
 
-        # Get the current time, day, date
-        kenya_tz = pytz.timezone('Africa/Nairobi')
+    # Get the current time, day, date
+    kenya_tz = pytz.timezone('Africa/Nairobi')
 
 # Get the current date and time in the Kenyan timezone
-        now = datetime.now(kenya_tz)
+    now = datetime.now(kenya_tz)
 
 # Format current time
-        current_time = now.strftime("%I:%M %p")
+    current_time = now.strftime("%I:%M %p")
 
 # Format current day
-        current_day = now.strftime("%A")
+    current_day = now.strftime("%A")
 
 # Format current date with year
-        current_date = now.strftime("%d %B %Y")
-
-        print("Current time:",     current_time)
-        print("Current day:", current_day)
-        print("Current date:", current_date)
-        # Compose the tweet
-        tweet = (
-            f"Good morning, Nairobi. It is {current_time} {current_day} {current_date}. "
-            f"The weather is {condition} and the  temperature is {current_temp}°C. The shilling is trading at "
-            f"{usd_to_kes} KES per 1 USD."
-        )
-
-        # Post the tweet using client.create_tweet()
-        client.create_tweet(text=tweet)
-        logging.info("Tweet posted successfully.")
-    except Exception as e:
-        logging.error(f"An error occurred: {e}")
+    current_date = now.strftime("%d %B %Y")
+
+    print("Current time:",     current_time)
+    print("Current day:", current_day)
+    print("Current date:", current_date)
+    # Compose the tweet
+    tweet = f"Good morning, Nairobi. It is {current_time} {current_day} {current_date}."
+    if condition is not None and current_temp is not None:
+        tweet += f" The weather is {condition} and the  temperature is {current_temp}°C."
+    elif condition is not None:
+        tweet += f" The weather is {condition}."
+    elif current_temp is not None:
+        tweet += f" The temperature is {current_temp}°C."
+    if usd_to_kes is not None:
+        tweet += f" The shilling is trading at {usd_to_kes} KES per 1 USD."
+    return tweet
 
 # Function to get a random lunch recipe
 def get_random_lunch_recipe():
@@ -119,7 +145,12 @@ def get_random_lunch_recipe():
     meal_type = "lunch"
     url = f"https://api.edamam.com/search?q={query}&mealType={meal_type}&app_id={edamam_app_id}&app_key={edamam_app_key}"
 
-    response = requests.get(url)
+    reservation = quota.reserve("edamam")
+    if reservation is None:
+        print("Edamam quota used up, skipping the recipe.")
+        return None
+    with reservation:
+        response = http_session.get(url)
     if response.status_code == 200:
         data = response.json()
         recipes = data.get("hits", [])
@@ -138,194 +169,183 @@ def get_random_lunch_recipe():
 
 # Function to post a recipe tweet
 def post_random_recipe_tweet():
+    import tweepy
     recipe = get_random_lunch_recipe()
     if recipe:
         recipe_name, recipe_ingredients, recipe_image_url = recipe
         tweet_text = f"🍽️ Random Recipe: {recipe_name}\n\nIngredients: {recipe_ingredients}"
         
-        # Ensure the tweet text is within the character limit
-        if len(tweet_text) > 280:
-            max_length = 280 - len(f"🍽️ Lunchtime Recipe: {recipe_name}\n\nIngredients: ") - 3  # 3 for "..."
-            recipe_ingredients = recipe_ingredients[:max_length] + "..."
-            tweet_text = f"🍽️ Lunchtime Recipe: {recipe_name}\n\nIngredients: {recipe_ingredients}"
+        # Ensure the tweet text is within Twitter's weighted character limit
+        if not composer.fits(tweet_text):
+            tweet_text = composer.truncate(f"🍽️ Lunchtime Recipe: {recipe_name}\n\nIngredients: {recipe_ingredients}")
 
         # Download the image
-        image_response = requests.get(recipe_image_url)
-        if image_response.status_code == 200:
-            # Upload the image to Twitter
-            image = BytesIO(image_response.content)
-            media = api.media_upload(filename="recipe.jpg", file=image)
-
-            # Post the tweet with the attached image
-            try:
-                response = client.create_tweet(text=tweet_text, media_ids=[media.media_id_string])
-                print("Tweet posted successfully", response.data)
-            except tweepy.TweepyException as e:
-                print(f"Failed to post tweet: {e}")
-                print(f"Response: {e.response.text}")  # This will print the full error message from the API
-        else:
-            print(f"Error downloading recipe image: {image_response.status_code} - {image_response.reason}")
+        try:
+            image = media.fetch_media(recipe_image_url, "recipe.jpg")
+        except requests.RequestException as e:
+            print(f"Error downloading recipe image: {e}")
+            return
+
+        # Upload the image to Twitter and post the tweet with it attached
+        try:
+            tweet_id = staging.submit(staging.PreparedPost(text=tweet_text, media=[image]))
+            if tweet_id:
+                print("Tweet posted successfully", tweet_id)
+        except tweepy.TweepyException as e:
+            print(f"Failed to post tweet: {e}")
+            print(f"Response: {e.response.text}")  # This will print the full error message from the API
     else:
         print("No recipe to post.")
 
-# Function to fetch popular movies from TMDb
-def fetch_popular_movies(page=1):
-    try:
-        url = f"https://api.themoviedb.org/3/movie/popular?api_key={tmdb_api_key}&language=en-US&page={page}"
-        response = requests.get(url)
-        response.raise_for_status()  # Raise an error if the request failed
-        data = response.json()
-        return data['results']
-    except requests.RequestException as e:
-        print(f"Error fetching popular movies: {e}")
-        return []
-
-# Function to fetch IMDb ID from TMDb
-def fetch_movie_external_ids(tmdb_id):
-    try:
-        url = f"https://api.themoviedb.org/3/movie/{tmdb_id}/external_ids?api_key={tmdb_api_key}"
-        response = requests.get(url)
-        response.raise_for_status()  # Raise an error if the request failed
-        data = response.json()
-        return data.get('imdb_id')
-    except requests.RequestException as e:
-        print(f"Error fetching external IDs: {e}")
+# Claim an unposted movie from the local movie catalog
+def claim_movie():
+    movie = movie_catalog.take()
+    if movie is None:
+        print("No unposted movies in the catalog.")
+    return movie
+
+# Compose a catalog movie's post, without its poster
+def movie_post(movie):
+    imdb_id = movie['imdb_id']
+    # A long plot spills over into a reply instead of getting the post rejected
+    tweet_parts = composer.split([f"🎬 {movie['title']} ({movie['year']})",
+                                  f"Rating: ⭐️ {movie['rating']} / 10",
+                                  f"Plot: {movie['plot']}",
+                                  f"More info: https://www.imdb.com/title/{imdb_id}/"])
+    return staging.PreparedPost(
+        text=tweet_parts[0],
+        replies=tweet_parts[1:],
+        on_posted=lambda: movie_catalog.mark_posted(movie['tmdb_id']))
+
+def movie_poster_url(movie):
+    poster_url = movie['poster']
+    return poster_url if poster_url and poster_url != 'N/A' else None
+
+# Function to prepare a movie tweet from the local movie catalog
+def prepare_movie_tweet():
+    movie = claim_movie()
+    if movie is None:
         return None
+    post = movie_post(movie)
 
-# Function to fetch movie details from OMDb
-def fetch_movie_details(imdb_id):
-    try:
-        url = f"https://www.omdbapi.com/?i={imdb_id}&apikey={omdb_api_key}"  # Use the imported OMDb API key
-        response = requests.get(url)
-        response.raise_for_status()  # Raise an error if the request failed
-        return response.json()
-    except requests.RequestException as e:
-        print(f"Error fetching movie details: {e}")
-        return None
+    # Download the poster image
+    poster_url = movie_poster_url(movie)
+    if poster_url:
+        try:
+            post.media.append(media.fetch_media(poster_url, "poster.jpg"))
+        except requests.RequestException as e:
+            print(f"Error downloading poster image: {e}")
+            movie_catalog.release(movie['tmdb_id'])
+            return None
+    return post
 
 # Function to post a movie tweet
 def post_movie_tweet():
-    popular_movies = fetch_popular_movies()
-    if not popular_movies:
-        print("No popular movies found.")
-        return
-
-    movie = random.choice(popular_movies)
-    tmdb_id = movie['id']
-    imdb_id = fetch_movie_external_ids(tmdb_id)
-
-    if not imdb_id:
-        print(f"Could not fetch IMDb ID for TMDb ID {tmdb_id}.")
-        return
-
-    movie_details = fetch_movie_details(imdb_id)
-
-    if not movie_details:
-        print(f"Could not fetch movie details for IMDb ID {imdb_id}.")
+    import tweepy
+    post = staging.take_or_prepare("post_movie_tweet")
+    if post is None:
         return
+    try:
+        tweet_id = staging.submit(post)
+        if tweet_id:
+            print("Tweet posted successfully", tweet_id)
+    except tweepy.TweepyException as e:
+        print(f"Failed to post tweet: {e}")
+        print(f"Response: {e.response.text}")
 
-    # Correct the conditional statement:
-    genres = movie_details['Genre'].split(', ') if 'Genre' in movie_details else [] 
-    genres = ' '.join([f"#{genre}" for genre in genres])
-    tweet_text = (f"🎬 {movie_details['Title']} ({movie_details['Year']})\n"
-                  f"Rating: ⭐️ {movie_details['imdbRating']} / 10\n"
-                  f"Plot: {movie_details['Plot']}\n"
-                  f"More info: https://www.imdb.com/title/{imdb_id}/")
 
-    # Download the poster image
-    poster_url = movie_details['Poster']
-    if poster_url != 'N/A':
-        try:
-            image_response = requests.get(poster_url)
-            image_response.raise_for_status()  # Raise an error if the request failed
-            image = BytesIO(image_response.content)
-            media = api.media_upload(filename="poster.jpg", file=image)
-
-            # Post the tweet with the attached image
-            response = client.create_tweet(text=tweet_text, media_ids=[media.media_id_string])
-            print("Tweet posted successfully", response.data)
-        except requests.RequestException as e:
-            print(f"Error downloading poster image: {e}")
-        except tweepy.TweepyException as e:
-            print(f"Failed to post tweet: {e}")
-            print(f"Response: {e.response.text}")
-    else:
-        try:
-            post_tweet(tweet_text)
-        except tweepy.TweepyException as e:
-            print(f"Failed to post tweet: {e}")
-            print(f"Response: {e.response.text}")
+#get random fact
+FACT_URL = "https://uselessfacts.jsph.pl/random.json?language=en"
 
+def fact_from(data):
+    return html.unescape(data['text'])
 
-#get random fact
-        
 def get_random_fact():
     try:
-        response = requests.get("https://uselessfacts.jsph.pl/random.json?language=en")
+        response = http_session.get(FACT_URL)
         response.raise_for_status()
-        data = response.json()
-        return html.unescape(data['text'])
+        return fact_from(response.json())
     except Exception as e:
         return f"Error fetching fact: {e}"
 def post_fact():
+    import tweepy
     fact = get_random_fact()
     try:
-        tweet_response = client.create_tweet(text=f"Random Fact: {fact}")
-        print(f"Fact posted successfully: {tweet_response.data['id']}")
+        tweet_id = staging.submit(staging.PreparedPost(text=f"Random Fact: {fact}"))
+        if tweet_id:
+            print(f"Fact posted successfully: {tweet_id}")
     except tweepy.TweepyException as e:
         print(f"Fact: Failed to post fact: {e}")
  #get random pun 
+PUN_URL = "https://v2.jokeapi.dev/joke/Programming?type=single"
+
+def pun_from(data):
+    if data.get('type') == 'single':
+        return html.unescape(data.get('joke', 'No pun available'))
+    else:
+        return "No pun available."
+
 def get_random_pun():
     try:
-        response = requests.get("https://v2.jokeapi.dev/joke/Programming?type=single")
+        response = http_session.get(PUN_URL)
         response.raise_for_status()
-        data = response.json()
-        if data.get('type') == 'single':
-            return html.unescape(data.get('joke', 'No pun available'))
-        else:
-            return "No pun available."
+        return pun_from(response.json())
     except Exception as e:
         return f"Error fetching pun: {e}"
 
 def post_pun():
+    import tweepy
     pun = get_random_pun()
     try:
-        tweet_response = client.create_tweet(text=f"{pun}")
-        print(f"Pun posted successfully: {tweet_response.data['id']}")
+        tweet_id = staging.submit(staging.PreparedPost(text=f"{pun}"))
+        if tweet_id:
+            print(f"Pun posted successfully: {tweet_id}")
     except tweepy.TweepyException as e:
         print(f"Pun: Failed to post pun: {e}")
 
 #Get random trivia and answers
-def post_trivia():
+# Fetch a random trivia question from Open Trivia Database
+TRIVIA_URL = "https://opentdb.com/api.php?amount=1&type=multiple"
+
+def trivia_post_from(trivia_data):
+    question = trivia_data["results"][0]["question"]
+    correct_answer = trivia_data["results"][0]["correct_answer"]
+    incorrect_answers = trivia_data["results"][0]["incorrect_answers"]
+    
+    # Decode HTML entities
+    question = html.unescape(question)
+    correct_answer = html.unescape(correct_answer)
+    incorrect_answers = [html.unescape(ans) for ans in incorrect_answers]
+    
+    # Combine correct and incorrect answers and shuffle
+    answers = [correct_answer] + incorrect_answers
+    random.shuffle(answers)
+    
+    # Compose the tweet with the trivia question and options
+    options = "\n".join(f"{i+1}. {ans}" for i, ans in enumerate(answers))
+    tweet_text = f"🤔 Trivia Time!\n{question}\n{options}\n#Trivia"
+
+    # Compose the comment with the correct answer
+    answer_text = f"📝 Answer: {correct_answer}"
+    return staging.PreparedPost(text=tweet_text, replies=[answer_text])
+
+def prepare_trivia():
     try:
-        # Fetch a random trivia question from Open Trivia Database
-        trivia_url = "https://opentdb.com/api.php?amount=1&type=multiple"
-        response = requests.get(trivia_url)
+        response = http_session.get(TRIVIA_URL)
         response.raise_for_status()  # Raise an HTTPError for bad responses
-        trivia_data = response.json()
-        question = trivia_data["results"][0]["question"]
-        correct_answer = trivia_data["results"][0]["correct_answer"]
-        incorrect_answers = trivia_data["results"][0]["incorrect_answers"]
-        
-        # Decode HTML entities
-        question = html.unescape(question)
-        correct_answer = html.unescape(correct_answer)
-        incorrect_answers = [html.unescape(ans) for ans in incorrect_answers]
-        
-        # Combine correct and incorrect answers and shuffle
-        answers = [correct_answer] + incorrect_answers
-        random.shuffle(answers)
-        
-        # Compose the tweet with the trivia question and options
-        options = "\n".join(f"{i+1}. {ans}" for i, ans in enumerate(answers))
-        tweet_text = f"🤔 Trivia Time!\n{question}\n{options}\n#Trivia"
-        tweet_response = client.create_tweet(text=tweet_text)
-        tweet_id = tweet_response.data["id"]
+        return trivia_post_from(response.json())
+
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        return None
 
-        # Compose the comment with the correct answer
-        answer_text = f"📝 Answer: {correct_answer}"
-        client.create_tweet(text=answer_text, in_reply_to_tweet_id=tweet_id)
-        print("Trivia tweet and answer posted successfully!")
+def post_trivia():
+    try:
+        post = staging.take_or_prepare("post_trivia")
+        if post is None:
+            return
+        if staging.submit(post):
+            print("Trivia tweet and answer posted successfully!")
 
     except Exception as e:
         print(f"An error occurred: {e}")
@@ -333,174 +353,167 @@ def post_trivia():
 
 
 
-# Initialize the random word generator
-r = RandomWords()
+# Dictionary API entry of a word
+DICTIONARY_URL = "https://api.dictionaryapi.dev/api/v2/entries/en/{word}"
 
-def get_word_definition():
-    while True:
-        # Get a random word
-        random_word = r.get_random_word()
-
-        # Define the endpoint for the Dictionary API
-        url = f"https://api.dictionaryapi.dev/api/v2/entries/en/{random_word}"
-
-        # Send a request to the Dictionary API
-        response = requests.get(url)
-
-        # Check if the request was successful
-        if response.status_code == 200:
-            data = response.json()[0]
-            
-            # Extract the word's pronunciation
-            pronunciation = data.get('phonetic', 'No pronunciation available')
-            
-            # Extract the part of speech
-            part_of_speech = data['meanings'][0]['partOfSpeech']
-            
-            # Extract the definition
-            definition = data['meanings'][0]['definitions'][0]['definition']
-            
-            # Extract an example sentence, if available
-            example = data['meanings'][0]['definitions'][0].get('example', 'No example available')
-            
-            # Extract synonyms, if available
-            synonyms = data['meanings'][0]['definitions'][0].get('synonyms', ['No synonyms available'])
-
-            tweet_content = (
-                f"Word: {random_word}\n"
-                f"Pronunciation: {pronunciation}\n"
-                f"Part of Speech: {part_of_speech}\n"
-                f"Definition: {definition}\n"
-                f"Example: {example}\n"
-                f"Synonyms: {', '.join(synonyms)}"
-            )
+# Look a word up in the Dictionary API; returns the tweet text, or None if it doesn't resolve
+def lookup_word_definition(random_word):
+    # Send a request to the Dictionary API
+    try:
+        response = http_session.get(DICTIONARY_URL.format(word=random_word))
+    except requests.RequestException as e:
+        print(f"Could not fetch information for the word: {random_word}. {e}")
+        return None
 
-            return tweet_content
-        else:
-            print(f"Could not fetch information for the word: {random_word}. Retrying...")
+    # Check if the request was successful
+    if response.status_code == 200:
+        return definition_tweet(random_word, response.json()[0])
+    else:
+        print(f"Could not fetch information for the word: {random_word}.")
+        return None
+
+# Compose the word tweet from a Dictionary API entry
+def definition_tweet(random_word, data):
+    # Extract the word's pronunciation
+    pronunciation = data.get('phonetic', 'No pronunciation available')
+    
+    # Extract the part of speech
+    part_of_speech = data['meanings'][0]['partOfSpeech']
+    
+    # Extract the definition
+    definition = data['meanings'][0]['definitions'][0]['definition']
+    
+    # Extract an example sentence, if available
+    example = data['meanings'][0]['definitions'][0].get('example', 'No example available')
+    
+    # Extract synonyms, if available
+    synonyms = data['meanings'][0]['definitions'][0].get('synonyms', ['No synonyms available'])
+
+    tweet_content = (
+        f"Word: {random_word}\n"
+        f"Pronunciation: {pronunciation}\n"
+        f"Part of Speech: {part_of_speech}\n"
+        f"Definition: {definition}\n"
+        f"Example: {example}\n"
+        f"Synonyms: {', '.join(synonyms)}"
+    )
+
+    return tweet_content
+
+# Definitions validated ahead of time, so the 08:01 post reads one instantly
+definition_pool = word_pool.WordPool(lookup_word_definition, "word_pool.json")
+
+def get_word_definition():
+    tweet_content = definition_pool.take()
+    if tweet_content is None:
+        # Pool ran dry: one bounded refill, never an open-ended retry loop;
+        # waits for a background refill that is already running
+        definition_pool.refill(wait=word_pool.REFILL_WAIT)
+        tweet_content = definition_pool.take()
+    return tweet_content
 
 def post_tweet():
     tweet_content = get_word_definition()
-    client.create_tweet(text=tweet_content)  # Correct method for API v2
+    if tweet_content is None:
+        print("No word definition available within today's request budget.")
+        return
+    staging.submit(staging.PreparedPost(text=tweet_content))
 
 
 #function to get random country info
 def get_countries_list():
-    url = "https://restcountries.com/v3.1/all"
-    response = requests.get(url)
-    data = response.json()
-    return [country.get("name", {}).get("common") for country in data]
+    return country_catalog.country_names()
 
 def get_country_info(country_name):
-    url = f"https://restcountries.com/v3.1/name/{country_name}"
-    response = requests.get(url)
-    data = response.json()
-
-    if isinstance(data, list) and data:
-        country = data[0]
-        info = {
-            "name": country.get("name", {}).get("common", "No information found"),
-            "flag": country.get("flags", {}).get("png", ""),
-            "population": country.get("population", "No information found"),
-            "languages": ", ".join(country.get("languages", {}).values()) if country.get("languages") else "No information found",
-            "location": country.get("latlng", "No information found"),
-            "timezones": ", ".join(country.get("timezones", [])) if country.get("timezones") else "No information found",
-            "country_code": country.get("cca2", "No information found"),
-            "capital": country.get("capital", ["No information found"])[0],
-            "continent": country.get("continents", ["No information found"])[0],
-            "president": country.get("government", {}).get("president", "No information found"),
-            "currency": ", ".join([v["name"] for v in country.get("currencies", {}).values()]) if country.get("currencies") else "No information found",
-            "region": country.get("region", "No information found"),
-            "subregion": country.get("subregion", "No information found"),
-            "area": country.get("area", "No information found"),
-            "phone_code": country.get("idd", {}).get("root", "No information found") + country.get("idd", {}).get("suffixes", [""])[0]
-        }
-        return info
-    else:
-        return None
+    # Served from the local catalog; no request per lookup
+    return country_catalog.find(country_name)
 
 def get_random_country_info():
-    countries = get_countries_list()
-    random_country = random.choice(countries)
-    print(f"Random Country: {random_country}")
-    return get_country_info(random_country)
+    info = country_catalog.random_country()
+    print(f"Random Country: {info['name']}")
+    return info
+
+# Compose the country tweet text from a catalog entry
+def country_text(info):
+    return (f"Country: {info['name']}\n"
+            f"Capital: {info['capital']}\n"
+            f"Population: {info['population']}+\n"
+            f"Languages: {info['languages']}\n"
+            f"Location: {info['location']}\n"
+            f"Timezones: {info['timezones']}\n"
+            f"Country Code: {info['country_code']}\n"
+            f"Continent: {info['continent']}\n"
+           # f"Region: {info['region']}\n"  # Added line for region
+            f"Subregion: {info['subregion']}\n"  # Added line for subregion
+           # f"President: {info['president']}\n"
+            f"Currency: {info['currency']}\n"
+            f"Area: {info['area']} km²\n"
+            f"Phone Code: {info['phone_code']}\n"
+          #  f"Flag: {info['flag']}"
+            )
 
-def tweet_country_info():
+def prepare_country_info():
     info = get_random_country_info()
     if info:
-        tweet_text = (f"Country: {info['name']}\n"
-                      f"Capital: {info['capital']}\n"
-                      f"Population: {info['population']}+\n"
-                      f"Languages: {info['languages']}\n"
-                      f"Location: {info['location']}\n"
-                      f"Timezones: {info['timezones']}\n"
-                      f"Country Code: {info['country_code']}\n"
-                      f"Continent: {info['continent']}\n"
-                     # f"Region: {info['region']}\n"  # Added line for region
-                      f"Subregion: {info['subregion']}\n"  # Added line for subregion
-                     # f"President: {info['president']}\n"
-                      f"Currency: {info['currency']}\n"
-                      f"Area: {info['area']} km²\n"
-                      f"Phone Code: {info['phone_code']}\n"
-                    #  f"Flag: {info['flag']}"
-                    )
-
+        tweet_text = country_text(info)
         try:
-            # Download the flag image
-            flag_response = requests.get(info['flag'])
-            flag_response.raise_for_status()  # Raise an error for bad responses
-            image = BytesIO(flag_response.content)
-
-            # Upload the flag image
-            media =api.media_upload(filename='flag.png', file=image)
-
-            # Post the tweet with the attached image
-            response = client.create_tweet(text=tweet_text, media_ids=[media.media_id_string])
-            print("Tweet posted successfully!", response.data)
+            # Reuse the uploaded flag if still valid, else load it from the local cache
+            flag = media.fetch_media(info['flag'], "flag.png",
+                                     loader=lambda: country_catalog.flag_image(info))
+            return staging.PreparedPost(text=tweet_text, media=[flag])
 
         except requests.RequestException as e:
             print(f"Error downloading flag image: {e}")
+    return None
+
+def tweet_country_info():
+    import tweepy
+    post = staging.take_or_prepare("tweet_country_info")
+    if post:
+        try:
+            # Upload the flag image and post the tweet with it attached
+            tweet_id = staging.submit(post)
+            if tweet_id:
+                print("Tweet posted successfully!", tweet_id)
+
         except tweepy.TweepyException as e:
             print(f"Failed to post tweet: {e}")
             print(f"Response: {e.response.text}")
 
 
-# Initialize the scheduler with the correct timezone
-jobstores = {
-    'default': MemoryJobStore()
-}
-scheduler = BlockingScheduler(jobstores=jobstores, timezone='Africa/Nairobi')
 
 # Convert EAT time to UTC for CronTrigger
 eat_timezone = pytz.timezone('Africa/Nairobi')
 
 
-scheduler.add_job(fetch_and_post_tweet, CronTrigger(hour=4, minute=10), timezone=eat_timezone)
- # 7:10 AM EAT
-#scheduler.add_job(post_random_recipe_tweet, CronTrigger(hour=10, minute=10), timezone=eat_timezone)  # 1:10 PM EAT
-#scheduler.add_job(post_random_recipe_tweet, 'interval', minutes=2)
-scheduler.add_job(post_movie_tweet, 'interval', minutes=180)  # Every 3 hours
-scheduler.add_job(post_fact, CronTrigger(hour=7, minute=1), timezone=eat_timezone)  # 10:01 AM EAT
-scheduler.add_job(post_pun, CronTrigger(hour=8, minute=10), timezone=eat_timezone)  # 11:10 AM EAT
-scheduler.add_job(post_trivia, CronTrigger(hour=9, minute=1), timezone=eat_timezone)  # 12:01 PM EAT
-# Schedule the job
-scheduler.add_job(post_tweet, CronTrigger(hour=5, minute=1), timezone=eat_timezone)  # 8:01 aM EAT
-#random country post schedule
-scheduler.add_job(tweet_country_info, CronTrigger(hour=14, minute=5),
-timezone=eat_timezone)#posts at 17:05 kenyan time
-# Start the scheduler
-scheduler.start()
-
-# Flask keep-alive code
-app = Flask('')
-
-@app.route('/')
-def home():
-    return "<b>Hack The Planet</b>"
-
-def run():
-    app.run(host='0.0.0.0', port=8080)
-
-def keep_alive():
-    print("I'm alive!")
-    run()
+def register_jobs(scheduler):
+    scheduler.add_job(fetch_and_post_tweet, CronTrigger(hour=4, minute=10), timezone=eat_timezone, id='fetch_and_post_tweet')
+     # 7:10 AM EAT
+    #scheduler.add_job(post_random_recipe_tweet, CronTrigger(hour=10, minute=10), timezone=eat_timezone)  # 1:10 PM EAT
+    #scheduler.add_job(post_random_recipe_tweet, 'interval', minutes=2)
+    scheduler.add_job(post_movie_tweet, 'interval', minutes=180, id='post_movie_tweet')  # Every 3 hours
+    scheduler.add_job(post_fact, CronTrigger(hour=7, minute=1), timezone=eat_timezone, id='post_fact')  # 10:01 AM EAT
+    scheduler.add_job(post_pun, CronTrigger(hour=8, minute=10), timezone=eat_timezone, id='post_pun')  # 11:10 AM EAT
+    scheduler.add_job(post_trivia, CronTrigger(hour=9, minute=1), timezone=eat_timezone, id='post_trivia')  # 12:01 PM EAT
+    # Schedule the job
+    scheduler.add_job(post_tweet, CronTrigger(hour=5, minute=1), timezone=eat_timezone, id='post_tweet')  # 8:01 aM EAT
+    #random country post schedule
+    scheduler.add_job(tweet_country_info, CronTrigger(hour=14, minute=5),
+    timezone=eat_timezone, id='tweet_country_info')#posts at 17:05 kenyan time
+
+    # Prepare the next post of these jobs a few minutes before their slot
+    staging.register('post_movie_tweet', prepare_movie_tweet)
+    staging.register('post_trivia', prepare_trivia)
+    staging.register('tweet_country_info', prepare_country_info)
+
+    # Top the word pool up ahead of the 8:01 AM EAT word post
+    scheduler.add_job(definition_pool.refill, CronTrigger(hour=4, minute=31), timezone=eat_timezone, id='refill_word_pool')
+
+    # Sync the movie catalog once a day so movie posts need no API calls
+    scheduler.add_job(movie_catalog.sync, CronTrigger(hour=3, minute=40), timezone=eat_timezone, id='sync_movie_catalog')
+
+
+if __name__ == "__main__":
+    # Run only this module's jobs; runtime.py runs every module together
+    import runtime
+    runtime.run([sys.modules[__name__]])
@@ -0,0 +1,60 @@
+import json
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+# Twitter accounts the bot posts to. TWITTER_ACCOUNTS holds a JSON list of
+# credential sets, one per account:
+#
+#   [{"name": "ke", "bearer_token": "...", "api_key": "...", "api_key_secret": "...",
+#     "access_token": "...", "access_token_secret": "..."}, ...]
+#
+# Without it the bot posts to the one account in the TWITTER_* variables.
+# Every job fetches and composes its content once and posts it to all of them.
+
+# Name of the account configured through the TWITTER_* variables
+DEFAULT = "default"
+
+
+@dataclass(frozen=True)
+class Account:
+    name: str
+    bearer_token: Optional[str]
+    api_key: Optional[str]
+    api_key_secret: Optional[str]
+    access_token: Optional[str]
+    access_token_secret: Optional[str]
+
+
+def _load():
+    raw = os.getenv('TWITTER_ACCOUNTS')
+    if not raw:
+        return [Account(DEFAULT,
+                        bearer_token=os.getenv('TWITTER_BEARER_TOKEN'),
+                        api_key=os.getenv('TWITTER_API_KEY'),
+                        api_key_secret=os.getenv('TWITTER_API_KEY_SECRET'),
+                        access_token=os.getenv('TWITTER_ACCESS_TOKEN'),
+                        access_token_secret=os.getenv('TWITTER_ACCESS_TOKEN_SECRET'))]
+    loaded = []
+    for entry in json.loads(raw):
+        if not entry.get("name") or any(account.name == entry["name"] for account in loaded):
+            raise ValueError("Every TWITTER_ACCOUNTS entry needs a unique name")
+        loaded.append(Account(entry["name"],
+                              bearer_token=entry.get("bearer_token"),
+                              api_key=entry.get("api_key"),
+                              api_key_secret=entry.get("api_key_secret"),
+                              access_token=entry.get("access_token"),
+                              access_token_secret=entry.get("access_token_secret")))
+    return loaded
+
+
+ACCOUNTS = _load()
+_by_name = {account.name: account for account in ACCOUNTS}
+
+
+def names():
+    return [account.name for account in ACCOUNTS]
+
+
+def get(name):
+    return _by_name[name]
@@ -0,0 +1,546 @@
+import asyncio
+import functools
+import json
+import logging
+import os
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import accounts
+import clients
+import country_catalog
+import http_cache
+import http_session
+import media
+import metrics
+import movie_catalog
+import quota
+import rate_limit
+import staging
+import word_pool
+
+# Optional asyncio engine, turned on with ASYNC_ENGINE=1. The scheduler runs
+# on one event loop and every posting job runs as a coroutine on it: provider
+# requests (cached ones included) and image downloads go through an aiohttp
+# session and text tweets through tweepy's AsyncClient, so a job waiting on
+# a provider or on Twitter holds no thread. What has no async client runs on
+# the loop's thread pool: spotipy, v1.1 media uploads, image resizing and
+# the local SQLite/file state. The Wordnik job, the word pool refill and the
+# daily catalog syncs stay threaded jobs. Requests to each provider, and to
+# Twitter, are capped by a semaphore per provider, however many jobs and
+# accounts are posting at once.
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.getenv('ASYNC_ENGINE', '0') == '1'
+# aiohttp is only imported when the engine is on; it costs a cold start
+# ~0.1s that a threaded deployment has no use for
+aiohttp = None
+if ENABLED:
+    try:
+        import aiohttp
+    except ImportError:  # aiohttp is optional; without it the bot runs on scheduler threads
+        logger.warning("ASYNC_ENGINE=1 needs aiohttp; running jobs on threads instead")
+        ENABLED = False
+
+# Requests in flight per provider (and to Twitter, as "twitter")
+PROVIDER_CONCURRENCY = int(os.getenv('ASYNC_PROVIDER_CONCURRENCY', '4'))
+# Same status codes and backoff as http_session's urllib3 retries, which
+# also retry failed connections and reads
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+BACKOFF_FACTOR = 0.5
+RETRY_ERRORS = ((aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError)
+                if aiohttp is not None else ())
+
+_loop = None
+_session = None
+_semaphores = {}
+_base_url = None
+
+
+def new_loop(workers):
+    """Create the engine's event loop; blocking jobs share ``workers`` threads."""
+    global _loop
+    _loop = asyncio.new_event_loop()
+    _loop.set_default_executor(ThreadPoolExecutor(max_workers=workers,
+                                                  thread_name_prefix="async-engine"))
+    asyncio.set_event_loop(_loop)
+    return _loop
+
+
+def _semaphore(provider):
+    if provider not in _semaphores:
+        _semaphores[provider] = asyncio.Semaphore(PROVIDER_CONCURRENCY)
+    return _semaphores[provider]
+
+
+def _http():
+    global _session
+    if _session is None:
+        _session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit_per_host=http_session.POOL_MAXSIZE))
+    return _session
+
+
+def redirect_to(base_url):
+    """Send every get_json() request to ``base_url``, like http_session.redirect_to()."""
+    global _base_url
+    _base_url = base_url.rstrip("/")
+
+
+def _target(url):
+    # (URL to request, extra headers) after any redirect_to()
+    if _base_url is None:
+        return url, {}
+    parts = urlsplit(url)
+    path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+    return _base_url + path, {"X-Original-Host": parts.netloc}
+
+
+def _retry_delay(response, attempt):
+    retry_after = response.headers.get("Retry-After", "") if response is not None else ""
+    if retry_after.isdigit():
+        return min(int(retry_after), http_session.RETRY_AFTER_MAX)
+    return BACKOFF_FACTOR * 2 ** attempt
+
+
+async def _request(url, params=None, headers=None, max_bytes=None):
+    """Async counterpart of http_session.get(); returns (status, headers, body).
+
+    Uses the provider's timeouts and retry count from http_session.PROVIDERS,
+    for both retryable statuses and failed connections or reads, counts the
+    call against its quota and reports it to the metrics. Error statuses
+    raise aiohttp.ClientResponseError, bodies over ``max_bytes`` ValueError.
+    """
+    provider = http_session.provider_for(url)
+    spec = http_session.PROVIDERS.get(provider, {})
+    connect, read = spec.get("timeout", http_session.DEFAULT_TIMEOUT)
+    retries = spec.get("retries", http_session.DEFAULT_RETRIES)
+    timeout = aiohttp.ClientTimeout(sock_connect=connect, sock_read=read)
+    label = metrics.provider_label(url)
+    target, redirect_headers = _target(url)
+    headers = {**(headers or {}), **redirect_headers}
+    await asyncio.to_thread(quota.record, provider)
+    for attempt in range(retries + 1):
+        async with _semaphore(provider):
+            started = time.monotonic()
+            responded = False
+            try:
+                async with _http().get(target, params=params, headers=headers,
+                                       timeout=timeout) as response:
+                    responded = True
+                    metrics.UPSTREAM_LATENCY.labels(label).observe(time.monotonic() - started)
+                    metrics.UPSTREAM_RESPONSES.labels(label, str(response.status)).inc()
+                    if response.status in RETRY_STATUSES and attempt < retries:
+                        delay = _retry_delay(response, attempt)
+                    else:
+                        response.raise_for_status()
+                        body = await _read(response, url, max_bytes)
+                        metrics.count_bytes(url, len(body))
+                        return response.status, response.headers, body
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                # Failures before any response are reported like the sync path's
+                if not responded:
+                    metrics.count_failure(url, time.monotonic() - started,
+                                          "timeout" if isinstance(e, asyncio.TimeoutError) else "error")
+                if not isinstance(e, RETRY_ERRORS) or attempt == retries:
+                    raise
+                logger.info("Retrying %s after %r", label, e)
+                delay = _retry_delay(None, attempt)
+        await asyncio.sleep(delay)
+
+
+async def _read(response, url, max_bytes):
+    if max_bytes is None:
+        return await response.read()
+    body = bytearray()
+    async for chunk in response.content.iter_chunked(media.CHUNK_SIZE):
+        body += chunk
+        if len(body) > max_bytes:
+            raise ValueError(f"Image larger than {max_bytes} bytes: {url}")
+    return bytes(body)
+
+
+async def get_json(url, params=None):
+    """Async counterpart of http_session.get(url).json()."""
+    _, _, body = await _request(url, params)
+    return json.loads(body)
+
+
+async def get_cached_json(url, params=None, ttl=60 * 60, validate=None):
+    """Async counterpart of http_cache.get_json(); the cache itself is
+    read and written on a worker thread."""
+    key, row, data, headers = await asyncio.to_thread(http_cache.lookup, url, params, ttl)
+    if data is not None:
+        return data
+    try:
+        status, response_headers, body = await _request(url, params, headers)
+        return await asyncio.to_thread(http_cache.complete, key, row, status, body.decode("utf-8"),
+                                       response_headers.get("ETag"),
+                                       response_headers.get("Last-Modified"), ttl, validate)
+    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+        return await asyncio.to_thread(http_cache.stale_or_raise, key, row, ttl, e)
+
+
+async def download_image(url, max_bytes=media.MAX_DOWNLOAD_BYTES):
+    """Async counterpart of media.download_image()."""
+    _, _, body = await _request(url, max_bytes=max_bytes)
+    return body
+
+
+async def fetch_media(url, filename, loader=None):
+    """Async counterpart of media.fetch_media(); ``loader`` is a coroutine
+    function. Resizing runs on a worker thread."""
+    if await asyncio.to_thread(media.uploaded_everywhere, url):
+        return media.Attachment(filename, None, url)
+    data = await loader() if loader is not None else await download_image(url)
+    filename, data = await asyncio.to_thread(media.fit_for_upload, data, filename)
+    return media.Attachment(filename, data, url)
+
+
+async def publish(post, account=accounts.DEFAULT):
+    """Async counterpart of staging.publish().
+
+    Posts with media go through staging.publish() on a worker thread, since
+    media uploads use the v1.1 API that the AsyncClient does not cover.
+    """
+    if post.media:
+        return await asyncio.get_running_loop().run_in_executor(
+            None, staging.publish, post, account)
+    client = clients.twitter_async_client(account)
+    tweet_ids = post.tweet_ids.setdefault(account, [])
+    texts = [post.text] + post.replies
+    while len(tweet_ids) < len(texts):
+        # The governor's SQLite transaction runs off the event loop
+        await asyncio.to_thread(rate_limit.acquire, "create_tweet", account)
+        async with _semaphore("twitter"):
+            with metrics.TWEET_POST_SECONDS.time():
+                if not tweet_ids:
+                    response = await client.create_tweet(text=post.text)
+                else:
+                    response = await client.create_tweet(text=texts[len(tweet_ids)],
+                                                         in_reply_to_tweet_id=tweet_ids[-1])
+        tweet_ids.append(response.data["id"])
+    # on_posted writes the post to its SQLite history
+    await asyncio.to_thread(staging.finish, post)
+    return tweet_ids[0]
+
+
+async def _submit_one(post, account):
+    from tweepy.errors import TooManyRequests
+
+    try:
+        return await publish(post, account)
+    except rate_limit.RateLimited as e:
+        retry_after = e.retry_after
+    except TooManyRequests as e:
+        endpoint = rate_limit.endpoint_for(e.response.method, str(e.response.url))
+        retry_after = (await asyncio.to_thread(rate_limit.retry_after, endpoint, account)
+                       if endpoint else 60)
+    staging.defer(post, account, retry_after)
+    return None
+
+
+async def submit(post, account_names=None):
+    """Async counterpart of staging.submit(): post to every account concurrently."""
+    account_names = account_names or accounts.names()
+    outcomes = await asyncio.gather(*(_submit_one(post, account) for account in account_names),
+                                    return_exceptions=True)
+    for account, outcome in zip(account_names, outcomes):
+        if isinstance(outcome, Exception):
+            logger.error("Posting to %s failed: %s", account, outcome)
+    for outcome in outcomes:
+        if outcome is not None and not isinstance(outcome, Exception):
+            return outcome
+    errors = [outcome for outcome in outcomes if isinstance(outcome, Exception)]
+    if len(errors) == len(outcomes):
+        raise errors[0]
+    return None
+
+
+async def _fetch_within(fetches, deadline):
+    # Async counterpart of http_session.fan_out(): {name: result}, with None
+    # for a fetch that failed or missed the deadline
+    tasks = {name: asyncio.ensure_future(fetch) for name, fetch in fetches.items()}
+    if not tasks:
+        return {}
+    done, pending = await asyncio.wait(tasks.values(), timeout=deadline)
+    for task in pending:
+        task.cancel()
+    results = {}
+    for name, task in tasks.items():
+        if task in done and task.exception() is None:
+            results[name] = task.result()
+        else:
+            logger.warning("Fetching %s failed: %s", name,
+                           task.exception() if task in done else "missed the deadline")
+            results[name] = None
+    return results
+
+
+async def _parsed(url, parse):
+    return parse(await get_json(url))
+
+
+# Coroutine versions of the jobs. Each takes the module the sync job lives
+# in, so parsing and composing stay shared with it; only local state (SQLite,
+# state files), spotipy and image resizing run on worker threads.
+
+async def fetch_and_post_tweet(jobs):
+    try:
+        reservations = {name: await asyncio.to_thread(quota.reserve, provider, optional=optional)
+                        for name, (provider, _, _, optional) in jobs.MORNING_FETCHES.items()}
+        try:
+            results = await _fetch_within(
+                {name: _parsed(url, parse)
+                 for name, (_, url, parse, _) in jobs.MORNING_FETCHES.items() if reservations[name]},
+                jobs.MORNING_TWEET_DEADLINE)
+        finally:
+            for reservation in reservations.values():
+                if reservation:
+                    await asyncio.to_thread(reservation.release)
+        if await submit(staging.PreparedPost(text=jobs.morning_tweet(results))):
+            logger.info("Tweet posted successfully.")
+    except Exception as e:
+        logger.error(f"An error occurred: {e}")
+
+
+async def post_fact(jobs):
+    try:
+        fact = jobs.fact_from(await get_json(jobs.FACT_URL))
+        tweet_id = await submit(staging.PreparedPost(text=f"Random Fact: {fact}"))
+        if tweet_id:
+            print(f"Fact posted successfully: {tweet_id}")
+    except Exception as e:
+        print(f"Fact: Failed to post fact: {e}")
+
+
+async def post_pun(jobs):
+    try:
+        pun = jobs.pun_from(await get_json(jobs.PUN_URL))
+        tweet_id = await submit(staging.PreparedPost(text=f"{pun}"))
+        if tweet_id:
+            print(f"Pun posted successfully: {tweet_id}")
+    except Exception as e:
+        print(f"Pun: Failed to post pun: {e}")
+
+
+async def post_trivia(jobs):
+    try:
+        post = staging.take("post_trivia")
+        if post is None:
+            post = jobs.trivia_post_from(await get_json(jobs.TRIVIA_URL))
+        if await submit(post):
+            print("Trivia tweet and answer posted successfully!")
+    except Exception as e:
+        print(f"An error occurred: {e}")
+
+
+async def post_joke_to_twitter(jobs):
+    try:
+        tweet = jobs.joke_tweet(await get_json(jobs.JOKE_URL))
+        if await submit(staging.PreparedPost(text=tweet)):
+            print("Tweet posted successfully")
+    except Exception as e:
+        print(f"Error posting joke to Twitter: {e}")
+
+
+async def post_movie_tweet(jobs):
+    try:
+        post = staging.take("post_movie_tweet")
+        if post is None:
+            movie = await asyncio.to_thread(jobs.claim_movie)
+            if movie is None:
+                return
+            post = jobs.movie_post(movie)
+            poster_url = jobs.movie_poster_url(movie)
+            if poster_url:
+                try:
+                    post.media.append(await fetch_media(poster_url, "poster.jpg"))
+                except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                    print(f"Error downloading poster image: {e}")
+                    await asyncio.to_thread(movie_catalog.release, movie['tmdb_id'])
+                    return
+        tweet_id = await submit(post)
+        if tweet_id:
+            print("Tweet posted successfully", tweet_id)
+    except Exception as e:
+        print(f"Failed to post tweet: {e}")
+
+
+async def _unposted_content(jobs, kind):
+    # Coroutine version of script.unposted_content()
+    for path, ttl in jobs.CONTENT_SOURCES[kind]:
+        page = jobs.first_content_page(path, ttl)
+        while page is not None:
+            try:
+                data = await get_cached_json(f"{jobs.TMDB_BASE_URL}{path}",
+                                             params={"api_key": jobs.TMDB_API_KEY, "page": page},
+                                             ttl=ttl)
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                print(f"Fetching {path} failed, trying the next source: {e}")
+                break
+            unposted, page = await asyncio.to_thread(jobs.read_content_page, path, ttl, page, data)
+            if unposted:
+                return unposted
+    return []
+
+
+async def _poster(jobs, movie):
+    poster_url = await asyncio.to_thread(jobs.content_poster_url, movie)
+    return [await fetch_media(poster_url, "poster.jpg")] if poster_url else []
+
+
+async def post_content(jobs):
+    try:
+        genres_mapping = await asyncio.to_thread(jobs.fetch_genres)
+        # Movies or series at random, the other kind if every title of one is posted
+        for kind in random.sample(list(jobs.CONTENT_SOURCES), len(jobs.CONTENT_SOURCES)):
+            content = await _unposted_content(jobs, kind)
+            if not content:
+                continue
+            movie = random.choice(content)
+            title = jobs.content_title(movie)
+            if await asyncio.to_thread(jobs.is_movie_posted, title):
+                print(f"🚫 Already posted: {title}")
+                return
+            # The poster and the details (for the trailer) are fetched together
+            poster, details = await asyncio.gather(
+                _poster(jobs, movie),
+                get_cached_json(jobs.movie_details_url(movie["id"]), ttl=jobs.MOVIE_DETAILS_TTL))
+            if await submit(jobs.content_post(movie, genres_mapping, details, poster)):
+                print(f"✅ Posted: {title}")
+            return
+        print("🚫 Every trending and top-rated title has been posted")
+    except Exception as e:
+        print(f"Failed to post content: {e}")
+
+
+async def post_song(jobs):
+    try:
+        post = staging.take("post_song")
+        if post is None:
+            # playlist_cache goes through spotipy, which has no async client
+            song = await asyncio.to_thread(jobs.get_random_song)
+            if song is None:
+                print("🚫 Every song in the playlist has been posted")
+                return
+            cover_url = jobs.song_cover_url(song)
+            if not cover_url:
+                return
+            post = jobs.song_post(song, await fetch_media(cover_url, "cover.jpg"))
+        if await submit(post):
+            print(f"✅ Posted: {post.text.splitlines()[0]}")
+    except Exception as e:
+        print(f"Failed to post song: {e}")
+
+
+async def _flag_image(info):
+    # Coroutine version of country_catalog.flag_image()
+    image = await asyncio.to_thread(country_catalog.cached_flag, info)
+    if image is None:
+        image = await download_image(info["flag"])
+        await asyncio.to_thread(country_catalog.save_flag, info, image)
+    return image
+
+
+async def tweet_country_info(jobs):
+    try:
+        post = staging.take("tweet_country_info")
+        if post is None:
+            info = await asyncio.to_thread(jobs.get_random_country_info)
+            if not info:
+                return
+            flag = await fetch_media(info['flag'], "flag.png", loader=lambda: _flag_image(info))
+            post = staging.PreparedPost(text=jobs.country_text(info), media=[flag])
+        tweet_id = await submit(post)
+        if tweet_id:
+            print("Tweet posted successfully!", tweet_id)
+    except Exception as e:
+        print(f"Failed to post tweet: {e}")
+
+
+async def _word_definition(jobs, word):
+    try:
+        entries = await get_json(jobs.DICTIONARY_URL.format(word=word))
+    except aiohttp.ClientResponseError:
+        return None  # not in the dictionary
+    return jobs.definition_tweet(word, entries[0])
+
+
+async def _look_up_word(jobs):
+    # One bounded round of lookups for when the pool ran dry; extra hits
+    # go back into the pool
+    pool = jobs.definition_pool
+    batch = await asyncio.to_thread(pool.reserve, word_pool.BATCH_SIZE)
+    words = await asyncio.to_thread(
+        lambda: [clients.random_words().get_random_word() for _ in range(batch)])
+    results = await _fetch_within({word: _word_definition(jobs, word) for word in words},
+                                  word_pool.BATCH_DEADLINE)
+    found = [entry for entry in results.values() if entry]
+    if not found:
+        return None
+    await asyncio.to_thread(pool.put, found[1:])
+    return found[0]
+
+
+async def post_tweet(jobs):
+    try:
+        tweet_content = await asyncio.to_thread(jobs.definition_pool.take)
+        if tweet_content is None:
+            tweet_content = await _look_up_word(jobs)
+        if tweet_content is None:
+            print("No word definition available within today's request budget.")
+            return
+        await submit(staging.PreparedPost(text=tweet_content))
+    except Exception as e:
+        print(f"Failed to post word definition: {e}")
+
+
+# Scheduler job name -> coroutine version
+ASYNC_JOBS = {
+    "fetch_and_post_tweet": fetch_and_post_tweet,
+    "post_fact": post_fact,
+    "post_pun": post_pun,
+    "post_trivia": post_trivia,
+    "post_joke_to_twitter": post_joke_to_twitter,
+    "post_movie_tweet": post_movie_tweet,
+    "post_content": post_content,
+    "post_song": post_song,
+    "tweet_country_info": tweet_country_info,
+    "post_tweet": post_tweet,
+}
+
+
+def use_async_jobs(scheduler):
+    """Swap in the coroutine version of every job that has one; call before
+    metrics.instrument() and leases.guard()."""
+    for job in scheduler.get_jobs():
+        coroutine = ASYNC_JOBS.get(job.name)
+        if coroutine is not None:
+            job.modify(func=functools.partial(coroutine, sys.modules[job.func.__module__]))
+
+
+async def close():
+    """Close the aiohttp session and those of the AsyncClients built so far."""
+    global _session
+    if _session is not None:
+        await _session.close()
+        _session = None
+    for account in accounts.names():
+        client = clients.built(clients.client_name("twitter_async_client", account))
+        session = getattr(client, "session", None)
+        if session is not None and not session.closed:
+            await session.close()
+
+
+def run_forever(scheduler):
+    """Start an AsyncIOScheduler built on new_loop() and block running its loop."""
+    scheduler.start()
+    try:
+        _loop.run_forever()
+    finally:
+        _loop.run_until_complete(close())
@@ -0,0 +1,57 @@
+import asyncio
+import itertools
+import threading
+import time
+from types import SimpleNamespace
+
+# Stand-in for tweepy.Client and tweepy.API that records posts instead of
+# sending them; installed with clients.override() by the benchmark runner.
+# FakeAsyncTwitter stands in for tweepy's AsyncClient the same way.
+
+
+class FakeTwitter:
+    """Accepts create_tweet and media_upload calls after a fixed delay."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.tweets = []
+        self.uploads = 0
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def reset_counts(self):
+        with self._lock:
+            self.tweets.clear()
+            self.uploads = 0
+
+    def create_tweet(self, text, media_ids=None, in_reply_to_tweet_id=None):
+        time.sleep(self.latency)
+        with self._lock:
+            tweet_id = str(next(self._ids))
+            self.tweets.append({"id": tweet_id, "text": text, "media_ids": media_ids,
+                                "in_reply_to_tweet_id": in_reply_to_tweet_id})
+        return SimpleNamespace(data={"id": tweet_id, "text": text})
+
+    def media_upload(self, filename, file=None):
+        time.sleep(self.latency)
+        if file is not None:
+            file.read()
+        with self._lock:
+            self.uploads += 1
+            media_id = str(next(self._ids))
+        return SimpleNamespace(media_id_string=media_id, expires_after_secs=86400)
+
+
+class FakeAsyncTwitter:
+    """Awaitable create_tweet recording into a FakeTwitter's tweets."""
+
+    def __init__(self, twitter):
+        self.twitter = twitter
+
+    async def create_tweet(self, text, media_ids=None, in_reply_to_tweet_id=None):
+        await asyncio.sleep(self.twitter.latency)
+        with self.twitter._lock:
+            tweet_id = str(next(self.twitter._ids))
+            self.twitter.tweets.append({"id": tweet_id, "text": text, "media_ids": media_ids,
+                                        "in_reply_to_tweet_id": in_reply_to_tweet_id})
+        return SimpleNamespace(data={"id": tweet_id, "text": text})
@@ -0,0 +1,223 @@
+"""Run the posting jobs offline against the stub server and report their cost.
+
+    python -m benchmarks.run                       # every job, 3 runs each
+    python -m benchmarks.run --jobs post_song post_content --runs 5
+    python -m benchmarks.run --latency 0.2 --provider-latency omdb=1.5 --failure-rate 0.1
+    python -m benchmarks.run --accounts 3          # post every job to 3 fake accounts
+    python -m benchmarks.run --async-engine        # coroutine jobs on an event loop
+    python -m benchmarks.run --json results.json   # keep numbers to compare later
+
+The first run of a job starts from empty caches in a fresh state directory;
+later runs show the warm path. Twitter is replaced by a fake that only
+records posts.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Jobs measured, as (module, function name)
+JOBS = [
+    ("Main", "fetch_and_post_tweet"),
+    ("Main", "post_movie_tweet"),
+    ("Main", "post_trivia"),
+    ("Main", "post_fact"),
+    ("Main", "post_pun"),
+    ("Main", "tweet_country_info"),
+    ("script", "post_content"),
+    ("script", "post_song"),
+    ("script", "fetch_random_word"),
+    ("script", "post_joke_to_twitter"),
+]
+
+# Credentials the clients check for before any request is made
+DUMMY_ENV = ["TWITTER_BEARER_TOKEN", "TWITTER_API_KEY", "TWITTER_API_KEY_SECRET",
+             "TWITTER_ACCESS_TOKEN", "TWITTER_ACCESS_TOKEN_SECRET", "SPOTIFY_CLIENT_ID",
+             "SPOTIFY_CLIENT_SECRET", "TMDB_API_KEY", "OMDB_API_KEY", "WORDNIK_API_KEY",
+             "WEATHER_API_KEY", "EXCHANGE_API_KEY", "METEOSOURCE_API_KEY"]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--jobs", nargs="+", metavar="JOB",
+                        help="job functions to run (default: all)")
+    parser.add_argument("--runs", type=int, default=3, help="runs per job (default: 3)")
+    parser.add_argument("--latency", type=float, default=0.05,
+                        help="stub response delay in seconds (default: 0.05)")
+    parser.add_argument("--provider-latency", nargs="+", default=[], metavar="PROVIDER=SECONDS",
+                        help="per-provider delay, e.g. omdb=1.5")
+    parser.add_argument("--failure-rate", type=float, default=0.0,
+                        help="share of stub responses that fail (default: 0)")
+    parser.add_argument("--failure-status", type=int, default=503,
+                        help="status code of injected failures (default: 503)")
+    parser.add_argument("--twitter-latency", type=float, default=0.05,
+                        help="fake Twitter delay per call in seconds (default: 0.05)")
+    parser.add_argument("--accounts", type=int, default=1,
+                        help="Twitter accounts posted to (default: 1)")
+    parser.add_argument("--async-engine", action="store_true",
+                        help="run jobs with a coroutine version on the asyncio engine")
+    parser.add_argument("--seed", type=int, default=1, help="seed for failures and job choices")
+    parser.add_argument("--json", metavar="PATH", help="also write the results as JSON")
+    parser.add_argument("--verbose", action="store_true", help="show the jobs' own output")
+    return parser.parse_args(argv)
+
+
+def _blocking(coroutine_function, loop):
+    # Run a coroutine job to completion on the engine's loop, like a sync job
+    return lambda: loop.run_until_complete(coroutine_function())
+
+
+def run_job(func, stub, twitter, verbose):
+    stub.reset_counts()
+    twitter.reset_counts()
+    tracemalloc.start()
+    started = time.perf_counter()
+    error = None
+    output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    try:
+        with output:
+            func()
+    except Exception as e:
+        error = repr(e)
+    seconds = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "seconds": seconds,
+        "requests": dict(stub.requests),
+        "request_count": sum(stub.requests.values()),
+        "bytes": stub.bytes_sent,
+        "tweets": len(twitter.tweets),
+        "uploads": twitter.uploads,
+        "peak_memory": peak,
+        "error": error,
+    }
+
+
+def summarize(name, runs):
+    warm = runs[1:] or runs
+    return {
+        "job": name,
+        "cold_seconds": runs[0]["seconds"],
+        "warm_median_seconds": statistics.median(run["seconds"] for run in warm),
+        "cold_requests": runs[0]["request_count"],
+        "warm_median_requests": statistics.median(run["request_count"] for run in warm),
+        "peak_memory_mib": max(run["peak_memory"] for run in runs) / 2 ** 20,
+        "tweets": sum(run["tweets"] for run in runs),
+        "errors": [run["error"] for run in runs if run["error"]],
+        "runs": runs,
+    }
+
+
+def print_table(results):
+    header = (f"{'job':<24} {'cold s':>8} {'warm s':>8} {'cold req':>9} {'warm req':>9} "
+              f"{'peak MiB':>9} {'tweets':>7}")
+    print(header)
+    print("-" * len(header))
+    for result in results:
+        print(f"{result['job']:<24} {result['cold_seconds']:>8.3f} "
+              f"{result['warm_median_seconds']:>8.3f} {result['cold_requests']:>9} "
+              f"{result['warm_median_requests']:>9g} {result['peak_memory_mib']:>9.2f} "
+              f"{result['tweets']:>7}")
+        for error in result["errors"]:
+            print(f"    error: {error}")
+    print()
+    print("Requests per provider (all runs):")
+    for result in results:
+        totals = {}
+        for run in result["runs"]:
+            for provider, count in run["requests"].items():
+                totals[provider] = totals.get(provider, 0) + count
+        listed = ", ".join(f"{provider} {count}" for provider, count in sorted(totals.items()))
+        print(f"  {result['job']:<24} {listed or '-'}")
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    # Every state file goes to a throwaway directory; set before the bot's
+    # modules are imported, since storage reads it at import time
+    state_dir = tempfile.mkdtemp(prefix="bot-bench-")
+    os.environ["BOT_STATE_DIR"] = state_dir
+    for name in DUMMY_ENV:
+        os.environ.setdefault(name, "benchmark")
+    if args.async_engine:
+        os.environ["ASYNC_ENGINE"] = "1"
+    if args.accounts > 1:
+        os.environ["TWITTER_ACCOUNTS"] = json.dumps(
+            [{"name": f"bench{number}"} for number in range(1, args.accounts + 1)])
+
+    import random
+
+    import accounts
+    import async_engine
+    import clients
+    import http_session
+    from benchmarks.fake_twitter import FakeAsyncTwitter, FakeTwitter
+    from benchmarks.stub_server import StubServer
+
+    random.seed(args.seed)
+    provider_latency = {}
+    for item in args.provider_latency:
+        provider, seconds = item.split("=")
+        provider_latency[provider] = float(seconds)
+    stub = StubServer(latency=args.latency, provider_latency=provider_latency,
+                      failure_rate=args.failure_rate, failure_status=args.failure_status,
+                      seed=args.seed)
+    http_session.redirect_to(stub.start())
+    async_engine.redirect_to(stub.base_url)
+    twitter = FakeTwitter(latency=args.twitter_latency)
+    for account in accounts.names():
+        clients.override(clients.client_name("twitter_client", account), twitter)
+        clients.override(clients.client_name("twitter_api", account), twitter)
+        clients.override(clients.client_name("twitter_async_client", account),
+                         FakeAsyncTwitter(twitter))
+
+    # Register the jobs (and their staging preparers) on a scheduler that
+    # never starts
+    import runtime
+    modules = runtime.import_modules(sorted({module for module, _ in JOBS}))
+    scheduler = runtime.build_scheduler()
+    for module in modules:
+        module.register_jobs(scheduler)
+    if async_engine.ENABLED:
+        async_engine.use_async_jobs(scheduler)
+    # The function each job runs, coroutine versions included
+    funcs = {job.name: job.func for job in scheduler.get_jobs()}
+
+    wanted = set(args.jobs or [name for _, name in JOBS])
+    unknown = wanted - {name for _, name in JOBS}
+    if unknown:
+        sys.exit(f"Unknown jobs: {', '.join(sorted(unknown))}")
+
+    results = []
+    try:
+        for module_name, name in JOBS:
+            if name not in wanted:
+                continue
+            func = funcs.get(name) or getattr(sys.modules[module_name], name)
+            if asyncio.iscoroutinefunction(func):
+                func = _blocking(func, asyncio.get_event_loop())
+            runs = [run_job(func, stub, twitter, args.verbose) for _ in range(args.runs)]
+            results.append(summarize(name, runs))
+    finally:
+        if async_engine.ENABLED:
+            asyncio.get_event_loop().run_until_complete(async_engine.close())
+        stub.stop()
+
+    print_table(results)
+    print(f"\nState files: {state_dir}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump({"args": vars(args), "results": results}, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+import json
+import random
+import re
+import struct
+import threading
+import time
+import zlib
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qsl, urlsplit
+
+import http_session
+
+# Local stand-in for every provider the jobs call. Requests arrive through
+# http_session.redirect_to() with the real host in X-Original-Host and are
+# answered from the JSON fixtures next to this file, after an optional delay
+# and with optional injected failures. "{{name}}" in a fixture is filled
+# from the route's named groups or the query string. Later pages of a list
+# fixture repeat its results under new ids and titles, so paging through a
+# list finds new entries.
+
+FIXTURE_DIR = Path(__file__).parent / "fixtures"
+
+# (host, path pattern, fixture file); the first match wins
+ROUTES = [
+    ("www.meteosource.com", r"/api/v1/free/point", "meteosource_point.json"),
+    ("api.weatherapi.com", r"/v1/current\.json", "weatherapi_current.json"),
+    ("openexchangerates.org", r"/api/latest\.json", "openexchangerates_latest.json"),
+    ("api.themoviedb.org", r"/3/trending/movie/day", "tmdb_movie_list.json"),
+    ("api.themoviedb.org", r"/3/trending/tv/day", "tmdb_tv_list.json"),
+    ("api.themoviedb.org", r"/3/movie/(popular|top_rated)", "tmdb_movie_list.json"),
+    ("api.themoviedb.org", r"/3/tv/(popular|top_rated)", "tmdb_tv_list.json"),
+    ("api.themoviedb.org", r"/3/movie/(?P<id>\d+)", "tmdb_movie_details.json"),
+    ("api.themoviedb.org", r"/3/genre/movie/list", "tmdb_movie_genres.json"),
+    ("api.themoviedb.org", r"/3/genre/tv/list", "tmdb_tv_genres.json"),
+    ("api.themoviedb.org", r"/3/configuration", "tmdb_configuration.json"),
+    ("www.omdbapi.com", r"/", "omdb_title.json"),
+    ("opentdb.com", r"/api\.php", "opentdb_question.json"),
+    ("restcountries.com", r"/v3\.1/all", "restcountries_all.json"),
+    ("accounts.spotify.com", r"/api/token", "spotify_token.json"),
+    ("api.spotify.com", r"/v1/playlists/[^/]+/(tracks|items)", "spotify_playlist_tracks.json"),
+    ("api.spotify.com", r"/v1/playlists/[^/]+", "spotify_playlist.json"),
+    ("api.wordnik.com", r"/v4/words\.json/randomWord", "wordnik_random_word.json"),
+    ("api.wordnik.com", r"/v4/word\.json/(?P<word>[^/]+)/definitions", "wordnik_definitions.json"),
+    ("api.wordnik.com", r"/v4/word\.json/(?P<word>[^/]+)/pronunciations", "wordnik_pronunciations.json"),
+    ("api.wordnik.com", r"/v4/word\.json/(?P<word>[^/]+)/relatedWords", "wordnik_related_words.json"),
+    ("api.wordnik.com", r"/v4/word\.json/(?P<word>[^/]+)/examples", "wordnik_examples.json"),
+    ("official-joke-api.appspot.com", r"/random_joke", "joke_random.json"),
+    ("v2.jokeapi.dev", r"/joke/Programming", "jokeapi_pun.json"),
+    ("uselessfacts.jsph.pl", r"/random\.json", "uselessfacts_random.json"),
+]
+
+# Hosts that serve images; answered with a generated PNG
+IMAGE_HOSTS = {"image.tmdb.org", "i.scdn.co", "flagcdn.com", "upload.wikimedia.org",
+               "m.media-amazon.com"}
+
+
+def _png(width=300, height=200):
+    """A solid-colour PNG, big enough to look like a small poster."""
+    def chunk(kind, data):
+        body = kind + data
+        return struct.pack(">I", len(data)) + body + struct.pack(">I", zlib.crc32(body))
+    rows = b"".join(b"\x00" + b"\x80\x40\x20" * width for _ in range(height))
+    return (b"\x89PNG\r\n\x1a\n"
+            + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(rows))
+            + chunk(b"IEND", b""))
+
+
+def _paged(body, page):
+    """A list fixture as page ``page``: same results, new ids and titles."""
+    data = json.loads(body)
+    if not isinstance(data, dict) or "results" not in data:
+        return body
+    data["page"] = page
+    for item in data["results"]:
+        if isinstance(item.get("id"), int):
+            item["id"] += page * 1_000_000
+        for key in ("title", "name"):
+            if key in item:
+                item[key] = f"{item[key]} {page}"
+    return json.dumps(data)
+
+
+class StubServer:
+    """Threaded HTTP server replaying fixtures with configurable latency and failures.
+
+    ``latency`` is a delay in seconds applied to every response and
+    ``provider_latency`` overrides it per provider name (as in
+    http_session.PROVIDERS). ``failure_rate`` is the share of requests
+    answered with ``failure_status`` instead of the fixture.
+    """
+
+    def __init__(self, latency=0.0, provider_latency=None, failure_rate=0.0,
+                 failure_status=503, seed=None):
+        self.latency = latency
+        self.provider_latency = provider_latency or {}
+        self.failure_rate = failure_rate
+        self.failure_status = failure_status
+        self.requests = Counter()
+        self.bytes_sent = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._image = _png()
+        self._routes = [(host, re.compile(pattern + r"/?$"), name)
+                        for host, pattern, name in ROUTES]
+        self._fixtures = {name: (FIXTURE_DIR / name).read_text(encoding="utf-8")
+                          for _, _, name in ROUTES}
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        name="stub-server", daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def reset_counts(self):
+        with self._lock:
+            self.requests.clear()
+            self.bytes_sent = 0
+
+    def respond(self, host, path, query):
+        """Return (status, content type, body) for a request."""
+        provider = http_session.provider_for(f"https://{host}/")
+        with self._lock:
+            self.requests[provider if provider != "default" else host] += 1
+            fail = self._random.random() < self.failure_rate
+        time.sleep(self.provider_latency.get(provider, self.latency))
+        if fail:
+            return self.failure_status, "application/json", b'{"error": "injected failure"}'
+        if host in IMAGE_HOSTS:
+            return 200, "image/png", self._image
+        for route_host, pattern, name in self._routes:
+            match = pattern.match(path)
+            if route_host == host and match:
+                values = {**dict(parse_qsl(query)), **match.groupdict()}
+                body = re.sub(r"\{\{(\w+)\}\}", lambda m: str(values.get(m.group(1), "")),
+                              self._fixtures[name])
+                page = values.get("page", "1")
+                if page.isdigit() and int(page) > 1:
+                    body = _paged(body, int(page))
+                return 200, "application/json", body.encode("utf-8")
+        return 404, "application/json", json.dumps({"error": f"no fixture for {host}{path}"}).encode()
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _serve(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                if length:
+                    self.rfile.read(length)
+                parts = urlsplit(self.path)
+                host = (self.headers.get("X-Original-Host") or "").split(":")[0]
+                status, content_type, body = stub.respond(host, parts.path, parts.query)
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                with stub._lock:
+                    stub.bytes_sent += len(body)
+
+            do_GET = _serve
+            do_POST = _serve
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
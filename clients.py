@@ -0,0 +1,165 @@
+import functools
+import logging
+import os
+import threading
+import time
+
+import accounts
+import http_session
+import metrics
+import rate_limit
+
+# Lazy registry of the provider clients shared by every job module. Each
+# client (and the library behind it) is only imported and built the first
+# time a job asks for it, so a deployment that never posts songs never
+# loads spotipy. Build times are kept for the start-up report. Twitter
+# clients exist once per account in accounts.py.
+
+logger = logging.getLogger(__name__)
+
+# Spotify credentials
+SPOTIPY_CLIENT_ID = os.getenv('SPOTIFY_CLIENT_ID')
+SPOTIPY_CLIENT_SECRET = os.getenv('SPOTIFY_CLIENT_SECRET')
+
+_factories = {}
+_instances = {}
+init_times = {}
+_lock = threading.RLock()
+
+
+def register(name, factory):
+    """Register how to build a client; it is built on first get()."""
+    _factories[name] = factory
+
+
+def override(name, instance):
+    """Use a ready-made instance for a client, e.g. a fake in benchmarks."""
+    with _lock:
+        _instances[name] = instance
+
+
+def get(name):
+    """Return the named client, building it on first use."""
+    instance = _instances.get(name)
+    if instance is not None:
+        return instance
+    with _lock:
+        if name not in _instances:
+            started = time.perf_counter()
+            _instances[name] = _factories[name]()
+            init_times[name] = time.perf_counter() - started
+            logger.info("Initialized %s client in %.3fs", name, init_times[name])
+        return _instances[name]
+
+
+def built(name):
+    """Return the named client if it has been built, else None."""
+    return _instances.get(name)
+
+
+def client_name(kind, account=accounts.DEFAULT):
+    """Registry name of a per-account client, e.g. "twitter_client:ke"."""
+    return kind if account == accounts.DEFAULT else f"{kind}:{account}"
+
+
+def _build_twitter_client(account):
+    import tweepy
+
+    # Authenticate to Twitter using Client
+    credentials = accounts.get(account)
+    twitter_client = tweepy.Client(bearer_token=credentials.bearer_token,
+                                   consumer_key=credentials.api_key,
+                                   consumer_secret=credentials.api_key_secret,
+                                   access_token=credentials.access_token,
+                                   access_token_secret=credentials.access_token_secret)
+    # Meter every tweet against the account's rate-limit budget
+    rate_limit.install(twitter_client.session, account=account)
+    metrics.install(twitter_client.session)
+    return twitter_client
+
+
+def _build_twitter_async_client(account):
+    # Needs aiohttp; only built when the asyncio engine is on
+    import aiohttp
+    from tweepy.asynchronous import AsyncClient
+
+    credentials = accounts.get(account)
+    twitter_client = AsyncClient(bearer_token=credentials.bearer_token,
+                                 consumer_key=credentials.api_key,
+                                 consumer_secret=credentials.api_key_secret,
+                                 access_token=credentials.access_token,
+                                 access_token_secret=credentials.access_token_secret)
+    # A session of its own (closed by async_engine.close()) whose responses
+    # correct the account's rate-limit budget
+    twitter_client.session = aiohttp.ClientSession(
+        trace_configs=[rate_limit.trace_config(account)])
+    return twitter_client
+
+
+def _build_twitter_api(account):
+    import tweepy
+
+    # Authenticate to Twitter using API (media uploads)
+    credentials = accounts.get(account)
+    auth = tweepy.OAuth1UserHandler(credentials.api_key, credentials.api_key_secret,
+                                    credentials.access_token, credentials.access_token_secret)
+    twitter_api = tweepy.API(auth)
+    # Meter every media upload against the account's rate-limit budget
+    rate_limit.install(twitter_api.session, account=account)
+    metrics.install(twitter_api.session)
+    return twitter_api
+
+
+def _build_spotify():
+    import spotipy
+    from spotipy.cache_handler import MemoryCacheHandler
+    from spotipy.oauth2 import SpotifyClientCredentials
+
+    # Authenticate to Spotify; the token is kept in memory rather than in
+    # spotipy's default .cache file in the working directory
+    return spotipy.Spotify(auth_manager=SpotifyClientCredentials(
+        client_id=SPOTIPY_CLIENT_ID,
+        client_secret=SPOTIPY_CLIENT_SECRET,
+        cache_handler=MemoryCacheHandler(),
+        requests_session=http_session.session),
+                           requests_session=http_session.session,
+                           requests_timeout=http_session.timeout_for(
+                               "https://api.spotify.com"))
+
+
+def _build_random_words():
+    from random_word import RandomWords
+
+    # Initialize the random word generator
+    return RandomWords()
+
+
+for _account in accounts.names():
+    register(client_name("twitter_client", _account),
+             functools.partial(_build_twitter_client, _account))
+    register(client_name("twitter_api", _account),
+             functools.partial(_build_twitter_api, _account))
+    register(client_name("twitter_async_client", _account),
+             functools.partial(_build_twitter_async_client, _account))
+register("spotify", _build_spotify)
+register("random_words", _build_random_words)
+
+
+def twitter_client(account=accounts.DEFAULT):
+    return get(client_name("twitter_client", account))
+
+
+def twitter_api(account=accounts.DEFAULT):
+    return get(client_name("twitter_api", account))
+
+
+def twitter_async_client(account=accounts.DEFAULT):
+    return get(client_name("twitter_async_client", account))
+
+
+def spotify():
+    return get("spotify")
+
+
+def random_words():
+    return get("random_words")
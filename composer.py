@@ -0,0 +1,144 @@
+import re
+import unicodedata
+from functools import lru_cache
+
+# Tweet text measured the way Twitter counts it (twitter-text v3): text is
+# NFC-normalized, every URL counts as 23, an emoji sequence counts as 2,
+# code points in the light ranges below count as 1 and everything else as
+# 2. split() packs a post's fields into as few tweets as possible, breaking
+# only between fields, then between words, never inside an emoji or URL.
+
+MAX_WEIGHTED_LENGTH = 280
+URL_LENGTH = 23
+
+# Code point ranges that count as one character; everything else counts as two
+LIGHT_RANGES = ((0, 4351), (8192, 8205), (8208, 8223), (8242, 8247))
+
+_EMOJI_BASE = ("[\U0001F000-\U0001FAFF\u2190-\u21FF\u2300-\u23FF"
+               "\u2460-\u27BF\u2900-\u297F\u2B00-\u2BFF\u3030\u303D\u3297\u3299]")
+# Variation selector 16 and skin tones attach to the emoji before them
+_EMOJI_MODIFIERS = "[\uFE0F\U0001F3FB-\U0001F3FF]*"
+_EMOJI = (
+    "[\U0001F1E6-\U0001F1FF]{2}"  # flags
+    "|[0-9#*]\uFE0F?\u20E3"  # keycaps
+    "|[\u00A9\u00AE\u203C\u2049\u2122\u2139]\uFE0F"  # text symbols shown as emoji
+    f"|{_EMOJI_BASE}{_EMOJI_MODIFIERS}(?:\u200D{_EMOJI_BASE}{_EMOJI_MODIFIERS})*"  # ZWJ sequences
+)
+_URL = r"https?://[^\s]+"
+# URLs, emoji sequences, or single characters
+_TOKEN = re.compile(f"(?P<url>{_URL})|(?P<emoji>{_EMOJI})|(?P<text>.)", re.DOTALL)
+
+
+def _char_weight(char):
+    code = ord(char)
+    for low, high in LIGHT_RANGES:
+        if low <= code <= high:
+            return 1
+    return 2
+
+
+@lru_cache(maxsize=4096)
+def weighted_length(text):
+    """Return the length Twitter counts for ``text``."""
+    if text.isascii() and "://" not in text:
+        return len(text)
+    length = 0
+    for match in _TOKEN.finditer(unicodedata.normalize("NFC", text)):
+        kind = match.lastgroup
+        if kind == "url":
+            length += URL_LENGTH
+        elif kind == "emoji":
+            length += 2
+        else:
+            length += _char_weight(match.group())
+    return length
+
+
+def fits(text, limit=MAX_WEIGHTED_LENGTH):
+    return weighted_length(text) <= limit
+
+
+def _chunks(word, limit):
+    # Hard-split a single word longer than a tweet, keeping emoji and URLs whole
+    chunk, length = "", 0
+    for match in _TOKEN.finditer(word):
+        piece = match.group()
+        weight = weighted_length(piece)
+        if chunk and length + weight > limit:
+            yield chunk
+            chunk, length = "", 0
+        chunk += piece
+        length += weight
+    if chunk:
+        yield chunk
+
+
+def _split_words(field, limit, current="", length=0, separator=" "):
+    # Continue the tweet in progress with the field's words, starting new
+    # tweets as they fill up. Lengths add up across whitespace, so each word
+    # is measured once. Returns (finished tweets, tweet in progress, its length).
+    tweets = []
+    for word in field.split(" "):
+        weight = weighted_length(word)
+        joiner = separator if current else ""
+        if length + weighted_length(joiner) + weight <= limit:
+            current += joiner + word
+            length += weighted_length(joiner) + weight
+            separator = " "
+            continue
+        if current:
+            tweets.append(current)
+        separator = " "
+        if weight <= limit:
+            current, length = word, weight
+        else:
+            *whole, current = _chunks(word, limit)
+            tweets.extend(whole)
+            length = weighted_length(current)
+    return tweets, current, length
+
+
+def split(fields, limit=MAX_WEIGHTED_LENGTH, separator="\n"):
+    """Pack ``fields`` (joined by ``separator``) into the fewest tweets.
+
+    A field that fits in a tweet is never broken up; a longer one is split
+    between words, starting in the tweet before it. Returns the tweet texts
+    in thread order.
+    """
+    separator_length = weighted_length(separator)
+    tweets, current, length = [], "", 0
+    for field in fields:
+        weight = weighted_length(field)
+        if weight > limit:
+            finished, current, length = _split_words(field, limit, current, length, separator)
+            tweets.extend(finished)
+            continue
+        if current and length + separator_length + weight <= limit:
+            current += separator + field
+            length += separator_length + weight
+            continue
+        if current:
+            tweets.append(current)
+        current, length = field, weight
+    if current:
+        tweets.append(current)
+    return tweets
+
+
+def truncate(text, limit=MAX_WEIGHTED_LENGTH, ellipsis="..."):
+    """Shorten ``text`` at a word boundary so it fits, ending it with ``ellipsis``."""
+    if fits(text, limit):
+        return text
+    budget = limit - weighted_length(ellipsis)
+    kept, length = "", 0
+    for match in re.finditer(r"\s*\S+", text):
+        piece = match.group()
+        weight = weighted_length(piece)
+        if length + weight > budget:
+            break
+        kept += piece
+        length += weight
+    if not kept:
+        # A single overlong word: cut it between characters instead
+        kept = next(_chunks(text, budget), "")
+    return kept.rstrip() + ellipsis
@@ -0,0 +1,137 @@
+import logging
+import random
+import threading
+import time
+
+import requests
+
+import http_session
+import media
+import storage
+
+# Local country catalog for tweet_country_info: a slim, indexed copy of the
+# restcountries.com data refreshed on a TTL, plus an on-disk flag image cache.
+
+logger = logging.getLogger(__name__)
+
+RESTCOUNTRIES_ALL_URL = "https://restcountries.com/v3.1/all"
+CATALOG_FILE = "countries.json"
+FLAG_DIR = "flags"
+
+# Country data barely changes; refresh the catalog once a month
+CATALOG_TTL = 30 * 24 * 60 * 60
+
+# restcountries accepts at most 10 fields per request, so the fields used by
+# the tweet are fetched in two groups and joined on cca2
+FIELD_GROUPS = [
+    "name,cca2,flags,population,languages,latlng,timezones,capital,continents",
+    "cca2,currencies,region,subregion,area,idd",
+]
+
+_catalog = None
+_by_name = {}
+_by_code = {}
+_lock = threading.Lock()
+
+
+def summarize(country):
+    """Reduce a restcountries record to the fields used by the country tweet."""
+    idd = country.get("idd") or {}
+    return {
+        "name": country.get("name", {}).get("common", "No information found"),
+        "flag": country.get("flags", {}).get("png", ""),
+        "population": country.get("population", "No information found"),
+        "languages": ", ".join(country.get("languages", {}).values()) if country.get("languages") else "No information found",
+        "location": country.get("latlng", "No information found"),
+        "timezones": ", ".join(country.get("timezones", [])) if country.get("timezones") else "No information found",
+        "country_code": country.get("cca2", "No information found"),
+        "capital": (country.get("capital") or ["No information found"])[0],
+        "continent": (country.get("continents") or ["No information found"])[0],
+        "currency": ", ".join([v["name"] for v in country.get("currencies", {}).values()]) if country.get("currencies") else "No information found",
+        "region": country.get("region", "No information found"),
+        "subregion": country.get("subregion", "No information found"),
+        "area": country.get("area", "No information found"),
+        "phone_code": idd.get("root", "No information found") + (idd.get("suffixes") or [""])[0]
+    }
+
+
+def _download_catalog():
+    merged = {}
+    for fields in FIELD_GROUPS:
+        response = http_session.get(RESTCOUNTRIES_ALL_URL, params={"fields": fields})
+        response.raise_for_status()
+        for country in response.json():
+            merged.setdefault(country.get("cca2"), {}).update(country)
+    countries = [summarize(country) for code, country in merged.items() if code]
+    return {"fetched_at": time.time(), "countries": countries}
+
+
+def _index(catalog):
+    global _catalog, _by_name, _by_code
+    _catalog = catalog
+    _by_name = {storage.normalize_key(c["name"]): c for c in catalog["countries"]}
+    _by_code = {c["country_code"].upper(): c for c in catalog["countries"]}
+
+
+def _is_fresh(catalog):
+    return catalog is not None and time.time() - catalog.get("fetched_at", 0) < CATALOG_TTL
+
+
+def get_catalog():
+    """Return the catalog, reading the disk copy and refreshing it once the TTL expires."""
+    with _lock:
+        if _is_fresh(_catalog):
+            return _catalog
+        on_disk = storage.load_json(CATALOG_FILE)
+        if _is_fresh(on_disk):
+            _index(on_disk)
+            return _catalog
+        try:
+            catalog = _download_catalog()
+            storage.save_json(CATALOG_FILE, catalog)
+            _index(catalog)
+        except (requests.RequestException, ValueError) as e:
+            # Keep serving a stale catalog rather than skipping the post
+            if on_disk is None and _catalog is None:
+                raise
+            logger.warning("Country catalog refresh failed, using stale copy: %s", e)
+            if _catalog is None:
+                _index(on_disk)
+        return _catalog
+
+
+def country_names():
+    return [country["name"] for country in get_catalog()["countries"]]
+
+
+def find(name_or_code):
+    """Look a country up by common name or cca2 code."""
+    get_catalog()
+    return (_by_code.get(str(name_or_code).upper())
+            or _by_name.get(storage.normalize_key(name_or_code)))
+
+
+def random_country():
+    return random.choice(get_catalog()["countries"])
+
+
+def _flag_file(country):
+    return f"{FLAG_DIR}/{country['country_code'].lower()}.png"
+
+
+def cached_flag(country):
+    """Return the flag PNG bytes from the on-disk cache, or None."""
+    return storage.load_bytes(_flag_file(country))
+
+
+def save_flag(country, image):
+    storage.save_bytes(_flag_file(country), image)
+
+
+def flag_image(country):
+    """Return the flag PNG bytes for a country, downloading it only once."""
+    image = cached_flag(country)
+    if image is None:
+        image = media.download_image(country["flag"])
+        save_flag(country, image)
+    return image
@@ -0,0 +1,184 @@
+import json
+import logging
+import os
+import threading
+import time
+from urllib.parse import urlencode
+
+import requests
+
+import http_session
+import storage
+
+# On-disk HTTP response cache for JSON endpoints that change at most daily
+# (TMDb lists and details, OMDb details, Spotify playlists). Each call site
+# picks a TTL; once it lapses the entry is revalidated with If-None-Match /
+# If-Modified-Since when the provider sent an ETag or Last-Modified, and a
+# stale entry is served if the provider is briefly down. The least recently
+# used entries are evicted once the cache outgrows MAX_CACHE_BYTES.
+
+logger = logging.getLogger(__name__)
+
+CACHE_FILE = "http_cache.sqlite3"
+MAX_CACHE_BYTES = int(os.getenv('HTTP_CACHE_MAX_BYTES', str(25 * 1024 * 1024)))
+# Serve a stale entry for at most this long when the provider fails
+STALE_IF_ERROR = 3 * 24 * 60 * 60
+
+# Query parameters that carry credentials and must not end up in cache keys
+SECRET_PARAMS = {"api_key", "apikey", "app_id", "app_key", "key"}
+
+_connection = None
+_lock = threading.Lock()
+
+
+def _db():
+    global _connection
+    if _connection is None:
+        connection = storage.connect(CACHE_FILE)
+        connection.execute("CREATE TABLE IF NOT EXISTS responses ("
+                           "key TEXT PRIMARY KEY, body TEXT NOT NULL, etag TEXT, "
+                           "last_modified TEXT, fetched_at REAL NOT NULL, "
+                           "accessed_at REAL NOT NULL, size INTEGER NOT NULL)")
+        connection.execute("CREATE INDEX IF NOT EXISTS responses_accessed "
+                           "ON responses (accessed_at)")
+        _connection = connection
+    return _connection
+
+
+def cache_key(url, params=None):
+    """Build a cache key from a URL and its params, leaving out credentials."""
+    base, _, query = url.partition("?")
+    pairs = [tuple(pair.split("=", 1)) if "=" in pair else (pair, "")
+             for pair in query.split("&") if pair]
+    pairs += list((params or {}).items())
+    public = sorted((name, str(value)) for name, value in pairs if name not in SECRET_PARAMS)
+    return f"{base}?{urlencode(public)}" if public else base
+
+
+def _lookup(key):
+    with _lock:
+        row = _db().execute("SELECT body, etag, last_modified, fetched_at FROM responses "
+                            "WHERE key = ?", (key,)).fetchone()
+        if row is not None:
+            _db().execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (time.time(), key))
+    return row
+
+
+def _store(key, body, etag=None, last_modified=None):
+    now = time.time()
+    with _lock:
+        connection = _db()
+        connection.execute("INSERT OR REPLACE INTO responses "
+                           "(key, body, etag, last_modified, fetched_at, accessed_at, size) "
+                           "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                           (key, body, etag, last_modified, now, now, len(body)))
+        _evict(connection)
+
+
+def _touch(key):
+    with _lock:
+        _db().execute("UPDATE responses SET fetched_at = ? WHERE key = ?", (time.time(), key))
+
+
+def _evict(connection):
+    total = connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+    if total <= MAX_CACHE_BYTES:
+        return
+    # Drop least recently used entries until the cache is back under 90% of its cap
+    for key, size in connection.execute("SELECT key, size FROM responses "
+                                        "ORDER BY accessed_at").fetchall():
+        connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+        total -= size
+        if total <= MAX_CACHE_BYTES * 0.9:
+            break
+
+
+def lookup(url, params=None, ttl=60 * 60):
+    """First half of get_json(), for callers that make the request themselves.
+
+    Returns ``(key, row, data, headers)``: ``data`` is the cached JSON when
+    the entry is still fresh (no request needed), otherwise None and
+    ``headers`` holds the conditional headers to revalidate ``row`` with.
+    """
+    key = cache_key(url, params)
+    row = _lookup(key)
+    if row is not None and time.time() - row[3] < ttl:
+        return key, row, json.loads(row[0]), {}
+    headers = {}
+    if row is not None:
+        if row[1]:
+            headers["If-None-Match"] = row[1]
+        if row[2]:
+            headers["If-Modified-Since"] = row[2]
+    return key, row, None, headers
+
+
+def complete(key, row, status, body, etag=None, last_modified=None, ttl=60 * 60, validate=None):
+    """Second half of get_json(): cache and return a successful response's JSON.
+
+    Raises ValueError for a body that isn't JSON; pass the error to
+    stale_or_raise().
+    """
+    if status == 304 and row is not None:
+        _touch(key)
+        return json.loads(row[0])
+    data = json.loads(body)
+    if validate is not None and not validate(data):
+        if row is not None and time.time() - row[3] < ttl + STALE_IF_ERROR:
+            logger.warning("Serving stale %s after an error payload", key)
+            return json.loads(row[0])
+        return data
+    _store(key, body, etag, last_modified)
+    return data
+
+
+def stale_or_raise(key, row, ttl, error):
+    """Serve the stale entry after a failed request, or raise ``error``."""
+    if row is not None and time.time() - row[3] < ttl + STALE_IF_ERROR:
+        logger.warning("Serving stale %s after error: %s", key, error)
+        return json.loads(row[0])
+    raise error
+
+
+def get_json(url, params=None, ttl=60 * 60, validate=None):
+    """GET a JSON endpoint through the cache.
+
+    Fresh entries are returned without a request; stale ones are
+    revalidated conditionally. Raises requests.RequestException only when
+    the provider fails and nothing usable is cached. ``validate(data)``
+    returning False marks a 200 response as an error payload (e.g. OMDb's
+    "Request limit reached!"): it is never cached, and a stale entry is
+    served instead if there is one.
+    """
+    key, row, data, headers = lookup(url, params, ttl)
+    if data is not None:
+        return data
+    try:
+        response = http_session.get(url, params=params, headers=headers)
+        response.raise_for_status()
+        return complete(key, row, response.status_code, response.text,
+                        response.headers.get("ETag"), response.headers.get("Last-Modified"),
+                        ttl, validate)
+    except (requests.RequestException, ValueError) as e:
+        return stale_or_raise(key, row, ttl, e)
+
+
+def cached_call(key, ttl, fetch):
+    """Cache the JSON-serializable result of ``fetch()`` under ``key``.
+
+    For clients such as spotipy that make their own requests; a stale
+    entry is served if ``fetch`` raises.
+    """
+    row = _lookup(key)
+    now = time.time()
+    if row is not None and now - row[3] < ttl:
+        return json.loads(row[0])
+    try:
+        data = fetch()
+    except Exception as e:
+        if row is not None and now - row[3] < ttl + STALE_IF_ERROR:
+            logger.warning("Serving stale %s after error: %s", key, e)
+            return json.loads(row[0])
+        raise
+    _store(key, json.dumps(data))
+    return data
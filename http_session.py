@@ -0,0 +1,221 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import metrics
+import quota
+
+# Shared HTTP layer used by every fetcher in Main.py and script.py.
+# One requests.Session keeps a keep-alive connection pool per provider host,
+# so back-to-back calls to the same API skip the TCP+TLS handshake.
+
+logger = logging.getLogger(__name__)
+
+# (connect, read) timeouts in seconds used when a host is not listed below
+DEFAULT_TIMEOUT = (3.05, 10)
+DEFAULT_RETRIES = 2
+# Longest Retry-After honoured between retries, in seconds; a provider asking
+# for hours must not park a scheduler or fan-out thread that long
+RETRY_AFTER_MAX = 2
+
+# Per-provider settings: hosts served, (connect, read) timeouts and retry count
+PROVIDERS = {
+    "tmdb": {"hosts": ["api.themoviedb.org"], "timeout": (3.05, 10), "retries": 3},
+    "tmdb_images": {"hosts": ["image.tmdb.org"], "timeout": (3.05, 20), "retries": 2},
+    "omdb": {"hosts": ["www.omdbapi.com"], "timeout": (3.05, 10), "retries": 2},
+    "wordnik": {"hosts": ["api.wordnik.com"], "timeout": (3.05, 8), "retries": 2},
+    "meteosource": {"hosts": ["www.meteosource.com"], "timeout": (3.05, 10), "retries": 2},
+    "weatherapi": {"hosts": ["api.weatherapi.com"], "timeout": (3.05, 10), "retries": 2},
+    "openexchangerates": {"hosts": ["openexchangerates.org"], "timeout": (3.05, 10), "retries": 2},
+    "edamam": {"hosts": ["api.edamam.com"], "timeout": (3.05, 15), "retries": 2},
+    "restcountries": {"hosts": ["restcountries.com"], "timeout": (3.05, 20), "retries": 2},
+    "flags": {"hosts": ["flagcdn.com", "upload.wikimedia.org"], "timeout": (3.05, 10), "retries": 2},
+    "dictionaryapi": {"hosts": ["api.dictionaryapi.dev"], "timeout": (3.05, 6), "retries": 1},
+    "uselessfacts": {"hosts": ["uselessfacts.jsph.pl"], "timeout": (3.05, 6), "retries": 1},
+    "jokeapi": {"hosts": ["v2.jokeapi.dev", "official-joke-api.appspot.com"], "timeout": (3.05, 6), "retries": 1},
+    "opentdb": {"hosts": ["opentdb.com"], "timeout": (3.05, 6), "retries": 1},
+    "spotify": {"hosts": ["api.spotify.com", "accounts.spotify.com"], "timeout": (3.05, 10), "retries": 2},
+    "spotify_images": {"hosts": ["i.scdn.co"], "timeout": (3.05, 15), "retries": 2},
+}
+
+# Connections kept alive per host; a few jobs can hit the same host at once
+POOL_MAXSIZE = 10
+
+_host_to_provider = {
+    host: name for name, spec in PROVIDERS.items() for host in spec["hosts"]
+}
+_adapters = {}
+_lock = threading.Lock()
+
+# Worker threads shared by every fan_out() call
+FAN_OUT_WORKERS = 8
+_executor = ThreadPoolExecutor(max_workers=FAN_OUT_WORKERS,
+                               thread_name_prefix="http-fan-out")
+
+
+class _CappedRetry(Retry):
+    """Retry that waits at most RETRY_AFTER_MAX for a Retry-After header."""
+
+    def get_retry_after(self, response):
+        retry_after = super().get_retry_after(response)
+        return min(retry_after, RETRY_AFTER_MAX) if retry_after is not None else None
+
+
+def _build_retry(total):
+    return _CappedRetry(total=total,
+                        connect=total,
+                        read=total,
+                        backoff_factor=0.5,
+                        status_forcelist=(429, 500, 502, 503, 504),
+                        allowed_methods=frozenset(["GET", "HEAD"]),
+                        respect_retry_after_header=True,
+                        raise_on_status=False)
+
+
+def _build_session():
+    new_session = requests.Session()
+    default_adapter = HTTPAdapter(pool_connections=len(_host_to_provider),
+                                  pool_maxsize=POOL_MAXSIZE,
+                                  max_retries=_build_retry(DEFAULT_RETRIES))
+    new_session.mount("https://", default_adapter)
+    new_session.mount("http://", default_adapter)
+    _adapters["default"] = default_adapter
+    # Mount a dedicated adapter (own pool and retry policy) for each provider host
+    for name, spec in PROVIDERS.items():
+        adapter = HTTPAdapter(pool_connections=len(spec["hosts"]),
+                              pool_maxsize=POOL_MAXSIZE,
+                              max_retries=_build_retry(spec["retries"]))
+        for host in spec["hosts"]:
+            new_session.mount(f"https://{host}", adapter)
+            new_session.mount(f"http://{host}", adapter)
+        _adapters[name] = adapter
+    return new_session
+
+
+session = _build_session()
+metrics.install(session)
+
+
+class _RedirectAdapter(HTTPAdapter):
+    """Sends every request to one base URL, passing the real host in X-Original-Host."""
+
+    def __init__(self, base_url, **kwargs):
+        super().__init__(**kwargs)
+        self.base_url = base_url.rstrip("/")
+
+    def send(self, request, **kwargs):
+        original_url = request.url
+        parts = urlsplit(original_url)
+        request.headers["X-Original-Host"] = parts.netloc
+        request.url = self.base_url + (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        response = super().send(request, **kwargs)
+        # Hooks and callers keep seeing the provider's URL
+        response.url = original_url
+        return response
+
+
+def redirect_to(base_url):
+    """Route every request of the shared session to ``base_url``.
+
+    Used by the benchmarks to point all providers at a local stub server.
+    """
+    adapter = _RedirectAdapter(base_url,
+                               pool_maxsize=POOL_MAXSIZE,
+                               max_retries=_build_retry(DEFAULT_RETRIES))
+    with _lock:
+        for prefix in list(session.adapters):
+            session.mount(prefix, adapter)
+
+
+def provider_for(url):
+    """Return the provider name for a URL, or "default" for unknown hosts."""
+    host = urlsplit(url).hostname or ""
+    return _host_to_provider.get(host, "default")
+
+
+def timeout_for(url):
+    """Return the (connect, read) timeout to use for a URL."""
+    spec = PROVIDERS.get(provider_for(url))
+    return spec["timeout"] if spec else DEFAULT_TIMEOUT
+
+
+def get(url, params=None, timeout=None, **kwargs):
+    """GET a URL through the shared session with the provider's timeout.
+
+    Each completed request is counted against the provider's quota, and
+    its body size in the metrics unless the response is streamed. Timeouts
+    and connection errors are counted in the metrics before being re-raised.
+    """
+    if timeout is None:
+        timeout = timeout_for(url)
+    started = time.monotonic()
+    try:
+        response = session.get(url, params=params, timeout=timeout, **kwargs)
+    except requests.RequestException as e:
+        metrics.count_failure(url, time.monotonic() - started,
+                              "timeout" if isinstance(e, requests.Timeout) else "error")
+        raise
+    quota.record(provider_for(url))
+    if not kwargs.get("stream"):
+        metrics.count_bytes(url, len(response.content))
+    return response
+
+
+def connection_stats():
+    """Return per-host request, connection and keep-alive reuse counts."""
+    stats = {}
+    with _lock:
+        for adapter in _adapters.values():
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                host = pool.host
+                entry = stats.setdefault(host, {"requests": 0, "connections": 0, "reused": 0})
+                entry["requests"] += pool.num_requests
+                entry["connections"] += pool.num_connections
+                entry["reused"] = max(entry["requests"] - entry["connections"], 0)
+    return stats
+
+
+def fan_out(calls, deadline):
+    """Run independent fetches concurrently under one overall deadline.
+
+    ``calls`` maps a name to a zero-argument callable. Returns ``(results,
+    timings)``: the result of each call (None if it failed or missed the
+    deadline) and how long each call took in seconds.
+    """
+    timings = {}
+    timings_lock = threading.Lock()
+
+    def timed(name, call):
+        started = time.monotonic()
+        try:
+            return call()
+        finally:
+            with timings_lock:
+                timings[name] = time.monotonic() - started
+
+    futures = {name: _executor.submit(timed, name, call) for name, call in calls.items()}
+    done, _ = wait(futures.values(), timeout=deadline)
+    results = {}
+    with timings_lock:
+        timings = dict(timings)
+    for name, future in futures.items():
+        results[name] = None
+        if future not in done:
+            future.cancel()
+            timings[name] = deadline
+            logger.warning("%s did not finish within %ss", name, deadline)
+        elif future.exception() is not None:
+            logger.warning("%s failed: %s", name, future.exception())
+        else:
+            results[name] = future.result()
+    return results, timings
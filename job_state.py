@@ -0,0 +1,137 @@
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from apscheduler.events import (EVENT_JOB_ERROR, EVENT_JOB_EXECUTED,
+                                EVENT_JOB_MISSED, EVENT_SCHEDULER_STARTED)
+from apscheduler.triggers.interval import IntervalTrigger
+
+import leases
+import storage
+
+# Persistent job state for warm restarts. Each job's upcoming run time and
+# last result are kept in SQLite; on start-up restore() puts interval jobs
+# back on their old phase instead of restarting the interval from boot time,
+# and runs a slot missed during the restart once if it is still within the
+# misfire grace time.
+
+logger = logging.getLogger(__name__)
+
+JOB_STATE_FILE = "job_state.sqlite3"
+# Set PERSISTENT_JOBS=0 to start every schedule fresh on boot
+ENABLED = os.getenv('PERSISTENT_JOBS', '1') != '0'
+
+_connection = None
+_lock = threading.Lock()
+
+
+def _db():
+    global _connection
+    if _connection is None:
+        connection = storage.connect(JOB_STATE_FILE)
+        connection.execute("CREATE TABLE IF NOT EXISTS jobs ("
+                           "job_id TEXT PRIMARY KEY, next_run_time REAL, "
+                           "last_run_at REAL, last_result TEXT)")
+        connection.execute("CREATE TABLE IF NOT EXISTS meta ("
+                           "name TEXT PRIMARY KEY, value REAL)")
+        _connection = connection
+    return _connection
+
+
+def _timestamp(value):
+    return value.timestamp() if value is not None else None
+
+
+def save_next_run(job):
+    with _lock:
+        _db().execute("INSERT INTO jobs (job_id, next_run_time) VALUES (?, ?) "
+                      "ON CONFLICT(job_id) DO UPDATE SET next_run_time = excluded.next_run_time",
+                      (job.id, _timestamp(job.next_run_time)))
+
+
+def save_result(job_id, next_run_time, result):
+    with _lock:
+        _db().execute("INSERT INTO jobs (job_id, next_run_time, last_run_at, last_result) "
+                      "VALUES (?, ?, ?, ?) ON CONFLICT(job_id) DO UPDATE SET "
+                      "next_run_time = excluded.next_run_time, last_run_at = excluded.last_run_at, "
+                      "last_result = excluded.last_result",
+                      (job_id, _timestamp(next_run_time), time.time(), result[:500]))
+
+
+def last_results():
+    """Return {job_id: (last_run_at, last_result)} for every recorded job."""
+    with _lock:
+        rows = _db().execute("SELECT job_id, last_run_at, last_result FROM jobs").fetchall()
+    return {job_id: (last_run_at, last_result) for job_id, last_run_at, last_result in rows}
+
+
+def _resume_time(job, stored, now, grace):
+    if stored > now:
+        return stored
+    if now - stored <= grace:
+        # Missed during the restart but still within grace: run it once now
+        return now
+    if isinstance(job.trigger, IntervalTrigger):
+        # Skip the missed slots but keep the interval's original phase
+        interval = job.trigger.interval
+        missed = (now - stored) // interval + 1
+        return stored + missed * interval
+    return None
+
+
+def restore(scheduler, grace_time):
+    """Resume each job from its saved next run time; call before scheduler.start()."""
+    with _lock:
+        saved = dict(_db().execute("SELECT job_id, next_run_time FROM jobs "
+                                   "WHERE next_run_time IS NOT NULL").fetchall())
+    now = datetime.now(timezone.utc)
+    grace = timedelta(seconds=grace_time)
+    for job in scheduler.get_jobs():
+        if job.id not in saved:
+            continue
+        stored = datetime.fromtimestamp(saved[job.id], timezone.utc)
+        resume_at = _resume_time(job, stored, now, grace)
+        if resume_at is not None:
+            job.modify(next_run_time=resume_at)
+            logger.info("Resuming %s at %s", job.id, resume_at.isoformat())
+
+
+def track(scheduler, process_started):
+    """Record job outcomes and the restart-to-ready time as the scheduler runs.
+
+    ``process_started`` is the time.time() at which the process began booting.
+    """
+    def on_started(event):
+        for job in scheduler.get_jobs():
+            save_next_run(job)
+        ready_seconds = time.time() - process_started
+        with _lock:
+            connection = _db()
+            previous = connection.execute("SELECT value FROM meta WHERE name = 'last_seen'").fetchone()
+            connection.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('ready_seconds', ?)",
+                               (ready_seconds,))
+        downtime = f", {process_started - previous[0]:.0f}s after the previous run" if previous else ""
+        logger.info("Scheduler ready %.2fs after start%s", ready_seconds, downtime)
+
+    def on_job_event(event):
+        # A failover run reports for the job it stands in for
+        job_id = leases.base_job_id(event.job_id)
+        job = scheduler.get_job(job_id)
+        next_run_time = job.next_run_time if job else None
+        if event.code == EVENT_JOB_EXECUTED and isinstance(event.retval, leases.Skipped):
+            result = f"skipped: {event.retval.reason}"
+        elif event.code == EVENT_JOB_EXECUTED:
+            result = f"ok: {event.retval!r}"
+        elif event.code == EVENT_JOB_ERROR:
+            result = f"error: {event.exception!r}"
+        else:
+            result = "missed"
+        save_result(job_id, next_run_time, result)
+        with _lock:
+            _db().execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('last_seen', ?)",
+                          (time.time(),))
+
+    scheduler.add_listener(on_started, EVENT_SCHEDULER_STARTED)
+    scheduler.add_listener(on_job_event, EVENT_JOB_EXECUTED | EVENT_JOB_ERROR | EVENT_JOB_MISSED)
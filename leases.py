@@ -0,0 +1,197 @@
+import functools
+import inspect
+import logging
+import os
+import socket
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta, timezone
+
+import storage
+
+# Job leasing for running several workers (replicas of `python runtime.py`)
+# on one shared BOT_STATE_DIR. Every firing of a job is claimed in SQLite
+# before it runs, and a claim blocks the job on every worker for half its
+# schedule's period, so a slot fires on all replicas but posts only once.
+#
+# Workers heartbeat into the same database. Each job prefers one live worker,
+# chosen by rendezvous hashing of the job id, which spreads the jobs across
+# the replicas. The other workers schedule a one-off "<job id>:failover" run
+# FAILOVER_GRACE later, which takes the slot over only if the preferred
+# worker has not claimed it by then. A firing that does not run the job
+# returns a Skipped, so the job listeners don't count it as a run.
+# SQLite locking needs the replicas to share a local disk, not a network mount.
+
+logger = logging.getLogger(__name__)
+
+LEASE_FILE = "leases.sqlite3"
+# Set JOB_LEASES=0 to run every job unconditionally (single worker)
+ENABLED = os.getenv('JOB_LEASES', '1') != '0'
+# Name of this worker in the leases table; must differ between replicas
+WORKER_ID = os.getenv('WORKER_ID') or f"{socket.gethostname()}-{os.getpid()}"
+# Seconds a non-preferred worker waits before taking a slot over
+FAILOVER_GRACE = int(os.getenv('FAILOVER_GRACE', '30'))
+HEARTBEAT_INTERVAL = 30
+# A worker whose last heartbeat is older than this no longer gets jobs
+WORKER_TIMEOUT = 3 * HEARTBEAT_INTERVAL
+# Spacing of jobs whose trigger has no next-but-one run (e.g. one-off dates)
+DEFAULT_SPACING = 60 * 60
+
+# Jobs that act on this process's own memory and run on every worker
+LOCAL_JOBS = {'stage_upcoming', 'drain_deferred', 'heartbeat'}
+FAILOVER_SUFFIX = ":failover"
+
+_connection = None
+_lock = threading.Lock()
+
+
+def _db():
+    global _connection
+    if _connection is None:
+        connection = storage.connect(LEASE_FILE)
+        connection.execute("CREATE TABLE IF NOT EXISTS claims ("
+                           "job_id TEXT PRIMARY KEY, worker TEXT NOT NULL, "
+                           "claimed_at REAL NOT NULL)")
+        connection.execute("CREATE TABLE IF NOT EXISTS workers ("
+                           "worker TEXT PRIMARY KEY, started_at REAL NOT NULL, "
+                           "heartbeat_at REAL NOT NULL)")
+        _connection = connection
+    return _connection
+
+
+def heartbeat():
+    """Mark this worker alive; run every HEARTBEAT_INTERVAL by the scheduler."""
+    now = time.time()
+    with _lock:
+        connection = _db()
+        connection.execute("INSERT INTO workers (worker, started_at, heartbeat_at) VALUES (?, ?, ?) "
+                           "ON CONFLICT(worker) DO UPDATE SET heartbeat_at = excluded.heartbeat_at",
+                           (WORKER_ID, now, now))
+        # Forget workers that have been gone for a day
+        connection.execute("DELETE FROM workers WHERE heartbeat_at < ?", (now - 24 * 60 * 60,))
+
+
+def live_workers():
+    """Return the workers that heartbeated within WORKER_TIMEOUT, this one included."""
+    with _lock:
+        rows = _db().execute("SELECT worker FROM workers WHERE heartbeat_at >= ?",
+                             (time.time() - WORKER_TIMEOUT,)).fetchall()
+    return sorted({row[0] for row in rows} | {WORKER_ID})
+
+
+def preferred_worker(job_id):
+    """Return the live worker a job is sharded to."""
+    return max(live_workers(), key=lambda worker: zlib.crc32(f"{job_id}:{worker}".encode()))
+
+
+def prefers(job_id):
+    """Whether this worker is the one a job is sharded to."""
+    return not ENABLED or preferred_worker(job_id) == WORKER_ID
+
+
+def claim(job_id, spacing):
+    """Claim the current firing of a job; False if a worker claimed it within ``spacing`` seconds."""
+    now = time.time()
+    with _lock:
+        cursor = _db().execute("INSERT INTO claims (job_id, worker, claimed_at) VALUES (?, ?, ?) "
+                               "ON CONFLICT(job_id) DO UPDATE SET worker = excluded.worker, "
+                               "claimed_at = excluded.claimed_at WHERE claims.claimed_at <= ?",
+                               (job_id, WORKER_ID, now, now - spacing))
+        return cursor.rowcount > 0
+
+
+def holder(job_id):
+    """Return (worker, claimed_at) of a job's last claim, or None."""
+    with _lock:
+        return _db().execute("SELECT worker, claimed_at FROM claims WHERE job_id = ?",
+                             (job_id,)).fetchone()
+
+
+def spacing_for(trigger):
+    """Half the gap between a trigger's next two run times, in seconds."""
+    now = datetime.now(timezone.utc)
+    first = trigger.get_next_fire_time(None, now)
+    second = (trigger.get_next_fire_time(first, first + timedelta(microseconds=1))
+              if first is not None else None)
+    if second is None:
+        return DEFAULT_SPACING
+    return (second - first).total_seconds() / 2
+
+
+class Skipped:
+    """Return value of a job firing that left the slot to another worker."""
+
+    def __init__(self, reason):
+        self.reason = reason
+
+    def __repr__(self):
+        return f"Skipped({self.reason!r})"
+
+
+def base_job_id(job_id):
+    """Return the id of the job a failover run was scheduled for."""
+    return job_id.removesuffix(FAILOVER_SUFFIX)
+
+
+def _skip_claimed(job_id):
+    worker, _ = holder(job_id)
+    logger.info("Skipping %s, already claimed by %s", job_id, worker)
+    return Skipped(f"claimed by {worker}")
+
+
+def _claimed_job(job_id, spacing, func):
+    # Run func only if this worker wins the claim on the current slot
+    if inspect.iscoroutinefunction(func):
+        # Coroutine jobs of the asyncio engine
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            if not claim(job_id, spacing):
+                return _skip_claimed(job_id)
+            return await func(*args, **kwargs)
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not claim(job_id, spacing):
+            return _skip_claimed(job_id)
+        return func(*args, **kwargs)
+    return wrapper
+
+
+def _leased_job(scheduler, job_id, spacing, func):
+    claimed = _claimed_job(job_id, spacing, func)
+
+    def hand_over(args, kwargs):
+        # Give the preferred worker the first chance at the slot, without
+        # holding an executor thread while it has it
+        run_date = datetime.now(timezone.utc) + timedelta(seconds=FAILOVER_GRACE)
+        scheduler.add_job(claimed, 'date', run_date=run_date, args=args, kwargs=kwargs,
+                          id=job_id + FAILOVER_SUFFIX, replace_existing=True)
+        return Skipped(f"failover run in {FAILOVER_GRACE}s")
+
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            if not prefers(job_id):
+                return hand_over(args, kwargs)
+            return await claimed(*args, **kwargs)
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not prefers(job_id):
+            return hand_over(args, kwargs)
+        return claimed(*args, **kwargs)
+    return wrapper
+
+
+def guard(scheduler):
+    """Lease every job registered so far and start heartbeating; call before scheduler.start()."""
+    for job in scheduler.get_jobs():
+        if job.id in LOCAL_JOBS:
+            continue
+        job.modify(func=_leased_job(scheduler, job.id, spacing_for(job.trigger), job.func))
+    heartbeat()
+    scheduler.add_job(heartbeat, 'interval', seconds=HEARTBEAT_INTERVAL, id='heartbeat')
+    logger.info("Worker %s leasing jobs with %d live worker(s)", WORKER_ID, len(live_workers()))
@@ -0,0 +1,226 @@
+import hashlib
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from io import BytesIO
+from typing import Optional
+
+import requests
+
+import accounts
+import http_session
+import metrics
+import rate_limit
+import storage
+
+# In-memory media pipeline: images are streamed into memory buffers, fitted
+# to Twitter's upload limits and handed to api.media_upload as file objects,
+# so no job ever writes to a shared path like poster.jpg. Uploaded media ids
+# are remembered by source URL and content hash while Twitter keeps them
+# valid, so a repeated image skips both the download and the upload. Media
+# ids belong to the account that uploaded them, so each account has its own
+# cache while the image itself is downloaded once for all of them.
+
+logger = logging.getLogger(__name__)
+
+# TMDb poster variant used for tweets; "original" posters are often several MB
+TMDB_POSTER_SIZE = "w780"
+
+# Twitter rejects still images larger than 5 MB
+TWITTER_IMAGE_MAX_BYTES = 5 * 1024 * 1024
+# Longest side Twitter keeps; larger images are downscaled on their side anyway
+TWITTER_IMAGE_MAX_SIDE = 4096
+# Downloads beyond this size are abandoned rather than buffered
+MAX_DOWNLOAD_BYTES = 20 * 1024 * 1024
+
+CHUNK_SIZE = 64 * 1024
+
+MEDIA_CACHE_FILE = "media_cache.sqlite3"
+# Cache file of any account other than accounts.DEFAULT
+ACCOUNT_MEDIA_CACHE_FILE = "media_cache_{account}.sqlite3"
+# Twitter keeps uploaded media for 24 hours unless it reports otherwise
+DEFAULT_MEDIA_TTL = 24 * 60 * 60
+# Stop reusing a media id this long before Twitter expires it
+MEDIA_EXPIRY_MARGIN = 60 * 60
+
+
+@dataclass
+class Attachment:
+    """An image to attach to a tweet.
+
+    ``data`` is None when the image is already uploaded and its cached
+    media id can be reused; it is downloaded at upload time if that id has
+    expired in the meantime. ``lock`` guards that download, since every
+    account uploads the same attachment from its own thread.
+    """
+    filename: str
+    data: Optional[bytes] = None
+    source_url: Optional[str] = None
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+
+def download_image(url, max_bytes=MAX_DOWNLOAD_BYTES):
+    """Stream an image into memory and return its bytes."""
+    buffer = BytesIO()
+    with http_session.get(url, stream=True) as response:
+        response.raise_for_status()
+        for chunk in response.iter_content(CHUNK_SIZE):
+            buffer.write(chunk)
+            if buffer.tell() > max_bytes:
+                raise requests.RequestException(f"Image larger than {max_bytes} bytes: {url}")
+    metrics.count_bytes(url, buffer.tell())
+    return buffer.getvalue()
+
+
+def fit_for_upload(data, filename):
+    """Downscale and/or recompress an image to Twitter's limits.
+
+    Returns ``(filename, data)``; the filename switches to .jpg when the
+    image had to be re-encoded as JPEG.
+    """
+    try:
+        from PIL import Image
+    except ImportError:  # Pillow is optional; without it images are uploaded as downloaded
+        return filename, data
+    try:
+        image = Image.open(BytesIO(data))
+        too_large = max(image.size) > TWITTER_IMAGE_MAX_SIDE
+        if not too_large and len(data) <= TWITTER_IMAGE_MAX_BYTES:
+            return filename, data
+        if too_large:
+            image.thumbnail((TWITTER_IMAGE_MAX_SIDE, TWITTER_IMAGE_MAX_SIDE))
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        for quality in (90, 80, 70, 60):
+            output = BytesIO()
+            image.save(output, format="JPEG", quality=quality, optimize=True)
+            if output.tell() <= TWITTER_IMAGE_MAX_BYTES:
+                break
+        stem = filename.rsplit(".", 1)[0]
+        logger.info("Recompressed %s from %d to %d bytes", filename, len(data), output.tell())
+        return f"{stem}.jpg", output.getvalue()
+    except (OSError, ValueError) as e:
+        logger.warning("Could not process %s, uploading as is: %s", filename, e)
+        return filename, data
+
+
+class MediaCache:
+    """Uploaded media ids keyed by source URL and by SHA-256 of the image."""
+
+    def __init__(self, filename, account=accounts.DEFAULT):
+        self.filename = filename
+        self.account = account
+        self._connection = None
+        self._lock = threading.Lock()
+
+    def _db(self):
+        if self._connection is None:
+            connection = storage.connect(self.filename)
+            connection.execute("CREATE TABLE IF NOT EXISTS media ("
+                               "digest TEXT PRIMARY KEY, media_id TEXT NOT NULL, "
+                               "expires_at REAL NOT NULL)")
+            connection.execute("CREATE TABLE IF NOT EXISTS sources ("
+                               "url TEXT PRIMARY KEY, digest TEXT NOT NULL)")
+            self._connection = connection
+        return self._connection
+
+    def by_url(self, url):
+        """Return a still-valid media id for a source URL, or None."""
+        with self._lock:
+            row = self._db().execute(
+                "SELECT media.media_id FROM sources JOIN media USING (digest) "
+                "WHERE sources.url = ? AND media.expires_at > ?",
+                (url, time.time() + MEDIA_EXPIRY_MARGIN)).fetchone()
+        return row[0] if row else None
+
+    def by_digest(self, digest):
+        """Return a still-valid media id for image content, or None."""
+        with self._lock:
+            row = self._db().execute(
+                "SELECT media_id FROM media WHERE digest = ? AND expires_at > ?",
+                (digest, time.time() + MEDIA_EXPIRY_MARGIN)).fetchone()
+        return row[0] if row else None
+
+    def remember(self, digest, media_id, expires_at):
+        with self._lock:
+            connection = self._db()
+            connection.execute("DELETE FROM media WHERE expires_at < ?", (time.time(),))
+            connection.execute("INSERT OR REPLACE INTO media (digest, media_id, expires_at) "
+                               "VALUES (?, ?, ?)", (digest, media_id, expires_at))
+
+    def link(self, url, digest):
+        """Point a source URL at the image content it served."""
+        with self._lock:
+            self._db().execute("INSERT OR REPLACE INTO sources (url, digest) VALUES (?, ?)",
+                               (url, digest))
+
+    def record(self, outcome):
+        """Count a lookup as "url_hit", "hash_hit" or "miss" in the metrics."""
+        metrics.MEDIA_CACHE_LOOKUPS.labels(outcome, self.account).inc()
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def cache_for(account):
+    """Return the media cache of an account."""
+    with _caches_lock:
+        if account not in _caches:
+            filename = (MEDIA_CACHE_FILE if account == accounts.DEFAULT
+                        else ACCOUNT_MEDIA_CACHE_FILE.format(account=account))
+            _caches[account] = MediaCache(filename, account)
+        return _caches[account]
+
+
+media_cache = cache_for(accounts.DEFAULT)
+
+
+def uploaded_everywhere(url):
+    """Whether every account still has a valid media id for an image URL."""
+    return all(cache_for(account).by_url(url) is not None for account in accounts.names())
+
+
+def fetch_media(url, filename, loader=None):
+    """Return an Attachment for an image URL, skipping the download when every
+    account's upload is still cached. ``loader`` overrides how the bytes are fetched."""
+    if uploaded_everywhere(url):
+        return Attachment(filename, None, url)
+    data = loader() if loader is not None else download_image(url)
+    filename, data = fit_for_upload(data, filename)
+    return Attachment(filename, data, url)
+
+
+def upload(api, attachment, account=accounts.DEFAULT):
+    """Upload an attachment from memory for an account, reusing a cached media id when possible.
+
+    Bytes downloaded here are kept on the attachment, so the next account
+    uploading it does not download it again.
+    """
+    media_cache = cache_for(account)
+    if attachment.source_url:
+        media_id = media_cache.by_url(attachment.source_url)
+        if media_id is not None:
+            media_cache.record("url_hit")
+            return media_id
+    with attachment.lock:
+        if attachment.data is None:
+            attachment.filename, attachment.data = fit_for_upload(
+                download_image(attachment.source_url), attachment.filename)
+        filename, data = attachment.filename, attachment.data
+    digest = hashlib.sha256(data).hexdigest()
+    media_id = media_cache.by_digest(digest)
+    if media_id is not None:
+        media_cache.record("hash_hit")
+    else:
+        rate_limit.acquire("media_upload", account)
+        media_cache.record("miss")
+        with metrics.MEDIA_UPLOAD_SECONDS.time():
+            media = api.media_upload(filename=filename, file=BytesIO(data))
+        media_id = media.media_id_string
+        ttl = getattr(media, "expires_after_secs", None) or DEFAULT_MEDIA_TTL
+        media_cache.remember(digest, media_id, time.time() + ttl)
+    if attachment.source_url:
+        media_cache.link(attachment.source_url, digest)
+    return media_id
@@ -0,0 +1,143 @@
+import functools
+import inspect
+import threading
+import time
+from urllib.parse import urlsplit
+
+from apscheduler.events import (EVENT_JOB_ERROR, EVENT_JOB_EXECUTED,
+                                EVENT_JOB_MISSED)
+from prometheus_client import (CONTENT_TYPE_LATEST, Counter, Histogram,
+                               generate_latest)
+
+import leases
+
+# Prometheus instrumentation for the scheduler, the shared HTTP session and
+# the Twitter calls, served by runtime.app on /metrics. Job timings come
+# from a wrapper around each job function plus the scheduler's job events;
+# provider latency and status come from a response hook on the sessions.
+
+# Jobs range from sub-second posts to minute-long catalog syncs
+JOB_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+REQUEST_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20)
+
+JOB_DURATION = Histogram("bot_job_duration_seconds",
+                         "Time from a job's start to its end",
+                         ["job"], buckets=JOB_BUCKETS)
+JOB_QUEUE_DELAY = Histogram("bot_job_queue_delay_seconds",
+                            "Time from a job's scheduled run time to its actual start",
+                            ["job"], buckets=JOB_BUCKETS)
+JOB_RUNS = Counter("bot_job_runs_total", "Job runs by outcome", ["job", "outcome"])
+
+UPSTREAM_LATENCY = Histogram("bot_upstream_request_seconds",
+                             "Time until an upstream response's headers arrived, or the request failed",
+                             ["provider"], buckets=REQUEST_BUCKETS)
+UPSTREAM_RESPONSES = Counter("bot_upstream_responses_total",
+                             "Upstream responses by status code, \"timeout\" or \"error\" for requests "
+                             "that got none", ["provider", "status"])
+UPSTREAM_BYTES = Counter("bot_upstream_bytes_total",
+                         "Response body bytes downloaded", ["provider"])
+
+MEDIA_UPLOAD_SECONDS = Histogram("bot_media_upload_seconds",
+                                 "Time spent in api.media_upload", buckets=REQUEST_BUCKETS)
+MEDIA_CACHE_LOOKUPS = Counter("bot_media_cache_lookups_total",
+                              "Media uploads served from the media id cache (url_hit, hash_hit) "
+                              "or uploaded (miss)", ["outcome", "account"])
+TWEET_POST_SECONDS = Histogram("bot_tweet_post_seconds",
+                               "Time spent in client.create_tweet", buckets=REQUEST_BUCKETS)
+
+_started = {}
+_lock = threading.Lock()
+
+
+def provider_label(url):
+    # Imported here because http_session reports into this module
+    import http_session
+
+    provider = http_session.provider_for(url)
+    return provider if provider != "default" else (urlsplit(url).hostname or "unknown")
+
+
+def _response_hook(response, *args, **kwargs):
+    provider = provider_label(response.url)
+    UPSTREAM_LATENCY.labels(provider).observe(response.elapsed.total_seconds())
+    UPSTREAM_RESPONSES.labels(provider, str(response.status_code)).inc()
+
+
+def count_failure(url, seconds, outcome):
+    """Record a request that failed without a response: ``outcome`` is
+    "timeout" or "error"."""
+    provider = provider_label(url)
+    UPSTREAM_LATENCY.labels(provider).observe(seconds)
+    UPSTREAM_RESPONSES.labels(provider, outcome).inc()
+
+
+def install(*sessions):
+    """Record latency and status of every response on these requests sessions."""
+    for session in sessions:
+        if _response_hook not in session.hooks["response"]:
+            session.hooks["response"].append(_response_hook)
+
+
+def count_bytes(url, size):
+    UPSTREAM_BYTES.labels(provider_label(url)).inc(size)
+
+
+def _start(job_id):
+    started = time.time()
+    with _lock:
+        _started[job_id] = started
+    return started
+
+
+def _timed_job(job_id, func):
+    if inspect.iscoroutinefunction(func):
+        # Coroutine jobs of the asyncio engine
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            started = _start(job_id)
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                JOB_DURATION.labels(job_id).observe(time.time() - started)
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        started = _start(job_id)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            JOB_DURATION.labels(job_id).observe(time.time() - started)
+    return wrapper
+
+
+def instrument(scheduler):
+    """Time every job registered so far; call before scheduler.start()."""
+    for job in scheduler.get_jobs():
+        job.modify(func=_timed_job(job.id, job.func))
+
+    def on_job_event(event):
+        # Failover runs are timed under the job they stand in for
+        job_id = leases.base_job_id(event.job_id)
+        if event.code == EVENT_JOB_MISSED:
+            JOB_RUNS.labels(job_id, "missed").inc()
+            return
+        with _lock:
+            started = _started.pop(job_id, None)
+        if started is not None:
+            JOB_QUEUE_DELAY.labels(job_id).observe(
+                max(started - event.scheduled_run_time.timestamp(), 0))
+        if event.code == EVENT_JOB_ERROR:
+            outcome = "error"
+        elif isinstance(event.retval, leases.Skipped):
+            outcome = "skipped"
+        else:
+            outcome = "ok"
+        JOB_RUNS.labels(job_id, outcome).inc()
+
+    scheduler.add_listener(on_job_event, EVENT_JOB_EXECUTED | EVENT_JOB_ERROR | EVENT_JOB_MISSED)
+
+
+def exposition():
+    """Return the current metrics in Prometheus text format and its content type."""
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,215 @@
+import logging
+import os
+import threading
+import time
+
+import requests
+
+import http_cache
+import http_session
+import quota
+import storage
+from tmdb_metadata import TMDB_API_KEY, TMDB_BASE_URL
+
+# Local catalog of movies for post_movie_tweet. A daily sync pulls the TMDb
+# popular and trending lists once, enriches every movie it hasn't seen yet
+# in parallel (TMDb details with external_ids appended for the IMDb id, then
+# OMDb for the rating and plot) and stores the result in SQLite. Posts then
+# take an unposted entry from the catalog without any API call.
+
+logger = logging.getLogger(__name__)
+
+OMDB_API_KEY = os.getenv('OMDB_API_KEY')
+CATALOG_FILE = "movie_catalog.sqlite3"
+
+# Popular pages pulled per sync, on top of today's trending list
+POPULAR_PAGES = 2
+# Resync before taking an entry when the last sync is older than this
+CATALOG_TTL = 24 * 60 * 60
+# Movies that dropped off the lists stay eligible for this long
+LISTED_MAX_AGE = 3 * 24 * 60 * 60
+# A taken entry is held back this long, until its post is confirmed
+CLAIM_TTL = 60 * 60
+# Overall time budget for enriching one sync's new movies, in seconds
+ENRICH_DEADLINE = 60
+# Cache lifetimes for list and detail responses, in seconds
+LIST_TTL = 6 * 60 * 60
+DETAILS_TTL = 7 * 24 * 60 * 60
+
+_connection = None
+_lock = threading.Lock()
+_sync_lock = threading.Lock()
+
+
+def _db():
+    global _connection
+    if _connection is None:
+        connection = storage.connect(CATALOG_FILE)
+        connection.execute("CREATE TABLE IF NOT EXISTS movies ("
+                           "tmdb_id INTEGER PRIMARY KEY, imdb_id TEXT NOT NULL, "
+                           "title TEXT NOT NULL, year TEXT, rating TEXT, plot TEXT, "
+                           "genre TEXT, poster TEXT, listed_at REAL NOT NULL, "
+                           "claimed_at REAL, posted_at REAL)")
+        connection.execute("CREATE INDEX IF NOT EXISTS movies_unposted "
+                           "ON movies (posted_at, listed_at)")
+        connection.execute("CREATE TABLE IF NOT EXISTS meta ("
+                           "name TEXT PRIMARY KEY, value REAL)")
+        _connection = connection
+    return _connection
+
+
+def _fetch_list(path, **params):
+    data = http_cache.get_json(f"{TMDB_BASE_URL}{path}",
+                               params={"api_key": TMDB_API_KEY, **params}, ttl=LIST_TTL)
+    return data.get("results", [])
+
+
+def fetch_listed_ids():
+    """Return the TMDb ids on today's trending list and the popular pages."""
+    paths = {"trending": ("/trending/movie/day", {})}
+    for page in range(1, POPULAR_PAGES + 1):
+        paths[f"popular-{page}"] = ("/movie/popular", {"language": "en-US", "page": page})
+    results, _ = http_session.fan_out(
+        {name: (lambda path=path, params=params: _fetch_list(path, **params))
+         for name, (path, params) in paths.items()},
+        deadline=ENRICH_DEADLINE)
+    ids = []
+    for movies in results.values():
+        for movie in movies or []:
+            if movie.get("id") not in ids:
+                ids.append(movie.get("id"))
+    return ids
+
+
+# OMDb errors that hold for good, so caching them saves requests
+OMDB_PERMANENT_ERRORS = {"Movie not found!", "Incorrect IMDb ID."}
+
+
+def omdb_cacheable(data):
+    # OMDb reports every error with HTTP 200; transient ones such as
+    # "Request limit reached!" must not be cached
+    return data.get("Response") != "False" or data.get("Error") in OMDB_PERMANENT_ERRORS
+
+
+def enrich(tmdb_id):
+    """Build a catalog entry from TMDb details and OMDb; None if it can't be posted."""
+    details = http_cache.get_json(f"{TMDB_BASE_URL}/movie/{tmdb_id}",
+                                  params={"api_key": TMDB_API_KEY,
+                                          "append_to_response": "external_ids"},
+                                  ttl=DETAILS_TTL)
+    imdb_id = details.get("imdb_id") or details.get("external_ids", {}).get("imdb_id")
+    if not imdb_id:
+        return None
+    omdb = http_cache.get_json("https://www.omdbapi.com/",
+                               params={"i": imdb_id, "apikey": OMDB_API_KEY},
+                               ttl=DETAILS_TTL, validate=omdb_cacheable)
+    if omdb.get("Response") == "False":
+        return None
+    return {
+        "tmdb_id": tmdb_id,
+        "imdb_id": imdb_id,
+        "title": omdb.get("Title") or details.get("title"),
+        "year": omdb.get("Year") or (details.get("release_date") or "")[:4],
+        "rating": omdb.get("imdbRating", "N/A"),
+        "plot": omdb.get("Plot") or details.get("overview"),
+        "genre": omdb.get("Genre", ""),
+        "poster": omdb.get("Poster", "N/A"),
+    }
+
+
+def _reserve_omdb(wanted):
+    # Enrichment is optional work: take as much of the OMDb budget as it can
+    # have without eating into what is left for everything else
+    while wanted > 0:
+        reservation = quota.reserve("omdb", wanted, optional=True)
+        if reservation is not None:
+            return reservation
+        wanted //= 2
+    return None
+
+
+def sync():
+    """Refresh the catalog from TMDb's lists, enriching movies not seen before."""
+    if not _sync_lock.acquire(blocking=False):
+        return  # another sync is already running
+    try:
+        listed = fetch_listed_ids()
+        now = time.time()
+        with _lock:
+            known = {row[0] for row in _db().execute("SELECT tmdb_id FROM movies")}
+            if listed:
+                _db().executemany("UPDATE movies SET listed_at = ? WHERE tmdb_id = ?",
+                                  [(now, tmdb_id) for tmdb_id in listed if tmdb_id in known])
+        new = [tmdb_id for tmdb_id in listed if tmdb_id not in known]
+        reservation = _reserve_omdb(len(new))
+        if reservation is None and new:
+            logger.warning("No OMDb budget to enrich %d new movies", len(new))
+            new = []
+        elif reservation is not None:
+            new = new[:reservation.amount]
+        try:
+            results, timings = http_session.fan_out(
+                {tmdb_id: (lambda tmdb_id=tmdb_id: enrich(tmdb_id)) for tmdb_id in new},
+                deadline=ENRICH_DEADLINE)
+        finally:
+            if reservation is not None:
+                reservation.release()
+        entries = [entry for entry in results.values() if entry]
+        with _lock:
+            connection = _db()
+            connection.executemany(
+                "INSERT OR IGNORE INTO movies (tmdb_id, imdb_id, title, year, rating, plot, "
+                "genre, poster, listed_at) VALUES (:tmdb_id, :imdb_id, :title, :year, :rating, "
+                ":plot, :genre, :poster, :listed_at)",
+                [{**entry, "listed_at": now} for entry in entries])
+            if listed:
+                connection.execute("INSERT OR REPLACE INTO meta (name, value) "
+                                   "VALUES ('synced_at', ?)", (now,))
+        logger.info("Movie catalog: %d listed, %d new, %d enriched in %.1fs",
+                    len(listed), len(new), len(entries), max(timings.values(), default=0))
+    except requests.RequestException as e:
+        logger.warning("Movie catalog sync failed: %s", e)
+    finally:
+        _sync_lock.release()
+
+
+def last_synced():
+    with _lock:
+        row = _db().execute("SELECT value FROM meta WHERE name = 'synced_at'").fetchone()
+    return row[0] if row else None
+
+
+def take():
+    """Claim a random unposted movie that is still on the lists, or None.
+
+    Syncs first only if the daily sync hasn't run.
+    """
+    synced_at = last_synced()
+    if synced_at is None or time.time() - synced_at > CATALOG_TTL:
+        sync()
+    now = time.time()
+    with _lock:
+        connection = _db()
+        with connection:
+            connection.execute("BEGIN IMMEDIATE")
+            row = connection.execute(
+                "SELECT tmdb_id, imdb_id, title, year, rating, plot, genre, poster FROM movies "
+                "WHERE posted_at IS NULL AND listed_at > ? "
+                "AND (claimed_at IS NULL OR claimed_at < ?) ORDER BY RANDOM() LIMIT 1",
+                (now - LISTED_MAX_AGE, now - CLAIM_TTL)).fetchone()
+            if row is None:
+                return None
+            connection.execute("UPDATE movies SET claimed_at = ? WHERE tmdb_id = ?", (now, row[0]))
+    keys = ("tmdb_id", "imdb_id", "title", "year", "rating", "plot", "genre", "poster")
+    return dict(zip(keys, row))
+
+
+def mark_posted(tmdb_id):
+    with _lock:
+        _db().execute("UPDATE movies SET posted_at = ? WHERE tmdb_id = ?", (time.time(), tmdb_id))
+
+
+def release(tmdb_id):
+    """Drop the claim on a movie that could not be posted, so take() offers it again."""
+    with _lock:
+        _db().execute("UPDATE movies SET claimed_at = NULL WHERE tmdb_id = ?", (tmdb_id,))
@@ -0,0 +1,46 @@
+import clients
+import http_cache
+
+# Spotify playlist tracks cached by the playlist's snapshot_id. Spotify gives
+# a playlist a new snapshot_id whenever its tracks change, so a run costs one
+# small request for the current snapshot_id (and none while the last check
+# is younger than SNAPSHOT_CHECK_TTL); the full track list, every page of
+# it, is fetched again only when the snapshot has moved on.
+
+# How long a fetched snapshot_id is trusted before asking Spotify again
+SNAPSHOT_CHECK_TTL = 60 * 60
+# Track lists are keyed by snapshot, so they never go stale; this only
+# bounds how long an unused snapshot's list lingers in the cache
+TRACKS_TTL = 30 * 24 * 60 * 60
+
+# Largest page the playlist items endpoint serves
+PAGE_SIZE = 100
+# Only the track fields the song tweet uses, plus the next-page link
+TRACK_FIELDS = ("items(track(name,id,artists(name),album(name,release_date,images),"
+                "external_urls)),next")
+
+
+def snapshot_id(playlist_id):
+    """Return the playlist's current snapshot_id."""
+    playlist = http_cache.cached_call(
+        f"spotify:playlist_snapshot:{playlist_id}", SNAPSHOT_CHECK_TTL,
+        lambda: clients.spotify().playlist(playlist_id, fields="snapshot_id"))
+    return playlist["snapshot_id"]
+
+
+def _fetch_tracks(playlist_id):
+    spotify = clients.spotify()
+    page = spotify.playlist_items(playlist_id, fields=TRACK_FIELDS, limit=PAGE_SIZE,
+                                  additional_types=("track",))
+    tracks = []
+    while page:
+        tracks.extend(item["track"] for item in page["items"] if item.get("track"))
+        page = spotify.next(page) if page.get("next") else None
+    return tracks
+
+
+def tracks(playlist_id):
+    """Return every track of a playlist, refetched only when its snapshot changes."""
+    snapshot = snapshot_id(playlist_id)
+    return http_cache.cached_call(f"spotify:playlist_tracks:{playlist_id}:{snapshot}",
+                                  TRACKS_TTL, lambda: _fetch_tracks(playlist_id))
@@ -0,0 +1,182 @@
+import logging
+import os
+import threading
+import time
+
+import leases
+import storage
+
+# Request ledger for the providers whose free tiers cap calls per day or
+# month. Every request made through http_session.get() is recorded against
+# its provider's current window in SQLite, so the count survives restarts.
+# Jobs reserve() what a post will need before fetching and skip the post, or
+# leave out optional extras, when the budget can't cover it. Reservations are
+# rows of their own that expire, so a worker that dies holding one frees it
+# after RESERVATION_TTL without touching the live reservations of the others.
+
+logger = logging.getLogger(__name__)
+
+QUOTA_FILE = "quota.sqlite3"
+
+DAY = 24 * 60 * 60
+MONTH = 30 * DAY
+
+
+def _quota_from_env(name, default):
+    # "<requests>/<seconds>", e.g. OMDB_QUOTA=1000/86400
+    value = os.getenv(name)
+    if not value:
+        return default
+    requests_allowed, seconds = value.split("/")
+    return int(requests_allowed), int(seconds)
+
+
+# provider (as named in http_session.PROVIDERS) -> (requests allowed, per seconds)
+QUOTAS = {
+    "omdb": _quota_from_env("OMDB_QUOTA", (1000, DAY)),
+    "meteosource": _quota_from_env("METEOSOURCE_QUOTA", (400, DAY)),
+    "weatherapi": _quota_from_env("WEATHERAPI_QUOTA", (1000000, MONTH)),
+    "openexchangerates": _quota_from_env("OPENEXCHANGERATES_QUOTA", (1000, MONTH)),
+    "edamam": _quota_from_env("EDAMAM_QUOTA", (10000, MONTH)),
+    "wordnik": _quota_from_env("WORDNIK_QUOTA", (15000, 60 * 60)),
+}
+
+# Share of each budget that optional fetches must leave untouched
+OPTIONAL_FLOOR = 0.1
+# A reservation not released by then is given back (its job died or hung)
+RESERVATION_TTL = 60 * 60
+
+_connection = None
+_lock = threading.Lock()
+
+
+def _db():
+    global _connection
+    if _connection is None:
+        connection = storage.connect(QUOTA_FILE)
+        connection.execute("CREATE TABLE IF NOT EXISTS usage ("
+                           "provider TEXT NOT NULL, window_start REAL NOT NULL, "
+                           "used INTEGER NOT NULL DEFAULT 0, "
+                           "PRIMARY KEY (provider, window_start))")
+        connection.execute("CREATE TABLE IF NOT EXISTS reservations ("
+                           "id INTEGER PRIMARY KEY, provider TEXT NOT NULL, "
+                           "window_start REAL NOT NULL, amount INTEGER NOT NULL, "
+                           "worker TEXT NOT NULL, expires_at REAL NOT NULL)")
+        now = time.time()
+        # Old windows are only kept around for a while for reference
+        connection.execute("DELETE FROM usage WHERE window_start < ?", (now - 2 * MONTH,))
+        # Reservations left by an earlier run under the same WORKER_ID are gone with
+        # their jobs. The default id includes the pid, so without a WORKER_ID that
+        # stays the same across restarts they are only freed after RESERVATION_TTL
+        connection.execute("DELETE FROM reservations WHERE worker = ? OR expires_at < ?",
+                           (leases.WORKER_ID, now))
+        _connection = connection
+    return _connection
+
+
+def _window_start(provider, now):
+    # Fixed windows aligned to the epoch, so daily quotas reset at 00:00 UTC
+    _, period = QUOTAS[provider]
+    return now - now % period
+
+
+def _usage(connection, provider, window_start):
+    row = connection.execute("SELECT used FROM usage WHERE provider = ? AND window_start = ?",
+                             (provider, window_start)).fetchone()
+    reserved, = connection.execute("SELECT COALESCE(SUM(amount), 0) FROM reservations "
+                                   "WHERE provider = ? AND window_start = ? AND expires_at >= ?",
+                                   (provider, window_start, time.time())).fetchone()
+    return (row[0] if row is not None else 0), reserved
+
+
+class Reservation:
+    """Budget held for a job's upcoming requests; release() once they're done.
+
+    Requests made while it is held count against both the reservation and
+    the ledger, which errs on the side of leaving budget unused.
+    """
+
+    def __init__(self, provider, amount, window_start, row_id=None):
+        self.provider = provider
+        self.amount = amount
+        self.window_start = window_start
+        self.row_id = row_id
+
+    def release(self):
+        if self.row_id is None:
+            return
+        with _lock:
+            _db().execute("DELETE FROM reservations WHERE id = ?", (self.row_id,))
+        self.amount = 0
+        self.row_id = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+def reserve(provider, amount=1, optional=False):
+    """Hold ``amount`` requests of a provider's budget for the current window.
+
+    Returns a Reservation, or None when the budget can't cover it. Optional
+    fetches also have to leave OPTIONAL_FLOOR of the budget for the rest.
+    Providers without a quota always get an empty reservation.
+    """
+    now = time.time()
+    if provider not in QUOTAS:
+        return Reservation(provider, 0, now)
+    limit, _ = QUOTAS[provider]
+    window_start = _window_start(provider, now)
+    floor = limit * OPTIONAL_FLOOR if optional else 0
+    with _lock:
+        connection = _db()
+        with connection:
+            connection.execute("BEGIN IMMEDIATE")
+            used, reserved = _usage(connection, provider, window_start)
+            if used + reserved + amount > limit - floor:
+                logger.warning("%s quota nearly used up (%d used, %d reserved of %d); "
+                               "refusing %d more", provider, used, reserved, limit, amount)
+                return None
+            cursor = connection.execute("INSERT INTO reservations "
+                                        "(provider, window_start, amount, worker, expires_at) "
+                                        "VALUES (?, ?, ?, ?, ?)",
+                                        (provider, window_start, amount, leases.WORKER_ID,
+                                         now + RESERVATION_TTL))
+    return Reservation(provider, amount, window_start, cursor.lastrowid)
+
+
+def record(provider, count=1):
+    """Count requests made to a provider in its current window."""
+    if provider not in QUOTAS:
+        return
+    window_start = _window_start(provider, time.time())
+    with _lock:
+        _db().execute("INSERT INTO usage (provider, window_start, used) VALUES (?, ?, ?) "
+                      "ON CONFLICT(provider, window_start) DO UPDATE SET used = used + excluded.used",
+                      (provider, window_start, count))
+
+
+def remaining(provider):
+    """Requests left in a provider's current window, or None if it has no quota."""
+    if provider not in QUOTAS:
+        return None
+    limit, _ = QUOTAS[provider]
+    with _lock:
+        used, reserved = _usage(_db(), provider, _window_start(provider, time.time()))
+    return max(limit - used - reserved, 0)
+
+
+def usage_report():
+    """Return {provider: {"used", "reserved", "limit", "resets_at"}} for the current windows."""
+    now = time.time()
+    report = {}
+    with _lock:
+        connection = _db()
+        for provider, (limit, period) in QUOTAS.items():
+            window_start = _window_start(provider, now)
+            used, reserved = _usage(connection, provider, window_start)
+            report[provider] = {"used": used, "reserved": reserved, "limit": limit,
+                                "resets_at": window_start + period}
+    return report
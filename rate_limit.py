@@ -0,0 +1,186 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+import storage
+from accounts import DEFAULT
+
+# Rate-limit governor for the Twitter endpoints the bot calls. Each endpoint
+# of each account has a token bucket kept in SQLite, so every job in Main.py
+# and script.py (and every process sharing BOT_STATE_DIR) draws from the
+# same per-account budget.
+# Buckets are corrected from Twitter's x-rate-limit-* response headers.
+# acquire() never sleeps: when a bucket is empty it raises RateLimited and
+# the caller defers the post instead of blocking a scheduler worker.
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_FILE = "rate_limits.sqlite3"
+
+
+def _limit_from_env(name, default):
+    # "<requests>/<seconds>", e.g. TWEET_RATE_LIMIT=100/86400
+    value = os.getenv(name)
+    if not value:
+        return default
+    requests_allowed, seconds = value.split("/")
+    return int(requests_allowed), int(seconds)
+
+
+# endpoint -> (requests allowed, per seconds) used until headers say otherwise
+ENDPOINT_LIMITS = {
+    "create_tweet": _limit_from_env("TWEET_RATE_LIMIT", (100, 24 * 60 * 60)),
+    "media_upload": _limit_from_env("MEDIA_UPLOAD_RATE_LIMIT", (415, 15 * 60)),
+}
+
+
+class RateLimited(Exception):
+    """Raised instead of calling an endpoint whose budget is used up."""
+
+    def __init__(self, endpoint, retry_after):
+        super().__init__(f"{endpoint} rate limited for {retry_after:.0f}s")
+        self.endpoint = endpoint
+        self.retry_after = retry_after
+
+
+_connection = None
+_lock = threading.Lock()
+
+
+def _db():
+    global _connection
+    if _connection is None:
+        connection = storage.connect(RATE_LIMIT_FILE)
+        connection.execute("CREATE TABLE IF NOT EXISTS buckets ("
+                           "endpoint TEXT PRIMARY KEY, tokens REAL NOT NULL, "
+                           "updated_at REAL NOT NULL, reset_at REAL)")
+        _connection = connection
+    return _connection
+
+
+def _bucket(endpoint, account):
+    # The default account keeps the plain endpoint name used before accounts existed
+    return endpoint if account == DEFAULT else f"{endpoint}@{account}"
+
+
+def _load(connection, endpoint, account, now):
+    capacity, period = ENDPOINT_LIMITS[endpoint]
+    row = connection.execute("SELECT tokens, updated_at, reset_at FROM buckets WHERE endpoint = ?",
+                             (_bucket(endpoint, account),)).fetchone()
+    if row is None:
+        return float(capacity), None
+    tokens, updated_at, reset_at = row
+    if reset_at is not None:
+        # Twitter told us when the window resets; no refill before then
+        if now < reset_at:
+            return tokens, reset_at
+        return float(capacity), None
+    return min(capacity, tokens + (now - updated_at) * capacity / period), None
+
+
+def _store(connection, endpoint, account, tokens, now, reset_at):
+    connection.execute("INSERT OR REPLACE INTO buckets (endpoint, tokens, updated_at, reset_at) "
+                       "VALUES (?, ?, ?, ?)", (_bucket(endpoint, account), tokens, now, reset_at))
+
+
+def acquire(endpoint, account=DEFAULT):
+    """Take one call's worth of an account's budget for an endpoint or raise RateLimited."""
+    now = time.time()
+    capacity, period = ENDPOINT_LIMITS[endpoint]
+    with _lock:
+        connection = _db()
+        with connection:
+            connection.execute("BEGIN IMMEDIATE")
+            tokens, reset_at = _load(connection, endpoint, account, now)
+            if tokens < 1:
+                retry_after = (reset_at - now) if reset_at else (1 - tokens) * period / capacity
+                raise RateLimited(_bucket(endpoint, account), retry_after)
+            _store(connection, endpoint, account, tokens - 1, now, reset_at)
+
+
+def observe(endpoint, headers, account=DEFAULT):
+    """Correct an account's endpoint bucket from Twitter's rate-limit headers."""
+    pairs = [("x-rate-limit-remaining", "x-rate-limit-reset"),
+             ("x-user-limit-24hour-remaining", "x-user-limit-24hour-reset"),
+             ("x-app-limit-24hour-remaining", "x-app-limit-24hour-reset")]
+    limits = [(int(headers[remaining]), float(headers[reset]))
+              for remaining, reset in pairs
+              if remaining in headers and reset in headers]
+    if not limits:
+        return
+    # The tightest window is the one that matters
+    remaining, reset_at = min(limits)
+    now = time.time()
+    with _lock:
+        connection = _db()
+        with connection:
+            connection.execute("BEGIN IMMEDIATE")
+            tokens, _ = _load(connection, endpoint, account, now)
+            _store(connection, endpoint, account, min(tokens, remaining), now,
+                   reset_at if remaining < 1 else None)
+    if remaining < 1:
+        logger.warning("%s budget exhausted until %s", _bucket(endpoint, account),
+                       time.strftime("%H:%M:%S", time.localtime(reset_at)))
+
+
+def retry_after(endpoint, account=DEFAULT):
+    """Seconds until an account's endpoint has budget again (0 if available now)."""
+    now = time.time()
+    capacity, period = ENDPOINT_LIMITS[endpoint]
+    with _lock:
+        tokens, reset_at = _load(_db(), endpoint, account, now)
+    if tokens >= 1:
+        return 0
+    return (reset_at - now) if reset_at else (1 - tokens) * period / capacity
+
+
+def endpoint_for(method, url):
+    """Map a Twitter API request to a governed endpoint name, or None."""
+    path = urlsplit(url).path
+    if "media/upload" in path:
+        return "media_upload"
+    if method == "POST" and path.rstrip("/").endswith("/2/tweets"):
+        return "create_tweet"
+    return None
+
+
+_hooks = {}
+
+
+def _response_hook(account):
+    # One hook per account, so install() can tell whether it is already there
+    if account not in _hooks:
+        def hook(response, *args, **kwargs):
+            endpoint = endpoint_for(response.request.method, response.url)
+            if endpoint is not None:
+                observe(endpoint, response.headers, account)
+        _hooks[account] = hook
+    return _hooks[account]
+
+
+def install(*sessions, account=DEFAULT):
+    """Feed the rate-limit headers of every response on these sessions
+    (tweepy Client.session / API.session) to the account's governor."""
+    hook = _response_hook(account)
+    for session in sessions:
+        if hook not in session.hooks["response"]:
+            session.hooks["response"].append(hook)
+
+
+def trace_config(account=DEFAULT):
+    """Return an aiohttp TraceConfig that feeds the rate-limit headers of every
+    response on its session (tweepy AsyncClient.session) to the account's governor."""
+    # Imported here because only the asyncio engine needs aiohttp
+    import aiohttp
+
+    async def on_request_end(session, context, params):
+        endpoint = endpoint_for(params.method, str(params.url))
+        if endpoint is not None:
+            await asyncio.to_thread(observe, endpoint, params.response.headers, account)
+
+    config = aiohttp.TraceConfig()
+    config.on_request_end.append(on_request_end)
+    return config
@@ -0,0 +1,199 @@
+import importlib
+import logging
+import os
+import sys
+import time
+from threading import Thread
+
+from apscheduler.executors.pool import ThreadPoolExecutor
+from apscheduler.jobstores.memory import MemoryJobStore
+from apscheduler.schedulers.blocking import BlockingScheduler
+from flask import Flask, Response
+
+import async_engine
+import clients
+import http_session
+import job_state
+import leases
+import quota
+import metrics
+import staging
+
+# Single-process runtime: registers the jobs of Main.py and script.py on one
+# scheduler with a bounded worker pool, and serves the keep-alive/health
+# endpoint from a background thread. With ASYNC_ENGINE=1 the scheduler runs
+# on an event loop instead (see async_engine.py).
+#
+#   python runtime.py            # every job module
+#   python Main.py               # only Main.py's jobs
+
+logger = logging.getLogger(__name__)
+
+# Jobs that may run at the same time; the rest wait for a free worker
+SCHEDULER_WORKERS = int(os.getenv('SCHEDULER_WORKERS', '4'))
+# A job that starts later than this after its slot is skipped
+MISFIRE_GRACE_TIME = int(os.getenv('MISFIRE_GRACE_TIME', '600'))
+HEALTH_PORT = int(os.getenv('PORT', '8080'))
+
+_imported_at = time.time()
+
+# Seconds spent importing each job module, for the start-up report
+import_times = {}
+# Libraries whose import cost dominates a cold start
+HEAVY_LIBRARIES = ['tweepy', 'spotipy', 'random_word', 'flask', 'apscheduler', 'PIL', 'aiohttp']
+
+
+def process_started():
+    """Return when this process started, for the restart-to-ready measurement."""
+    try:
+        # Linux: field 22 of /proc/self/stat is the start time in ticks since boot
+        with open('/proc/self/stat') as file:
+            start_ticks = int(file.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime') as file:
+            uptime = float(file.read().split()[0])
+        return time.time() - (uptime - start_ticks / os.sysconf('SC_CLK_TCK'))
+    except (OSError, ValueError, IndexError):
+        return _imported_at
+
+
+# Flask keep-alive code
+app = Flask('')
+
+
+@app.route('/')
+def home():
+    return "<b>Hack The Planet</b>"
+
+
+@app.route('/health')
+def health():
+    return {"status": "ok"}
+
+
+@app.route('/startup')
+def startup():
+    return startup_report()
+
+
+@app.route('/quota')
+def quota_usage():
+    return quota.usage_report()
+
+
+@app.route('/connections')
+def connection_reuse():
+    return http_session.connection_stats()
+
+
+@app.route('/metrics')
+def prometheus_metrics():
+    body, content_type = metrics.exposition()
+    return Response(body, mimetype=content_type)
+
+
+def import_modules(names):
+    """Import job modules by name, timing each one."""
+    modules = []
+    for name in names:
+        started = time.perf_counter()
+        modules.append(importlib.import_module(name))
+        import_times[name] = time.perf_counter() - started
+    return modules
+
+
+def startup_report():
+    """Import cost per job module, build cost per client and heavy libraries loaded so far."""
+    return {
+        "process_age_seconds": time.time() - process_started(),
+        "module_imports": dict(import_times),
+        "client_inits": dict(clients.init_times),
+        "heavy_libraries_loaded": [name for name in HEAVY_LIBRARIES if name in sys.modules],
+    }
+
+
+def log_startup_report():
+    report = startup_report()
+    for name, seconds in report["module_imports"].items():
+        logger.info("Imported %s in %.3fs", name, seconds)
+    for name, seconds in report["client_inits"].items():
+        logger.info("Initialized %s in %.3fs", name, seconds)
+    logger.info("Heavy libraries loaded at start-up: %s",
+                ", ".join(report["heavy_libraries_loaded"]) or "none")
+
+
+def start_health_server():
+    """Serve the Flask app on a daemon thread so it runs alongside the scheduler."""
+    server = Thread(target=app.run,
+                    kwargs={'host': '0.0.0.0', 'port': HEALTH_PORT},
+                    name='health-server',
+                    daemon=True)
+    server.start()
+    return server
+
+
+def build_scheduler():
+    """Create the shared scheduler with a bounded thread pool and misfire handling."""
+    job_defaults = {
+        # Run a job once after a delay, not once per missed slot
+        'coalesce': True,
+        'misfire_grace_time': MISFIRE_GRACE_TIME,
+        'max_instances': 1,
+    }
+    if async_engine.ENABLED:
+        # Imported here so a threaded deployment never loads asyncio's scheduler
+        from apscheduler.executors.asyncio import AsyncIOExecutor
+        from apscheduler.schedulers.asyncio import AsyncIOScheduler
+
+        # Blocking jobs run in the loop's pool of SCHEDULER_WORKERS threads
+        return AsyncIOScheduler(
+            event_loop=async_engine.new_loop(SCHEDULER_WORKERS),
+            jobstores={'default': MemoryJobStore()},
+            executors={'default': AsyncIOExecutor()},
+            job_defaults=job_defaults,
+            timezone='Africa/Nairobi')
+    return BlockingScheduler(
+        jobstores={'default': MemoryJobStore()},
+        executors={'default': ThreadPoolExecutor(SCHEDULER_WORKERS)},
+        job_defaults=job_defaults,
+        timezone='Africa/Nairobi')
+
+
+def run(modules):
+    """Register every module's jobs on one scheduler and block running them."""
+    logging.basicConfig(level=logging.INFO)
+    scheduler = build_scheduler()
+    for module in modules:
+        module.register_jobs(scheduler)
+
+    # Prepare upcoming posts ahead of their slot and retry deferred ones
+    scheduler.add_job(staging.stage_upcoming, 'interval', minutes=1, args=[scheduler],
+                      id='stage_upcoming')
+    scheduler.add_job(staging.drain_deferred, 'interval', minutes=1, id='drain_deferred')
+
+    # Run the jobs that have a coroutine version on the event loop
+    if async_engine.ENABLED:
+        async_engine.use_async_jobs(scheduler)
+
+    # Time every job for the /metrics endpoint
+    metrics.instrument(scheduler)
+
+    # Run each firing on only one of the workers sharing BOT_STATE_DIR
+    if leases.ENABLED:
+        leases.guard(scheduler)
+
+    # Pick schedules up where the previous process left off
+    if job_state.ENABLED:
+        job_state.restore(scheduler, MISFIRE_GRACE_TIME)
+        job_state.track(scheduler, process_started())
+
+    start_health_server()
+    log_startup_report()
+    print("🤖 Bot is running and will post according to the schedule ")
+    if async_engine.ENABLED:
+        async_engine.run_forever(scheduler)
+    else:
+        scheduler.start()
+
+
+if __name__ == "__main__":
+    run(import_modules(['Main', 'script']))
@@ -1,215 +1,241 @@
 import time
-import tweepy
 import requests
-import json
 import os
 import random
-from apscheduler.schedulers.blocking import BlockingScheduler
-from tweepy.errors import TooManyRequests
-from spotipy.oauth2 import SpotifyClientCredentials
-import spotipy
+import sys
 import requests
 import html
 import schedule
-from apscheduler.jobstores.memory import MemoryJobStore
 from apscheduler.triggers.interval import IntervalTrigger
 from apscheduler.triggers.cron import CronTrigger
 import pytz
-from flask import Flask
-# Twitter credentials
-bearer_token = os.getenv('TWITTER_BEARER_TOKEN')
-api_key = os.getenv('TWITTER_API_KEY')
-api_key_secret = os.getenv('TWITTER_API_KEY_SECRET')
-access_token = os.getenv('TWITTER_ACCESS_TOKEN')
-access_token_secret = os.getenv('TWITTER_ACCESS_TOKEN_SECRET')
-
-# Authenticate to Twitter using API
-auth = tweepy.OAuth1UserHandler(api_key, api_key_secret, access_token,
-                                access_token_secret)
-api = tweepy.API(auth)
-
-# Authenticate to Twitter using Client
-client = tweepy.Client(bearer_token=bearer_token,
-                       consumer_key=api_key,
-                       consumer_secret=api_key_secret,
-                       access_token=access_token,
-                       access_token_secret=access_token_secret)
-
-# Spotify credentials
-SPOTIPY_CLIENT_ID = os.getenv('SPOTIFY_CLIENT_ID')
-SPOTIPY_CLIENT_SECRET = os.getenv('SPOTIFY_CLIENT_SECRET')
-
-# Authenticate to Spotify
-sp = spotipy.Spotify(auth_manager=SpotifyClientCredentials(
-    client_id=SPOTIPY_CLIENT_ID, client_secret=SPOTIPY_CLIENT_SECRET))
-
-# File to store posted song titles to avoid repetition
+import http_session
+import http_cache
+import playlist_cache
+import quota
+import storage
+import tmdb_metadata
+import staging
+import media
+import composer
+
+# Legacy JSON history, imported into the dedup store on first use
 POSTED_SONGS_FILE = "posted_songs.json"
 
+PLAYLIST_ID = '37i9dQZF1DXcBWIGoYBM5M'  # Example playlist ID for Spotify's "Today's Top Hits"
+
+# Posted song titles, to avoid repetition
+posted_songs = storage.DedupStore("posted_songs.sqlite3",
+                                  legacy_files=[POSTED_SONGS_FILE])
+
 
 # Function to check if a song has been posted
 def is_song_posted(title):
-    if not os.path.exists(POSTED_SONGS_FILE):
-        return False
-    with open(POSTED_SONGS_FILE, "r") as file:
-        posted_songs = json.load(file)
     return title in posted_songs
 
 
 # Function to save the posted song title
 def save_posted_song(title):
-    if not os.path.exists(POSTED_SONGS_FILE):
-        posted_songs = []
-    else:
-        with open(POSTED_SONGS_FILE, "r") as file:
-            posted_songs = json.load(file)
-    posted_songs.append(title)
-    with open(POSTED_SONGS_FILE, "w") as file:
-        json.dump(posted_songs, file)
+    posted_songs.add(title)
 
 
-# Fetch random song from Spotify
+# Pick a random song from the Spotify playlist that has not been posted yet
 def get_random_song():
-    playlist_id = '37i9dQZF1DXcBWIGoYBM5M'  # Example playlist ID for Spotify's "Today's Top Hits"
-    results = sp.playlist_tracks(playlist_id,
-                                 limit=50)  # Fetch tracks from playlist
-    tracks = results['items']
-    return random.choice(tracks)['track']
+    tracks = playlist_cache.tracks(PLAYLIST_ID)
+    unposted = [track for track in tracks if not is_song_posted(track.get("name"))]
+    if not unposted:
+        return None
+    return random.choice(unposted)
 
 
-# Post the song on Twitter
-def post_song():
+# Album cover of a playlist track, or None
+def song_cover_url(song):
+    return song.get("album", {}).get("images", [{}])[0].get("url")
+
+
+# Prepare the song tweet
+def prepare_song():
     song = get_random_song()
+    if song is None:
+        print("🚫 Every song in the playlist has been posted")
+        return None
+
+    # Download the song cover image
+    cover_url = song_cover_url(song)
+    if not cover_url:
+        return None
+    return song_post(song, media.fetch_media(cover_url, "cover.jpg"))
+
+
+# Compose the song tweet around its downloaded cover
+def song_post(song, cover):
     title = song.get("name")
-    if is_song_posted(title):
-        print(f"🚫 Already posted: {title}")
-        return
 
     # Gather song details
     artist = ", ".join(artist['name'] for artist in song.get("artists", []))
     album = song.get("album", {}).get("name", "Unknown Album")
     release_date = song.get("album", {}).get("release_date", "Unknown Date")
-    cover_url = song.get("album", {}).get("images", [{}])[0].get("url")
     track_url = song.get("external_urls", {}).get("spotify")
 
-    # Download the song cover image
-    if cover_url:
-        cover_image = requests.get(cover_url).content
-        with open("cover.jpg", "wb") as file:
-            file.write(cover_image)
-
-        # Upload the cover image to Twitter
-        media = api.media_upload(filename="cover.jpg")
+    # Prepare the tweet text, split into as few tweets as Twitter's
+    # weighted character limit allows
+    tweet_parts = composer.split([f"🎵 Title: {title}",
+                                  f"🎤 Artist: {artist}",
+                                  f"💿 Album: {album}",
+                                  f"📅 Release Date: {release_date}",
+                                  f"🔗 Listen here: {track_url}"])
 
-        # Prepare the tweet text
-        tweet_text = f"🎵 Title: {title}\n🎤 Artist: {artist}\n💿 Album: {album}\n📅 Release Date: {release_date}\n🔗 Listen here: {track_url}"
-        tweet_parts = [tweet_text]
+    # The first part carries the image, remaining parts are posted as replies;
+    # the song title is saved once posted to prevent reposting
+    return staging.PreparedPost(text=tweet_parts[0],
+                                media=[cover],
+                                replies=tweet_parts[1:],
+                                on_posted=lambda: save_posted_song(title))
 
-        # Split text if it exceeds Twitter's character limit
-        if len(tweet_text) > 280:
-            tweet_parts = [
-                tweet_text[i:i + 280] for i in range(0, len(tweet_text), 280)
-            ]
-
-        # Post the first part of the tweet with the image
-        try:
-            response = client.create_tweet(text=tweet_parts[0],
-                                           media_ids=[media.media_id])
-            tweet_id = response.data["id"]
 
-            # Post remaining parts as replies
-            for part in tweet_parts[1:]:
-                response = client.create_tweet(text=part,
-                                               in_reply_to_tweet_id=tweet_id)
-                tweet_id = response.data["id"]
-
-            # Save the song title to prevent reposting
-            save_posted_song(title)
-            print(f"✅ Posted: {title}")
+# Post the song on Twitter
+def post_song():
+    post = staging.take_or_prepare("post_song")
+    if post is None:
+        return
+    # Rate-limited posts are deferred to the retry queue instead of dropped
+    if staging.submit(post):
+        print(f"✅ Posted: {post.text.splitlines()[0]}")
 
-        except tweepy.errors.TooManyRequests:
-            print("🚫 Rate limit exceeded. Retrying after some time...")
-            time.sleep(60)  # Wait for 1 minute before retrying
 
 
 # TMDB credentials
 TMDB_API_KEY = os.getenv("TMDB_API_KEY")
 TMDB_BASE_URL = "https://api.themoviedb.org/3"
 
-# File to store posted movie and series titles to avoid repetition
+# Cache lifetimes for TMDB responses, in seconds
+TRENDING_TTL = 3 * 60 * 60
+TOP_RATED_TTL = 24 * 60 * 60
+MOVIE_DETAILS_TTL = 7 * 24 * 60 * 60
+
+# Legacy JSON history, imported into the dedup store on first use
 POSTED_MOVIES_FILE = "posted_movies.json"
+POSTED_SERIES_FILE = "posted_series.json"
 
+# Posted movie and series titles, to avoid repetition
+posted_movies = storage.DedupStore(
+    "posted_movies.sqlite3",
+    legacy_files=[POSTED_MOVIES_FILE, POSTED_SERIES_FILE])
 
-# Fetch TMDB genre list for movies and TV shows
+
+# TMDB genre list for movies and TV shows, served from the metadata cache
 def fetch_genres():
-    url = f"{TMDB_BASE_URL}/genre/movie/list?api_key={TMDB_API_KEY}"
-    response = requests.get(url)
-    genres_data = response.json().get("genres", [])
-    return {genre['id']: genre['name'] for genre in genres_data}
+    return tmdb_metadata.genre_map()
 
 
 # Function to check if a movie or series has been posted
 def is_movie_posted(title):
-    if not os.path.exists(POSTED_MOVIES_FILE):
-        return False
-    with open(POSTED_MOVIES_FILE, "r") as file:
-        posted_movies = json.load(file)
     return title in posted_movies
 
 
 # Function to save the posted movie or series title
 def save_posted_movie(title):
-    if not os.path.exists(POSTED_MOVIES_FILE):
-        posted_movies = []
-    else:
-        with open(POSTED_MOVIES_FILE, "r") as file:
-            posted_movies = json.load(file)
-    posted_movies.append(title)
-    with open(POSTED_MOVIES_FILE, "w") as file:
-        json.dump(posted_movies, file)
-
-
-# Fetch trending movies from TMDB
-def get_trending_movies():
-    url = f"{TMDB_BASE_URL}/trending/movie/day?api_key={TMDB_API_KEY}"
-    response = requests.get(url)
-    if response.status_code == 200:
-        return response.json().get("results", [])
-    else:
-        # If trending endpoint fails, fetch top-rated movies instead
-        print("Trending endpoint failed, switching to top-rated movies.")
-        return get_top_rated_movies()
+    posted_movies.add(title)
+
+
+# Where post_content looks for titles, in order: trending first, then
+# top-rated once every trending page has been posted
+CONTENT_SOURCES = {
+    "movie": [("/trending/movie/day", TRENDING_TTL), ("/movie/top_rated", TOP_RATED_TTL)],
+    "tv": [("/trending/tv/day", TRENDING_TTL), ("/tv/top_rated", TOP_RATED_TTL)],
+}
+# TMDB serves at most this many pages of a list
+MAX_CONTENT_PAGES = 500
+
+# First page of each source that still had unposted titles, as (page, found
+# at); the pages before it stay used up until the source's TTL refreshes them
+content_cursors = {}
+
+
+# Fetch one page of a TMDB list, served from the response cache between runs
+def fetch_content_page(path, ttl, page):
+    url = f"{TMDB_BASE_URL}{path}"
+    return http_cache.get_json(url, params={"api_key": TMDB_API_KEY, "page": page}, ttl=ttl)
+
+
+def content_title(item):
+    return item.get("title") or item.get("name")  # Handle both movies and series
+
+
+# First page of a source to read: its cursor while that is fresh, else 1
+def first_content_page(path, ttl):
+    cursor, found_at = content_cursors.get(path, (1, 0))
+    return cursor if time.time() - found_at <= ttl else 1
+
 
+# Read one fetched page of a source: returns its unposted titles (moving the
+# source's cursor to it) and the next page to try, None once the list ends
+def read_content_page(path, ttl, page, data):
+    unposted = [item for item in data.get("results", [])
+                if not is_movie_posted(content_title(item))]
+    if unposted:
+        cursor, found_at = content_cursors.get(path, (1, 0))
+        if page != cursor or time.time() - found_at > ttl:
+            content_cursors[path] = (page, time.time())
+        return unposted, None
+    if page >= min(data.get("total_pages", page), MAX_CONTENT_PAGES):
+        return [], None
+    return [], page + 1
 
-# Fetch top-rated movies from TMDB
-def get_top_rated_movies():
-    url = f"{TMDB_BASE_URL}/movie/top_rated?api_key={TMDB_API_KEY}"
-    response = requests.get(url)
-    return response.json().get("results", [])
 
+# Return the unposted titles of the first page that has any, reading the
+# next page only when every title before it has been posted
+def unposted_content(kind):
+    for path, ttl in CONTENT_SOURCES[kind]:
+        page = first_content_page(path, ttl)
+        while page is not None:
+            try:
+                data = fetch_content_page(path, ttl, page)
+            except (requests.RequestException, ValueError) as e:
+                print(f"Fetching {path} failed, trying the next source: {e}")
+                break
+            unposted, page = read_content_page(path, ttl, page, data)
+            if unposted:
+                return unposted
+    return []
 
-# Fetch trending TV series from TMDB
-def get_trending_series():
-    url = f"{TMDB_BASE_URL}/trending/tv/day?api_key={TMDB_API_KEY}"
-    response = requests.get(url)
-    return response.json().get("results", [])
+
+def movie_details_url(movie_id):
+    return f"{TMDB_BASE_URL}/movie/{movie_id}?api_key={TMDB_API_KEY}&append_to_response=videos"
 
 
 # Fetch movie details including trailer
 def get_movie_details(movie_id):
-    details_url = f"{TMDB_BASE_URL}/movie/{movie_id}?api_key={TMDB_API_KEY}&append_to_response=videos"
-    response = requests.get(details_url)
-    return response.json()
+    return http_cache.get_json(movie_details_url(movie_id), ttl=MOVIE_DETAILS_TTL)
+
+
+# Tweet-sized variant of a movie or series poster, or None
+def content_poster_url(movie):
+    poster_path = movie.get("poster_path")
+    return tmdb_metadata.image_url(poster_path, media.TMDB_POSTER_SIZE) if poster_path else None
 
 
 # Post the movie or series on Twitter
 def post_movie(movie, genres_mapping):
-    title = movie.get("title") or movie.get(
-        "name")  # Handle both movies and series
+    title = content_title(movie)
     if is_movie_posted(title):
         print(f"🚫 Already posted: {title}")
         return
 
+    # Download a tweet-sized variant of the movie or series poster into memory
+    poster_url = content_poster_url(movie)
+    poster = [media.fetch_media(poster_url, "poster.jpg")] if poster_url else []
+
+    # Post the first part of the tweet with the image and the rest as replies
+    if staging.submit(content_post(movie, genres_mapping, get_movie_details(movie["id"]),
+                                   poster)):
+        print(f"✅ Posted: {title}")
+
+
+# Compose the movie or series tweet from its TMDB list entry and details
+def content_post(movie, genres_mapping, movie_details, poster):
+    title = content_title(movie)
+
     # Gather movie or series details
     rating = movie.get("vote_average", "N/A")
     genre_ids = movie.get("genre_ids", [])
@@ -218,70 +244,45 @@ def post_movie(movie, genres_mapping):
     release_date = movie.get("release_date") or movie.get(
         "first_air_date", "Unknown Date")
     plot = movie.get("overview", "No plot available.")
-    poster_path = movie.get("poster_path")
-
-    # Download the movie or series poster
-    poster_url = f"https://image.tmdb.org/t/p/original{poster_path}"
-    poster_image = requests.get(poster_url).content
-    with open("poster.jpg", "wb") as file:
-        file.write(poster_image)
-
-    # Upload the poster to Twitter
-    media = api.media_upload(filename="poster.jpg")
 
     # Add icons and emojis for styling
     stars = "⭐️" * int(round(rating / 2))  # 5-star scale representation
-    tweet_text = f"🎬 Title: {title}\n{stars} Rating: {rating}/10\n🎭 Genres: {genres}\n📅 Release Date:{release_date}\n📝 Plot: {plot[:200]}"
-    tweet_parts = [tweet_text]
-
-    # Split text if it exceeds Twitter's character limit
-    if len(tweet_text) > 280:
-        tweet_parts = [
-            tweet_text[i:i + 280] for i in range(0, len(tweet_text), 280)
-        ]
-
-    # Post the first part of the tweet with the image
-    try:
-        response = client.create_tweet(text=tweet_parts[0],
-                                       media_ids=[media.media_id])
-        tweet_id = response.data["id"]
-
-        # Post remaining parts as replies
-        for part in tweet_parts[1:]:
-            response = client.create_tweet(text=part,
-                                           in_reply_to_tweet_id=tweet_id)
-            tweet_id = response.data["id"]
-
-        # Post trailer if available
-        movie_details = get_movie_details(movie["id"])
-        videos = movie_details.get("videos", {}).get("results", [])
-        trailer = next((v for v in videos
-                        if v["type"] == "Trailer" and v["site"] == "YouTube"),
-                       None)
-        if trailer:
-            trailer_url = f"https://www.youtube.com/watch?v={trailer['key']}"
-            client.create_tweet(text=f"🎥 Watch the trailer: {trailer_url}",
-                                in_reply_to_tweet_id=tweet_id)
-
-        # Save the movie or series title to prevent reposting
-        save_posted_movie(title)
-        print(f"✅ Posted: {title}")
-
-    except TooManyRequests:
-        print("🚫 Rate limit exceeded. Retrying after some time...")
-        time.sleep(60)  # Wait for 1 minute before retrying
+    fields = [f"🎬 Title: {title}",
+              f"{stars} Rating: {rating}/10",
+              f"🎭 Genres: {genres}",
+              f"📅 Release Date:{release_date}",
+              f"📝 Plot: {composer.truncate(plot, 200)}"]
+
+    # Add the trailer if available
+    videos = movie_details.get("videos", {}).get("results", [])
+    trailer = next((v for v in videos
+                    if v["type"] == "Trailer" and v["site"] == "YouTube"),
+                   None)
+    if trailer:
+        trailer_url = f"https://www.youtube.com/watch?v={trailer['key']}"
+        fields.append(f"🎥 Watch the trailer: {trailer_url}")
+
+    # Split into as few tweets as Twitter's weighted character limit allows
+    tweet_parts = composer.split(fields)
+    return staging.PreparedPost(text=tweet_parts[0],
+                                media=poster,
+                                replies=tweet_parts[1:],
+                                on_posted=lambda: save_posted_movie(title))
 
 
 # Function to post content
 def post_content():
     genres_mapping = fetch_genres()
-    content_fetchers = [get_trending_movies, get_trending_series]
-    selected_fetcher = random.choice(content_fetchers)
-    content = selected_fetcher()
-    if content:
-        post_movie(
-            random.choice(content),
-            genres_mapping)  # Post one random item from the fetched content
+    # Movies or series at random, the other kind if every title of one is posted
+    kinds = random.sample(list(CONTENT_SOURCES), len(CONTENT_SOURCES))
+    for kind in kinds:
+        content = unposted_content(kind)
+        if content:
+            post_movie(
+                random.choice(content),
+                genres_mapping)  # Post one random unposted item
+            return
+    print("🚫 Every trending and top-rated title has been posted")
 
 
 # Wordnik API integration
@@ -291,112 +292,156 @@ WORDNIK_API_BASE_URL = 'https://api.wordnik.com/v4'
 
 def fetch_random_word():
     """Fetch a random word and its details from Wordnik."""
+    # The random word and its definition are the least a post needs
+    reservation = quota.reserve("wordnik", 2)
+    if reservation is None:
+        print("Wordnik quota used up, skipping the word of the day.")
+        return
     try:
-        # Fetch a random word
-        word_url = f"{WORDNIK_API_BASE_URL}/words.json/randomWord"
-        params = {
-            'api_key': WORDNIK_API_KEY,
-            'hasDictionaryDef': 'true',
-            'minLength': 5,
-            'maxLength': 20
-        }
-        response = requests.get(word_url, params=params)
-        response.raise_for_status()
-        word_data = response.json()
-        word = word_data.get('word')
-
-        # Fetch word details (definition, pronunciation, synonyms, antonyms, and example usage)
-        fetch_word_details(word)
+        with reservation:
+            # Fetch a random word
+            word_url = f"{WORDNIK_API_BASE_URL}/words.json/randomWord"
+            params = {
+                'api_key': WORDNIK_API_KEY,
+                'hasDictionaryDef': 'true',
+                'minLength': 5,
+                'maxLength': 20
+            }
+            response = http_session.get(word_url, params=params)
+            response.raise_for_status()
+            word_data = response.json()
+            word = word_data.get('word')
+
+            # Fetch word details (definition, pronunciation, synonyms, antonyms, and example usage)
+            fetch_word_details(word)
 
     except requests.RequestException as e:
         print(f"Failed to fetch random word: {e}")
 
 
+# Overall time budget for the four per-word Wordnik lookups, in seconds
+WORDNIK_DETAILS_DEADLINE = 15
+
+
+def fetch_word_definition(word):
+    """Fetch the first definition and part of speech of a word."""
+    try:
+        definition_url = f"{WORDNIK_API_BASE_URL}/word.json/{word}/definitions"
+        definitions_response = http_session.get(
+            definition_url, params={'api_key': WORDNIK_API_KEY})
+        definitions_response.raise_for_status()
+        definitions = definitions_response.json()
+        if definitions:
+            return {
+                'definition': definitions[0].get('text', 'Not Found'),
+                'part_of_speech': definitions[0].get('partOfSpeech',
+                                                     'Not Found')
+            }
+    except (requests.RequestException, ValueError):
+        print(f"Failed to fetch definition for the word '{word}'.")
+    return {}
+
+
+def fetch_word_pronunciation(word):
+    """Fetch the first pronunciation of a word."""
+    try:
+        pronunciation_url = f"{WORDNIK_API_BASE_URL}/word.json/{word}/pronunciations"
+        pronunciation_response = http_session.get(
+            pronunciation_url, params={'api_key': WORDNIK_API_KEY})
+        pronunciation_response.raise_for_status()
+        pronunciation = pronunciation_response.json()
+        if pronunciation:
+            return {'pronunciation': pronunciation[0].get('raw', 'Not Found')}
+    except (requests.RequestException, ValueError):
+        print(f"Failed to fetch pronunciation for the word '{word}'.")
+    return {}
+
+
+def fetch_word_related(word):
+    """Fetch synonyms and antonyms of a word."""
+    related = {}
+    try:
+        synonyms_url = f"{WORDNIK_API_BASE_URL}/word.json/{word}/relatedWords"
+        related_words_response = http_session.get(
+            synonyms_url, params={'api_key': WORDNIK_API_KEY})
+        related_words_response.raise_for_status()
+        for entry in related_words_response.json():
+            if entry.get('relationshipType') == 'synonym':
+                related['synonyms'] = ', '.join(entry.get('words', []))
+            elif entry.get('relationshipType') == 'antonym':
+                related['antonyms'] = ', '.join(entry.get('words', []))
+    except (requests.RequestException, ValueError):
+        print(f"Failed to fetch synonyms and antonyms for the word '{word}'.")
+    return related
+
+
+def fetch_word_example(word):
+    """Fetch the first example usage of a word."""
+    try:
+        examples_url = f"{WORDNIK_API_BASE_URL}/word.json/{word}/examples"
+        examples_response = http_session.get(
+            examples_url, params={'api_key': WORDNIK_API_KEY})
+        examples_response.raise_for_status()
+        examples = examples_response.json().get('examples', [])
+        if examples:
+            return {'example': examples[0].get('text', 'Not Found')}
+    except (requests.RequestException, ValueError):
+        print(f"Failed to fetch example usage for the word '{word}'.")
+    return {}
+
+
 def fetch_word_details(word):
     """Fetch details of a specific word from Wordnik and post them on Twitter."""
-    try:
-        # Initialize default values
-        definition = part_of_speech = pronunciation_text = synonyms = antonyms = example_usage = 'Not Found'
+    import tweepy
 
-        # Fetch definition and part of speech
-        try:
-            definition_url = f"{WORDNIK_API_BASE_URL}/word.json/{word}/definitions"
-            definitions_response = requests.get(
-                definition_url, params={'api_key': WORDNIK_API_KEY})
-            definitions_response.raise_for_status()
-            definitions = definitions_response.json()
-            if definitions:
-                definition = definitions[0].get('text', 'Not Found')
-                part_of_speech = definitions[0].get('partOfSpeech',
-                                                    'Not Found')
-        except requests.RequestException:
-            print(f"Failed to fetch definition for the word '{word}'.")
-
-        # Fetch pronunciation
-        try:
-            pronunciation_url = f"{WORDNIK_API_BASE_URL}/word.json/{word}/pronunciations"
-            pronunciation_response = requests.get(
-                pronunciation_url, params={'api_key': WORDNIK_API_KEY})
-            pronunciation_response.raise_for_status()
-            pronunciation = pronunciation_response.json()
-            if pronunciation:
-                pronunciation_text = pronunciation[0].get('raw', 'Not Found')
-        except requests.RequestException:
-            print(f"Failed to fetch pronunciation for the word '{word}'.")
-
-        # Fetch synonyms and antonyms
-        try:
-            synonyms_url = f"{WORDNIK_API_BASE_URL}/word.json/{word}/relatedWords"
-            related_words_response = requests.get(
-                synonyms_url, params={'api_key': WORDNIK_API_KEY})
-            related_words_response.raise_for_status()
-            related_words = related_words_response.json()
-            for related in related_words:
-                if related.get('relationshipType') == 'synonym':
-                    synonyms = ', '.join(related.get('words', []))
-                elif related.get('relationshipType') == 'antonym':
-                    antonyms = ', '.join(related.get('words', []))
-        except requests.RequestException:
-            print(
-                f"Failed to fetch synonyms and antonyms for the word '{word}'."
-            )
-
-        # Fetch example usage
+    try:
+        lookups = {'definitions': lambda: fetch_word_definition(word)}
+        # The other three lookups are extras, dropped when the Wordnik budget runs low
+        extras = quota.reserve("wordnik", 3, optional=True)
+        if extras:
+            lookups.update({
+                'pronunciations': lambda: fetch_word_pronunciation(word),
+                'relatedWords': lambda: fetch_word_related(word),
+                'examples': lambda: fetch_word_example(word),
+            })
+        # Run the Wordnik lookups in parallel; each falls back to 'Not Found'
         try:
-            examples_url = f"{WORDNIK_API_BASE_URL}/word.json/{word}/examples"
-            examples_response = requests.get(
-                examples_url, params={'api_key': WORDNIK_API_KEY})
-            examples_response.raise_for_status()
-            examples = examples_response.json().get('examples', [])
-            if examples:
-                example_usage = examples[0].get('text', 'Not Found')
-        except requests.RequestException:
-            print(f"Failed to fetch example usage for the word '{word}'.")
+            results, timings = http_session.fan_out(
+                lookups, deadline=WORDNIK_DETAILS_DEADLINE)
+        finally:
+            if extras:
+                extras.release()
+        print("Wordnik timings: " + ", ".join(
+            f"{name} {seconds:.2f}s" for name, seconds in timings.items()))
+
+        details = {}
+        for result in results.values():
+            details.update(result or {})
 
         # Prepare the tweet content
         tweet_content = (f"Word: {word.capitalize()}\n"
-                         f"Definition: {definition}\n"
-                         f"Part of Speech: {part_of_speech}\n"
-                         f"Pronunciation: {pronunciation_text}\n"
-                         f"Synonyms: {synonyms}\n"
-                         f"Antonyms: {antonyms}\n"
-                         f"Example: {example_usage}\n")
+                         f"Definition: {details.get('definition', 'Not Found')}\n"
+                         f"Part of Speech: {details.get('part_of_speech', 'Not Found')}\n"
+                         f"Pronunciation: {details.get('pronunciation', 'Not Found')}\n"
+                         f"Synonyms: {details.get('synonyms', 'Not Found')}\n"
+                         f"Antonyms: {details.get('antonyms', 'Not Found')}\n"
+                         f"Example: {details.get('example', 'Not Found')}\n")
 
         # Post the tweet
         try:
-            client.create_tweet(text=tweet_content)
-            print("Tweet posted successfully!")
+            if staging.submit(staging.PreparedPost(text=tweet_content)):
+                print("Tweet posted successfully!")
         except tweepy.TweepyException as e:
             print(f"Failed to post tweet: {e}")
 
     except Exception as e:
         print(f"Failed to fetch word details: {e}")
 # Fetch a random joke from Joke API
+JOKE_URL = 'https://official-joke-api.appspot.com/random_joke'
+
 def fetch_random_joke():
-    api_url = 'https://official-joke-api.appspot.com/random_joke'
-    
     try:
-        response = requests.get(api_url)
+        response = http_session.get(JOKE_URL)
         response.raise_for_status()
         data = response.json()
         return data
@@ -404,59 +449,49 @@ def fetch_random_joke():
         print(f'Error fetching random joke: {e}')
         return None
 
+def joke_tweet(joke_data):
+    setup = joke_data.get('setup', 'No setup available')
+    punchline = joke_data.get('punchline', 'No punchline available')
+    return f"{setup}\n\n{punchline}"
+
 # Post joke to Twitter
 def post_joke_to_twitter():
     joke_data = fetch_random_joke()
     if joke_data:
-        setup = joke_data.get('setup', 'No setup available')
-        punchline = joke_data.get('punchline', 'No punchline available')
-        tweet = f"{setup}\n\n{punchline}"
+        tweet = joke_tweet(joke_data)
         
         try:
-            client.create_tweet(text=tweet)
-            print("Tweet posted successfully")
+            if staging.submit(staging.PreparedPost(text=tweet)):
+                print("Tweet posted successfully")
         except Exception as e:
             print(f"Error posting joke to Twitter: {e}")
     else:
         print("No joke data to post")
 # File to store the IDs of users who have already received the automated message
-#Initialize te the job store
-jobstores = {
-    'default': MemoryJobStore()
-}
-
-# Set up the scheduler with the job store and Nairobi timezone
-scheduler = BlockingScheduler(jobstores=jobstores, timezone='Africa/Nairobi')
-
 # Define the Nairobi timezone
 eat_timezone = pytz.timezone('Africa/Nairobi')
 
-# Schedule jobs with CronTrigger
-#schedule to autoreply messages
-#scheduler.add_job(check_for_new_messages, 'interval', seconds=30)
 
-scheduler.add_job(post_joke_to_twitter, CronTrigger(hour=6, minute=30, timezone=eat_timezone))
-scheduler.add_job(post_joke_to_twitter, CronTrigger(hour=19, minute=0, timezone=eat_timezone))
+def register_jobs(scheduler):
+    # Schedule jobs with CronTrigger
+    #schedule to autoreply messages
+    #scheduler.add_job(check_for_new_messages, 'interval', seconds=30)
 
-# Schedule for posting a random Spotify song
-scheduler.add_job(post_song, CronTrigger(hour=11, minute=1, timezone=eat_timezone))
-scheduler.add_job(post_song, CronTrigger(hour=19, minute=1, timezone=eat_timezone))
-# Schedule for posting a random movie or series with IntervalTrigger
-scheduler.add_job(post_content, IntervalTrigger(minutes=120))
-#scheduler.add_job(fetch_random_word, 'interval', minutes=1)
+    scheduler.add_job(post_joke_to_twitter, CronTrigger(hour=6, minute=30, timezone=eat_timezone), id='post_joke_morning')
+    scheduler.add_job(post_joke_to_twitter, CronTrigger(hour=19, minute=0, timezone=eat_timezone), id='post_joke_evening')
 
-print("🤖 Bot is running and will post according to the schedule ")
-scheduler.start()
-# Flask keep-alive code
-app = Flask('')
+    # Schedule for posting a random Spotify song
+    scheduler.add_job(post_song, CronTrigger(hour=11, minute=1, timezone=eat_timezone), id='post_song_morning')
+    scheduler.add_job(post_song, CronTrigger(hour=19, minute=1, timezone=eat_timezone), id='post_song_evening')
 
-@app.route('/')
-def home():
-    return "<b>Hack The Planet</b>"
+    # Prepare the next song post a few minutes before its slot
+    staging.register('post_song', prepare_song)
+    # Schedule for posting a random movie or series with IntervalTrigger
+    scheduler.add_job(post_content, IntervalTrigger(minutes=120), id='post_content')
+    #scheduler.add_job(fetch_random_word, 'interval', minutes=1)
 
-def run():
-    app.run(host='0.0.0.0', port=8080)
 
-def keep_alive():
-    print("I'm alive!")
-    run()
+if __name__ == "__main__":
+    # Run only this module's jobs; runtime.py runs every module together
+    import runtime
+    runtime.run([sys.modules[__name__]])
@@ -0,0 +1,237 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+import accounts
+import clients
+import leases
+import media
+import metrics
+import rate_limit
+
+# Ahead-of-time staging for scheduled posts. Each staged job registers a
+# prepare function that does all fetching, composing and media download;
+# stage_upcoming() runs it a few minutes before the job's next slot, so at
+# trigger time the job only uploads media and calls create_tweet. Posts are
+# keyed by the job's name (its function name), so several schedules of the
+# same function share one preparer. With several workers only the one a job
+# is sharded to (see leases.py) stages it; a worker taking the slot over
+# prepares the post live.
+#
+# Posts go out through submit(): when the rate-limit governor says an
+# endpoint is out of budget, the post is parked in a retry queue that
+# drain_deferred() works through, resuming a thread where it stopped.
+# A post is prepared once and submitted to every account in accounts.py in
+# parallel; each account keeps its own progress and is deferred on its own.
+
+logger = logging.getLogger(__name__)
+
+# How long before a job's slot its post is prepared
+STAGE_LEAD = timedelta(minutes=10)
+# Staged posts older than this are discarded and the job fetches live
+STAGE_MAX_AGE = timedelta(minutes=30)
+# Deferred posts still waiting after this long are dropped
+DEFER_MAX_AGE = timedelta(hours=6)
+
+
+@dataclass
+class PreparedPost:
+    """A fully composed tweet, ready to upload and post."""
+    text: str
+    # media.Attachment images uploaded and attached to the first tweet
+    media: List["media.Attachment"] = field(default_factory=list)
+    # Texts posted as a reply chain under the first tweet
+    replies: List[str] = field(default_factory=list)
+    # Called once the whole thread is posted to the first account, e.g. to
+    # record it as posted
+    on_posted: Optional[Callable[[], None]] = None
+    prepared_at: float = field(default_factory=time.time)
+    # Progress of publish() per account, so a deferred post resumes instead
+    # of reposting
+    media_ids: Dict[str, List[str]] = field(default_factory=dict)
+    tweet_ids: Dict[str, List[str]] = field(default_factory=dict)
+
+    def age(self):
+        return timedelta(seconds=time.time() - self.prepared_at)
+
+
+_preparers = {}
+_staged = {}
+_deferred = []
+_lock = threading.Lock()
+
+
+def register(job_name, prepare, max_age=STAGE_MAX_AGE):
+    """Register the prepare function used to stage posts for a scheduler job."""
+    _preparers[job_name] = (prepare, max_age)
+
+
+def stage(job_name):
+    """Prepare the next post for a job now and keep it until the job fires."""
+    prepare, _ = _preparers[job_name]
+    started = time.monotonic()
+    post = prepare()
+    if post is None:
+        logger.warning("Nothing staged for %s", job_name)
+        return None
+    with _lock:
+        _staged[job_name] = post
+    logger.info("Staged %s in %.1fs", job_name, time.monotonic() - started)
+    return post
+
+
+def _fresh(job_name):
+    post = _staged.get(job_name)
+    if post is None:
+        return None
+    _, max_age = _preparers[job_name]
+    if post.age() > max_age:
+        logger.info("Discarding stale staged post for %s (%s old)", job_name, post.age())
+        del _staged[job_name]
+        return None
+    return post
+
+
+def take(job_name):
+    """Pop the staged post for a job, or None if nothing fresh is staged."""
+    with _lock:
+        post = _fresh(job_name)
+        _staged.pop(job_name, None)
+        return post
+
+
+def take_or_prepare(job_name):
+    """Return the staged post for a job, falling back to preparing it live."""
+    post = take(job_name)
+    if post is not None:
+        return post
+    logger.info("No staged post for %s, fetching live", job_name)
+    prepare, _ = _preparers[job_name]
+    return prepare()
+
+
+def stage_upcoming(scheduler, lead=STAGE_LEAD):
+    """Stage posts for registered jobs whose next run is within ``lead``."""
+    for job in scheduler.get_jobs():
+        if job.name not in _preparers or job.next_run_time is None:
+            continue
+        if not leases.prefers(leases.base_job_id(job.id)):
+            continue
+        now = datetime.now(job.next_run_time.tzinfo)
+        if job.next_run_time - now > lead:
+            continue
+        with _lock:
+            already_staged = _fresh(job.name) is not None
+        if already_staged:
+            continue
+        try:
+            stage(job.name)
+        except Exception as e:
+            logger.error("Staging %s failed: %s", job.name, e)
+
+
+def publish(post, account=accounts.DEFAULT):
+    """Upload the post's media and post it with its reply chain to an account;
+    return the first tweet id.
+
+    Raises rate_limit.RateLimited when the account's governor has no budget
+    left; calling publish() again later continues from the first unposted tweet.
+    """
+    client = clients.twitter_client(account)
+    api = clients.twitter_api(account)
+    if account not in post.media_ids:
+        post.media_ids[account] = [media.upload(api, attachment, account)
+                                   for attachment in post.media]
+    media_ids = post.media_ids[account]
+    tweet_ids = post.tweet_ids.setdefault(account, [])
+    texts = [post.text] + post.replies
+    while len(tweet_ids) < len(texts):
+        rate_limit.acquire("create_tweet", account)
+        with metrics.TWEET_POST_SECONDS.time():
+            if not tweet_ids:
+                response = client.create_tweet(text=post.text, media_ids=media_ids or None)
+            else:
+                response = client.create_tweet(text=texts[len(tweet_ids)],
+                                               in_reply_to_tweet_id=tweet_ids[-1])
+        tweet_ids.append(response.data["id"])
+    finish(post)
+    return tweet_ids[0]
+
+
+def finish(post):
+    """Run a published post's on_posted callback, once across all accounts."""
+    with _lock:
+        on_posted, post.on_posted = post.on_posted, None
+    if on_posted is not None:
+        on_posted()
+
+
+def defer(post, account, retry_after):
+    """Queue a post for drain_deferred() to publish to an account later."""
+    not_before = time.time() + max(retry_after, 60)
+    with _lock:
+        _deferred.append((not_before, post, account))
+    logger.warning("Rate limited; deferred post to %s for %.0fs: %s", account,
+                   not_before - time.time(), post.text.splitlines()[0])
+
+
+def _submit_one(post, account):
+    # tweepy is loaded with the Twitter clients, not at start-up
+    from tweepy.errors import TooManyRequests
+
+    try:
+        return publish(post, account)
+    except rate_limit.RateLimited as e:
+        retry_after = e.retry_after
+    except TooManyRequests as e:
+        endpoint = rate_limit.endpoint_for(e.response.request.method, e.response.url)
+        retry_after = rate_limit.retry_after(endpoint, account) if endpoint else 60
+    defer(post, account, retry_after)
+    return None
+
+
+def submit(post, account_names=None):
+    """Publish a post to every account now, deferring it for any account
+    whose Twitter budget is used up.
+
+    Returns the first account's tweet id, or None if no account has posted
+    it yet. Re-raises the first error if every account failed outright.
+    """
+    account_names = account_names or accounts.names()
+    if len(account_names) == 1:
+        return _submit_one(post, account_names[0])
+    outcomes = []
+    with ThreadPoolExecutor(max_workers=len(account_names),
+                            thread_name_prefix="account-fan-out") as executor:
+        futures = [executor.submit(_submit_one, post, account) for account in account_names]
+        for account, future in zip(account_names, futures):
+            try:
+                outcomes.append((future.result(), None))
+            except Exception as e:
+                logger.error("Posting to %s failed: %s", account, e)
+                outcomes.append((None, e))
+    for tweet_id, _ in outcomes:
+        if tweet_id is not None:
+            return tweet_id
+    errors = [error for _, error in outcomes if error is not None]
+    if len(errors) == len(outcomes):
+        raise errors[0]
+    return None
+
+
+def drain_deferred():
+    """Retry deferred posts whose wait is over; run every minute by the scheduler."""
+    now = time.time()
+    with _lock:
+        due = [entry for entry in _deferred if entry[0] <= now]
+        _deferred[:] = [entry for entry in _deferred if entry[0] > now]
+    for not_before, post, account in sorted(due, key=lambda entry: entry[0]):
+        if post.age() > DEFER_MAX_AGE:
+            logger.error("Dropping post deferred for too long: %s", post.text.splitlines()[0])
+            continue
+        if _submit_one(post, account) is not None:
+            logger.info("Posted deferred post to %s: %s", account, post.text.splitlines()[0])
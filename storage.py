@@ -0,0 +1,199 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+
+# Local state shared by the bot modules: SQLite helpers and the dedup store
+# that replaced posted_songs.json / posted_movies.json.
+
+logger = logging.getLogger(__name__)
+
+# Directory holding every state file; point it at a persistent volume in production
+STATE_DIR = os.getenv('BOT_STATE_DIR', '.')
+
+# Relative legacy history files live next to the bot's modules, wherever it is started from
+LEGACY_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def state_path(filename):
+    """Return the path of a state file inside STATE_DIR."""
+    return os.path.join(STATE_DIR, filename)
+
+
+def connect(filename):
+    """Open a SQLite database in STATE_DIR in autocommit + WAL mode."""
+    os.makedirs(STATE_DIR, exist_ok=True)
+    connection = sqlite3.connect(state_path(filename),
+                                 timeout=30,
+                                 isolation_level=None,
+                                 check_same_thread=False)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    return connection
+
+
+def load_json(filename, default=None):
+    """Load a JSON state file, or return ``default`` if missing or unreadable."""
+    try:
+        with open(state_path(filename), "r") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return default
+    except ValueError as e:
+        logger.warning("Ignoring unreadable state file %s: %s", filename, e)
+        return default
+
+
+def save_json(filename, data):
+    """Atomically replace a JSON state file so a crash never leaves it half written."""
+    os.makedirs(STATE_DIR, exist_ok=True)
+    path = state_path(filename)
+    # Per-process temp file, so workers sharing STATE_DIR don't write into each other's
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w") as file:
+        json.dump(data, file)
+    os.replace(temp_path, path)
+
+
+def load_bytes(filename):
+    """Read a binary state file, or return None if it does not exist."""
+    try:
+        with open(state_path(filename), "rb") as file:
+            return file.read()
+    except FileNotFoundError:
+        return None
+
+
+def save_bytes(filename, data):
+    """Atomically write a binary state file."""
+    path = state_path(filename)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as file:
+        file.write(data)
+    os.replace(temp_path, path)
+
+
+def normalize_key(value):
+    """Normalize a title so case, width and spacing variants dedup together."""
+    text = unicodedata.normalize("NFKC", str(value))
+    return " ".join(text.casefold().split())
+
+
+class DedupStore:
+    """Set of already-posted keys with O(1) membership, persisted in SQLite.
+
+    The history is loaded into memory once; each add() is a single-row
+    insert, so checks and writes cost the same however long the history
+    gets. Rows other workers add are picked up as soon as SQLite's
+    data_version says the file changed. Legacy JSON history files are
+    imported the first time the store is opened.
+    """
+
+    # Checkpoint the WAL and reclaim free pages after this many writes
+    COMPACT_EVERY = 500
+
+    def __init__(self, filename, legacy_files=()):
+        self.filename = filename
+        self.legacy_files = list(legacy_files)
+        self._keys = None
+        self._connection = None
+        self._data_version = None
+        self._last_rowid = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._keys is not None:
+            self._refresh()
+            return
+        connection = connect(self.filename)
+        connection.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        connection.execute("CREATE TABLE IF NOT EXISTS posted ("
+                           "key TEXT PRIMARY KEY, title TEXT NOT NULL, "
+                           "posted_at REAL NOT NULL)")
+        connection.execute("CREATE TABLE IF NOT EXISTS meta ("
+                           "name TEXT PRIMARY KEY, value TEXT)")
+        for legacy_file in self.legacy_files:
+            self._migrate(connection, legacy_file)
+        self._keys = set()
+        self._connection = connection
+        self._refresh()
+
+    def _refresh(self):
+        # data_version only changes when another connection commits, so this
+        # is one cheap query unless some other worker posted in the meantime
+        data_version, = self._connection.execute("PRAGMA data_version").fetchone()
+        if data_version == self._data_version:
+            return
+        self._data_version = data_version
+        for rowid, key in self._connection.execute(
+                "SELECT rowid, key FROM posted WHERE rowid > ? ORDER BY rowid",
+                (self._last_rowid,)):
+            self._keys.add(key)
+            self._last_rowid = rowid
+
+    def _migrate(self, connection, legacy_file):
+        marker = f"migrated:{os.path.basename(legacy_file)}"
+        if connection.execute("SELECT 1 FROM meta WHERE name = ?", (marker,)).fetchone():
+            return
+        path = os.path.join(LEGACY_DIR, legacy_file)
+        if not os.path.exists(path):
+            # No marker either, so the file is still imported if it shows up later
+            return
+        try:
+            with open(path, "r") as file:
+                titles = json.load(file)
+        except ValueError as e:
+            # Leave the file and the marker alone so a fixed file is imported next time
+            logger.error("Could not import unreadable history %s: %s", path, e)
+            return
+        now = time.time()
+        with connection:
+            connection.execute("BEGIN")
+            connection.executemany(
+                "INSERT OR IGNORE INTO posted (key, title, posted_at) VALUES (?, ?, ?)",
+                [(normalize_key(title), str(title), now) for title in titles
+                 if isinstance(title, str) and title.strip()])
+            connection.execute("INSERT INTO meta (name, value) VALUES (?, ?)",
+                               (marker, str(now)))
+        if titles:
+            logger.info("Imported %d entries from %s", len(titles), path)
+
+    def __contains__(self, title):
+        with self._lock:
+            self._load()
+            return normalize_key(title) in self._keys
+
+    def __len__(self):
+        with self._lock:
+            self._load()
+            return len(self._keys)
+
+    def add(self, title):
+        """Record a title as posted; adding an existing title is a no-op."""
+        key = normalize_key(title)
+        with self._lock:
+            self._load()
+            if key in self._keys:
+                return
+            self._connection.execute(
+                "INSERT OR IGNORE INTO posted (key, title, posted_at) VALUES (?, ?, ?)",
+                (key, str(title), time.time()))
+            self._keys.add(key)
+            self._writes += 1
+            if self._writes % self.COMPACT_EVERY == 0:
+                self._compact()
+
+    def compact(self):
+        """Fold the WAL back into the database file and release free pages."""
+        with self._lock:
+            self._load()
+            self._compact()
+
+    def _compact(self):
+        self._connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        self._connection.execute("PRAGMA incremental_vacuum")
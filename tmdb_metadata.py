@@ -0,0 +1,107 @@
+import logging
+import os
+import threading
+import time
+
+import requests
+
+import http_session
+import storage
+
+# TMDb reference data (movie + TV genre lists, image configuration) cached on
+# disk with a long TTL. Once stale, the cached copy keeps being served while
+# a background thread refreshes it.
+
+logger = logging.getLogger(__name__)
+
+TMDB_API_KEY = os.getenv("TMDB_API_KEY")
+TMDB_BASE_URL = "https://api.themoviedb.org/3"
+METADATA_FILE = "tmdb_metadata.json"
+
+# Genre lists and image configuration change a few times a year at most
+METADATA_TTL = 7 * 24 * 60 * 60
+
+# Used until the configuration endpoint has been fetched once
+DEFAULT_IMAGES = {
+    "secure_base_url": "https://image.tmdb.org/t/p/",
+    "poster_sizes": ["w92", "w154", "w185", "w342", "w500", "w780", "original"],
+}
+
+_metadata = None
+_refreshing = False
+_lock = threading.Lock()
+
+
+def _fetch_json(path):
+    response = http_session.get(f"{TMDB_BASE_URL}{path}", params={"api_key": TMDB_API_KEY})
+    response.raise_for_status()
+    return response.json()
+
+
+def _download_metadata():
+    results, _ = http_session.fan_out({
+        "movie_genres": lambda: _fetch_json("/genre/movie/list"),
+        "tv_genres": lambda: _fetch_json("/genre/tv/list"),
+        "configuration": lambda: _fetch_json("/configuration"),
+    }, deadline=30)
+    if results["movie_genres"] is None and results["tv_genres"] is None:
+        raise requests.RequestException("TMDb genre lists unavailable")
+    configuration = results["configuration"] or {}
+    return {
+        "fetched_at": time.time(),
+        "movie_genres": (results["movie_genres"] or {}).get("genres", []),
+        "tv_genres": (results["tv_genres"] or {}).get("genres", []),
+        "images": configuration.get("images") or DEFAULT_IMAGES,
+    }
+
+
+def _refresh():
+    global _metadata, _refreshing
+    try:
+        metadata = _download_metadata()
+        storage.save_json(METADATA_FILE, metadata)
+        with _lock:
+            _metadata = metadata
+    except requests.RequestException as e:
+        logger.warning("TMDb metadata refresh failed: %s", e)
+    finally:
+        with _lock:
+            _refreshing = False
+
+
+def get_metadata():
+    """Return cached TMDb metadata, refreshing in the background once stale."""
+    global _metadata, _refreshing
+    with _lock:
+        if _metadata is None:
+            _metadata = storage.load_json(METADATA_FILE)
+        metadata = _metadata
+        stale = metadata is None or time.time() - metadata.get("fetched_at", 0) > METADATA_TTL
+        if stale and metadata is not None and not _refreshing:
+            _refreshing = True
+            threading.Thread(target=_refresh, name="tmdb-metadata", daemon=True).start()
+    if metadata is None:
+        # Nothing cached yet: the first caller fetches synchronously
+        with _lock:
+            _refreshing = True
+        _refresh()
+        with _lock:
+            metadata = _metadata
+    return metadata or {"movie_genres": [], "tv_genres": [], "images": DEFAULT_IMAGES}
+
+
+def genre_map():
+    """Return {genre_id: name} covering both movie and TV genres."""
+    metadata = get_metadata()
+    return {genre["id"]: genre["name"]
+            for genre in metadata["movie_genres"] + metadata["tv_genres"]}
+
+
+def image_url(path, size="original"):
+    """Build a TMDb image URL, falling back to the closest available size."""
+    images = get_metadata().get("images") or DEFAULT_IMAGES
+    sizes = images.get("poster_sizes") or DEFAULT_IMAGES["poster_sizes"]
+    if size not in sizes:
+        size = sizes[-1]
+    base_url = images.get("secure_base_url") or DEFAULT_IMAGES["secure_base_url"]
+    return f"{base_url}{size}{path}"
@@ -0,0 +1,151 @@
+import logging
+import os
+import threading
+from collections import deque
+from datetime import date
+
+import clients
+import http_session
+import storage
+
+# Bounded, prefetched pool of ready-to-post word definitions. Candidate
+# words are drawn in batches and validated in parallel by a lookup
+# function; words that resolve are queued (and saved to disk) so the
+# scheduled post reads one in constant time. Every refill and every day
+# has a hard cap on lookup requests, so a bad day for the dictionary API
+# can never spin forever. The file is read again whenever another worker
+# sharing the state directory has replaced it.
+
+logger = logging.getLogger(__name__)
+
+# Ready entries to keep queued
+POOL_TARGET = 5
+# Candidate words validated in parallel per round
+BATCH_SIZE = 6
+# Lookup requests allowed per refill and per day
+MAX_REQUESTS_PER_REFILL = 18
+MAX_REQUESTS_PER_DAY = 60
+# Overall time budget for one batch of lookups, in seconds
+BATCH_DEADLINE = 20
+# Longest a refill can take, so a caller can wait for one already running
+REFILL_WAIT = -(-MAX_REQUESTS_PER_REFILL // BATCH_SIZE) * BATCH_DEADLINE
+
+
+class WordPool:
+    """Queue of looked-up entries, refilled in the background."""
+
+    def __init__(self, lookup, filename):
+        # lookup(word) returns a ready entry, or None if the word doesn't resolve
+        self.lookup = lookup
+        self.filename = filename
+        self._lock = threading.Lock()
+        self._refill_lock = threading.Lock()
+        self._loaded = False
+        self._file_version = None
+        self._ready = deque()
+        self._day = None
+        self._requests_today = 0
+
+    def _stat(self):
+        # save_json() replaces the file, so a new inode means someone saved it
+        try:
+            stat = os.stat(storage.state_path(self.filename))
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    def _load(self):
+        version = self._stat()
+        if self._loaded and version == self._file_version:
+            return
+        saved = storage.load_json(self.filename, {})
+        self._ready = deque(saved.get("ready", []))
+        self._day = saved.get("day")
+        self._requests_today = saved.get("requests", 0)
+        self._loaded = True
+        self._file_version = version
+
+    def _save(self):
+        storage.save_json(self.filename, {"ready": list(self._ready),
+                                          "day": self._day,
+                                          "requests": self._requests_today})
+        self._file_version = self._stat()
+
+    def _reserve(self, wanted):
+        # Take up to ``wanted`` requests from today's budget
+        today = date.today().isoformat()
+        if self._day != today:
+            self._day, self._requests_today = today, 0
+        granted = max(0, min(wanted, MAX_REQUESTS_PER_DAY - self._requests_today))
+        self._requests_today += granted
+        return granted
+
+    def reserve(self, wanted):
+        """Take up to ``wanted`` lookups from today's budget for a caller
+        looking words up itself; returns how many it may make."""
+        with self._lock:
+            self._load()
+            granted = self._reserve(wanted)
+            self._save()
+        return granted
+
+    def put(self, entries):
+        """Queue entries looked up outside refill(), as far as the pool has room."""
+        with self._lock:
+            self._load()
+            self._ready.extend(entries[:POOL_TARGET - len(self._ready)])
+            self._save()
+
+    def __len__(self):
+        with self._lock:
+            self._load()
+            return len(self._ready)
+
+    def refill(self, max_requests=MAX_REQUESTS_PER_REFILL, wait=0):
+        """Validate candidate words in batches until the pool is full or the budget is spent.
+
+        If another refill is already running, return at once, or with ``wait``
+        seconds wait for it to finish and then top up whatever it left missing.
+        """
+        acquired = (self._refill_lock.acquire(timeout=wait) if wait > 0
+                    else self._refill_lock.acquire(blocking=False))
+        if not acquired:
+            return
+        try:
+            spent = 0
+            while True:
+                with self._lock:
+                    self._load()
+                    missing = POOL_TARGET - len(self._ready)
+                    batch = self._reserve(min(BATCH_SIZE, max_requests - spent)) if missing > 0 else 0
+                    self._save()
+                if batch == 0:
+                    break
+                spent += batch
+                words = [clients.random_words().get_random_word() for _ in range(batch)]
+                results, _ = http_session.fan_out(
+                    {word: (lambda word=word: self.lookup(word)) for word in words},
+                    deadline=BATCH_DEADLINE)
+                found = [entry for entry in results.values() if entry]
+                with self._lock:
+                    self._load()
+                    self._ready.extend(found[:POOL_TARGET - len(self._ready)])
+                    self._save()
+                logger.info("Word pool: %d of %d candidates resolved, %d ready",
+                            len(found), batch, len(self._ready))
+        finally:
+            self._refill_lock.release()
+
+    def refill_in_background(self):
+        threading.Thread(target=self.refill, name="word-pool-refill", daemon=True).start()
+
+    def take(self):
+        """Pop a ready entry, or None if the pool is empty; tops the pool up in the background."""
+        with self._lock:
+            self._load()
+            entry = self._ready.popleft() if self._ready else None
+            self._save()
+            running_low = len(self._ready) < POOL_TARGET
+        if running_low:
+            self.refill_in_background()
+        return entry